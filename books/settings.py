@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,11 +43,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "store.middleware.TimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "store.middleware.CachedAuthenticationMiddleware",
+    "store.middleware.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -77,16 +80,134 @@ WSGI_APPLICATION = "books.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": os.environ.get(
+            "BOOKS_DB_ENGINE", "django.db.backends.postgresql_psycopg2"
+        ),
         # "ENGINE": "django.db.backends.postgresql",
-        "NAME": "books_db",
-        "USER": "books_user",
-        "PASSWORD": "admin",
-        "HOST": "localhost",
-        "PORT": "5432",
+        "NAME": os.environ.get("BOOKS_DB_NAME", "books_db"),
+        "USER": os.environ.get("BOOKS_DB_USER", "books_user"),
+        "PASSWORD": os.environ.get("BOOKS_DB_PASSWORD", "admin"),
+        "HOST": os.environ.get("BOOKS_DB_HOST", "localhost"),
+        "PORT": os.environ.get("BOOKS_DB_PORT", "5432"),
+        # Persistent connections, checked before reuse in a new request.
+        "CONN_MAX_AGE": int(os.environ.get("BOOKS_DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": os.environ.get("BOOKS_DB_CONN_HEALTH_CHECKS", "1")
+        in ("1", "true", "yes"),
     }
 }
 
+# Read replicas for book and relation reads, see store.routers. A comma
+# separated list of host[:port], or of database files with SQLite, e.g.
+# BOOKS_DB_ENGINE=django.db.backends.sqlite3 BOOKS_DB_NAME=db.sqlite3
+# BOOKS_DB_REPLICAS=replica1.sqlite3,replica2.sqlite3
+BOOKS_DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    filter(None, os.environ.get("BOOKS_DB_REPLICAS", "").split(",")), start=1
+):
+    if "sqlite" in DATABASES["default"]["ENGINE"]:
+        location = {"NAME": replica}
+    else:
+        host, _, port = replica.partition(":")
+        location = {"HOST": host, "PORT": port or DATABASES["default"]["PORT"]}
+    alias = f"replica_{number}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        **location,
+        "TEST": {"MIRROR": "default"},
+    }
+    BOOKS_DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["store.routers.ReplicaRouter"]
+# Reads stay on the primary this long after the client's own writes (see the
+# store_primary cookie), and replica responses aren't cached this long after
+# any write, which needs a shared BOOKS_CACHE_ALIAS. Keep it above the usual
+# replication lag.
+BOOKS_DATABASE_STICKY_SECONDS = 5
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Cache used for book list/detail responses and its entry lifetime in seconds
+# (0 turns the response cache off). Writes invalidate entries by bumping a
+# version kept in the same cache, so production needs a cache shared by all
+# processes: with LocMemCache other workers serve stale responses until the
+# entries expire.
+BOOKS_CACHE_ALIAS = "default"
+BOOKS_CACHE_TIMEOUT = 300
+
+# Serve book list/detail from .values() rows, skipping model instances.
+BOOKS_VALUES_READ_PATH = True
+
+# Backend answering ?search= on books, see store.search.
+BOOKS_SEARCH_BACKEND = "store.search.TokenIndexSearchBackend"
+
+# Acknowledge like/bookmark PATCHes at once and write them in batches of
+# up to MAX_ITEMS relations or FLUSH_INTERVAL seconds later (None: on size
+# only), see store.buffer.
+BOOKS_RELATION_BUFFER_ENABLED = False
+BOOKS_RELATION_BUFFER_MAX_ITEMS = 500
+BOOKS_RELATION_BUFFER_FLUSH_INTERVAL = 1.0
+
+# Live counter changes at /book/events/?ids=1,2 (ASGI only), see
+# store.events. Deltas are merged for FLUSH_INTERVAL seconds before the new
+# counters are read and sent; subscribers lagging QUEUE_SIZE events behind
+# are disconnected. The in-process backend only sees this process' writes.
+BOOKS_EVENTS_BACKEND = "store.events.InProcessEventBackend"
+BOOKS_EVENTS_FLUSH_INTERVAL = 0.5
+BOOKS_EVENTS_QUEUE_SIZE = 100
+BOOKS_EVENTS_MAX_BOOKS = 100
+BOOKS_EVENTS_HEARTBEAT = 15
+
+# Book change log behind /book/changes/, see store.changes. Changes are
+# served once SETTLE_SECONDS old (keep it above the longest write
+# transaction); compact_book_changes keeps at most MAX_ROWS of them.
+BOOKS_CHANGES_SETTLE_SECONDS = 5
+BOOKS_CHANGES_MAX_ROWS = 100000
+BOOKS_CHANGES_MAX_PAGE_SIZE = 1000
+
+# Valid rows inserted per bulk_create (and transaction) by book imports.
+BOOKS_IMPORT_BATCH_SIZE = 1000
+
+# Server-Timing headers and per-route stats at /timings/ (staff only).
+BOOKS_TIMING_ENABLED = False
+BOOKS_TIMING_WINDOW = 1000
+
+# /book/top/rated/ ranks by a Bayesian average: every book starts with
+# PRIOR_WEIGHT votes of PRIOR_MEAN, so a handful of votes can't top it.
+# Stored per book, run rebuild_book_counters after changing them.
+BOOKS_LEADERBOARD_PRIOR_MEAN = 3
+BOOKS_LEADERBOARD_PRIOR_WEIGHT = 10
+# Largest ?limit= of a leaderboard.
+BOOKS_LEADERBOARD_MAX_SIZE = 100
+
+# Neighbours stored per book by build_similar_books for /book/<id>/similar/,
+# and the readers two books need in common to count as similar.
+BOOKS_SIMILAR_BOOKS = 20
+BOOKS_SIMILAR_MIN_COMMON_READERS = 2
+
+# The user is resolved once per request. Setting this caches logged-in users
+# between requests for that many seconds as well (saving a user drops its
+# entry, QuerySet.update() doesn't); it needs a BOOKS_CACHE_ALIAS shared by
+# all processes, or the others keep deactivated users. The same goes for
+# SESSION_CACHE_ALIAS with SESSION_ENGINE =
+# "django.contrib.sessions.backends.cached_db", see store.checks.
+BOOKS_AUTH_USER_CACHE_TIMEOUT = 0
+
+# Signed API tokens from /auth/token/, see store.authentication. The key
+# defaults to SECRET_KEY.
+BOOKS_JWT_SIGNING_KEY = None
+BOOKS_JWT_ACCESS_LIFETIME = 5 * 60
+BOOKS_JWT_REFRESH_LIFETIME = 14 * 24 * 60 * 60
+# Seconds the revoked token ids stay cached. Revoked access tokens still work
+# this long in processes that don't share BOOKS_CACHE_ALIAS.
+BOOKS_JWT_REVOKED_CACHE_TIMEOUT = 10
+
 AUTHENTICATION_BACKENDS = (
     "social_core.backends.github.GithubOAuth2",
     "django.contrib.auth.backends.ModelBackend",
@@ -134,7 +255,15 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
-    "DEFAULT_RENDERER_CLASSES": ("rest_framework.renderers.JSONRenderer",),
+    # Sessions cost nothing without a session cookie, so token requests
+    # still authenticate without queries. Unauthenticated requests get 403s.
+    "DEFAULT_AUTHENTICATION_CLASSES": (
+        "rest_framework.authentication.SessionAuthentication",
+        "rest_framework.authentication.BasicAuthentication",
+        "store.authentication.JWTAuthentication",
+    ),
+    # "rest_framework.renderers.JSONRenderer" gives the same output, slower.
+    "DEFAULT_RENDERER_CLASSES": ("store.renderers.ORJSONRenderer",),
     "DEFAULT_PARSER_CLASSES": ("rest_framework.parsers.JSONParser",),
 }
 
@@ -17,7 +17,18 @@ from django.contrib import admin
 from django.urls import path, include, re_path
 from rest_framework.routers import SimpleRouter
 
-from store.views import BookViewSet, auth, UserBookRelationView
+from store.async_views import AsyncBookView
+from store.views import (
+    BookViewSet,
+    auth,
+    UserBookRelationView,
+    TimingStatsView,
+    RelationBufferStatsView,
+    ResponseCacheStatsView,
+    TokenObtainView,
+    TokenRefreshView,
+    TokenRevokeView,
+)
 
 router = SimpleRouter()
 router.register(r"book", BookViewSet)
@@ -27,6 +38,14 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     re_path("", include("social_django.urls", namespace="social")),
     path("auth/", auth),
+    path("auth/token/", TokenObtainView.as_view(), name="token-obtain"),
+    path("auth/token/refresh/", TokenRefreshView.as_view(), name="token-refresh"),
+    path("auth/token/revoke/", TokenRevokeView.as_view(), name="token-revoke"),
+    path("timings/", TimingStatsView.as_view(), name="timings"),
+    path("async/book/", AsyncBookView.as_view(), name="async-book-list"),
+    path("async/book/<int:pk>/", AsyncBookView.as_view(), name="async-book-detail"),
+    path("relation_buffer/", RelationBufferStatsView.as_view(), name="relation-buffer"),
+    path("response_cache/", ResponseCacheStatsView.as_view(), name="response-cache"),
 ]
 
 urlpatterns += router.urls
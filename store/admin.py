@@ -6,7 +6,7 @@ from store.models import Book, UserBookRelation
 
 @admin.register(Book)
 class BookAdmin(ModelAdmin):
-    pass
+    readonly_fields = sorted(Book.counter_fields)
 
 
 @admin.register(UserBookRelation)
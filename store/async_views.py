@@ -0,0 +1,144 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.views import exception_handler
+
+from store.models import Book
+from store.permissions import ahas_object_permission, ahas_permission
+from store.renderers import ORJSONRenderer
+from store.routers import may_be_stale
+from store.timing import timed
+from store.views import BookViewSet
+
+
+class AsyncBookView(View):
+    """
+    Book list/retrieve on the async ORM, for ASGI deployments.
+
+    Filtering, search, ordering, sparse fields, pagination and ETags come
+    from ``BookViewSet``, so responses match ``/book/``. The response cache
+    is not used. Requests the ``.values()`` path can't answer (the user's
+    relation, ``BOOKS_VALUES_READ_PATH`` off) go to ``BookViewSet`` in a
+    thread. Django 4.1 still runs the queries themselves in its shared
+    sync thread; what goes away is a thread per request waiting on them.
+    """
+
+    viewset_class = BookViewSet
+    renderer_class = ORJSONRenderer
+
+    async def get(self, request, pk=None):
+        # As the router passes it, so ETags match BookViewSet's.
+        kwargs = {} if pk is None else {"pk": str(pk)}
+        view = self.get_viewset(request, "list" if pk is None else "retrieve", kwargs)
+        try:
+            # Only the user's relation needs the user, which takes a thread.
+            row_serializer = (
+                None if view.with_user_relation() else view.get_row_serializer()
+            )
+            if row_serializer is None:
+                return await self.fallback(request, view.action, kwargs)
+            await self.check_permissions(view)
+            if pk is None:
+                return await self.list(view, row_serializer)
+            return await self.retrieve(view, row_serializer, pk)
+        except APIException as exc:
+            response = exception_handler(exc, {"view": view, "request": view.request})
+            headers = {
+                header: value
+                for header, value in response.items()
+                if header.lower() != "content-type"
+            }
+            return self.render(response.data, response.status_code, headers)
+
+    def get_viewset(self, request, action, kwargs):
+        view = self.viewset_class(
+            action_map={"get": action}, args=(), kwargs=kwargs, format_kwarg=None
+        )
+        view.request = view.initialize_request(request, **kwargs)
+        return view
+
+    async def fallback(self, request, action, kwargs):
+        def respond():
+            response = self.viewset_class.as_view({"get": action})(request, **kwargs)
+            return response.render()
+
+        return await sync_to_async(respond)()
+
+    async def check_permissions(self, view):
+        for permission in view.get_permissions():
+            if not await ahas_permission(permission, view.request, view):
+                await sync_to_async(view.permission_denied)(view.request)
+
+    async def check_object_permissions(self, view, obj):
+        for permission in view.get_permissions():
+            if not await ahas_object_permission(permission, view.request, view, obj):
+                await sync_to_async(view.permission_denied)(view.request)
+
+    async def list(self, view, row_serializer):
+        queryset = view.filter_queryset(view.get_queryset())
+        headers = {}
+        if view.is_conditional(view.request):
+            rows = [row async for row in view.get_validator_rows()]
+            headers, response = self.check_conditions(view, view.get_validators(rows))
+            if response is not None:
+                return response
+
+        rows = view.get_rows(queryset, row_serializer)
+        page = await view.paginator.apaginate_queryset(rows, view.request, view)
+        with timed("serialize"):
+            data = [row_serializer.to_representation(row) for row in page]
+        return self.render(
+            view.paginator.get_paginated_response(data).data, 200, headers
+        )
+
+    async def retrieve(self, view, row_serializer, pk):
+        queryset = view.filter_queryset(view.get_queryset()).filter(pk=pk)
+        columns = {*row_serializer.columns, "id", "owner_id", view.modified_field}
+        row = await queryset.values(*columns).afirst()
+        if row is None:
+            raise NotFound()
+        await self.check_object_permissions(
+            view, Book(pk=row["id"], owner_id=row["owner_id"])
+        )
+
+        headers = {}
+        if view.is_conditional(view.request):
+            validators = view.get_validators([(row["id"], row[view.modified_field])])
+            headers, response = self.check_conditions(view, validators)
+            if response is not None:
+                return response
+
+        with timed("serialize"):
+            data = row_serializer.to_representation(row)
+        return self.render(data, 200, headers)
+
+    def check_conditions(self, view, validators):
+        """
+        Return the validator headers and the 304/412 response, if any.
+
+        Nothing for reads of a lagging replica, as in
+        ``ConditionalGetMixin.conditional_response``.
+        """
+        if may_be_stale(view.request):
+            return {}, None
+        headers = view.get_validator_headers(view.request, validators)
+        response = view.get_not_modified_response(view.request, headers)
+        if response is not None:
+            response = self.with_headers(response, headers)
+        return headers, response
+
+    def render(self, data, status, headers):
+        renderer = self.renderer_class()
+        with timed("render"):
+            content = renderer.render(data, renderer.media_type)
+        response = HttpResponse(
+            content, content_type=renderer.media_type, status=status
+        )
+        return self.with_headers(response, headers)
+
+    @staticmethod
+    def with_headers(response, headers):
+        for header, value in headers.items():
+            response[header] = value
+        return response
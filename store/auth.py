@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.models import AnonymousUser
+from django.utils.crypto import constant_time_compare
+
+from store.cache import get_cache
+
+
+def user_cache_key(user_id):
+    return f"store:auth:user:{user_id}"
+
+
+def get_cached_user(request):
+    """
+    ``auth.get_user`` with the user row cached between requests for
+    ``BOOKS_AUTH_USER_CACHE_TIMEOUT`` seconds, if set (it is 0 by default).
+
+    The session hash is still checked against the cached user, so password
+    changes log other sessions out as before. Saving or deleting a user
+    drops its entry, see ``store.signals``; changes without signals
+    (``QuerySet.update()``, raw SQL) show once the entry expires, so keep
+    ``BOOKS_AUTH_USER_CACHE_TIMEOUT`` short. The entry has to live in a
+    cache shared by all processes (``check --deploy`` fails otherwise), or
+    the other processes would keep deactivated users. Anything unusual (no
+    cached user, a hash mismatch) goes to ``auth.get_user``.
+    """
+    try:
+        user_id = auth._get_user_session_key(request)
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    timeout = settings.BOOKS_AUTH_USER_CACHE_TIMEOUT
+    if not timeout or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    cache = get_cache()
+    key = user_cache_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            cache.set(key, user, timeout)
+        return user
+
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if session_hash and constant_time_compare(
+        session_hash, user.get_session_auth_hash()
+    ):
+        return user
+    return auth.get_user(request)
+
+
+def forget_user(user_id):
+    get_cache().delete(user_cache_key(user_id))
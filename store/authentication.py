@@ -0,0 +1,144 @@
+"""
+Stateless API authentication with signed tokens.
+
+``POST /auth/token/`` trades a logged-in session (e.g. after the GitHub
+login) for a short-lived access token and a longer-lived refresh token.
+Access tokens carry the user id and staff flag and are checked without any
+database query: the signature, the expiry and the cached revocation list.
+Revoking takes up to ``BOOKS_JWT_REVOKED_CACHE_TIMEOUT`` seconds to reach
+processes with their own cache; refreshes are decided by the database.
+"""
+import uuid
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import jwt
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from store.cache import get_cache
+from store.models import RevokedToken
+
+ALGORITHM = "HS256"
+REVOKED_TOKENS_KEY = "store:auth:revoked"
+
+
+def get_signing_key():
+    return settings.BOOKS_JWT_SIGNING_KEY or settings.SECRET_KEY
+
+
+def make_token(user, token_type, lifetime):
+    now = timezone.now()
+    payload = {
+        "sub": str(user.pk),
+        "staff": user.is_staff,
+        "type": token_type,
+        "jti": uuid.uuid4().hex,
+        "iat": now,
+        "exp": now + lifetime,
+    }
+    return jwt.encode(payload, get_signing_key(), algorithm=ALGORITHM)
+
+
+def issue_tokens(user):
+    access_lifetime = timedelta(seconds=settings.BOOKS_JWT_ACCESS_LIFETIME)
+    return {
+        "access": make_token(user, "access", access_lifetime),
+        "refresh": make_token(
+            user, "refresh", timedelta(seconds=settings.BOOKS_JWT_REFRESH_LIFETIME)
+        ),
+        "token_type": "Bearer",
+        "expires_in": int(access_lifetime.total_seconds()),
+    }
+
+
+def decode_token(token, token_type):
+    """
+    Claims of a valid, unrevoked token of the given type, raises
+    ``AuthenticationFailed`` otherwise.
+    """
+    try:
+        payload = jwt.decode(
+            token,
+            get_signing_key(),
+            algorithms=[ALGORITHM],
+            options={"require": ["sub", "type", "jti", "exp"]},
+        )
+    except jwt.ExpiredSignatureError:
+        raise exceptions.AuthenticationFailed("Token has expired.")
+    except jwt.InvalidTokenError:
+        raise exceptions.AuthenticationFailed("Invalid token.")
+    if payload["type"] != token_type:
+        raise exceptions.AuthenticationFailed(f"Expected a {token_type} token.")
+    if payload["jti"] in get_revoked_tokens():
+        raise exceptions.AuthenticationFailed("Token has been revoked.")
+    return payload
+
+
+def get_revoked_tokens():
+    """
+    Ids of revoked tokens that haven't expired yet. Read from the database
+    when the cached set was dropped by a revocation, or has expired.
+    """
+    cache = get_cache()
+    revoked = cache.get(REVOKED_TOKENS_KEY)
+    if revoked is None:
+        revoked = frozenset(
+            RevokedToken.objects.filter(expires__gt=timezone.now()).values_list(
+                "jti", flat=True
+            )
+        )
+        cache.set(REVOKED_TOKENS_KEY, revoked, settings.BOOKS_JWT_REVOKED_CACHE_TIMEOUT)
+    return revoked
+
+
+def revoke_token(payload):
+    """
+    Revoke the token, returns False when it was revoked already (e.g. by a
+    concurrent refresh; the unique jti decides).
+    """
+    RevokedToken.objects.filter(expires__lte=timezone.now()).delete()
+    _, created = RevokedToken.objects.get_or_create(
+        jti=payload["jti"],
+        defaults={"expires": datetime.fromtimestamp(payload["exp"], dt_timezone.utc)},
+    )
+    # Once more on commit, a read in between may have cached the old list.
+    get_cache().delete(REVOKED_TOKENS_KEY)
+    transaction.on_commit(lambda: get_cache().delete(REVOKED_TOKENS_KEY))
+    return created
+
+
+def token_user(payload):
+    """
+    An unsaved ``User`` with just the id and the staff flag of the token.
+
+    It works for ownership checks, filters and foreign keys, anything else
+    (name, groups, permissions) needs the row loaded.
+    """
+    user = User(id=int(payload["sub"]), is_staff=payload.get("staff", False))
+    user._state.adding = False
+    return user
+
+
+class JWTAuthentication(BaseAuthentication):
+    """
+    ``Authorization: Bearer <access token>``, see ``issue_tokens``.
+    """
+
+    keyword = b"bearer"
+
+    def authenticate(self, request):
+        header = get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword:
+            return None
+        if len(header) != 2:
+            raise exceptions.AuthenticationFailed("Invalid Authorization header.")
+        payload = decode_token(header[1].decode("latin-1"), "access")
+        return token_user(payload), payload
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="api"'
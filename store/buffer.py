@@ -0,0 +1,254 @@
+import atexit
+import logging
+import time
+from threading import Lock, Timer
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import (
+    DataError,
+    IntegrityError,
+    InterfaceError,
+    OperationalError,
+    connections,
+)
+
+from store.logic import upsert_relations
+
+logger = logging.getLogger(__name__)
+
+
+class RelationWriteBuffer:
+    """
+    Write-behind buffer for like/bookmark toggles.
+
+    Changes are merged per (user, book) in memory and written with one
+    ``upsert_relations`` call per user when the buffer holds
+    ``BOOKS_RELATION_BUFFER_MAX_ITEMS`` entries or
+    ``BOOKS_RELATION_BUFFER_FLUSH_INTERVAL`` seconds after the first one.
+    Pending changes live in this process only: the user's own reads see them
+    through ``get_pending``, book counters catch up on flush. Changes failing
+    on a lost connection are retried with the next flush, changes the
+    database rejects are logged and dropped.
+    """
+
+    buffered_fields = frozenset(("like", "in_bookmarks"))
+
+    def __init__(self):
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._timer = None
+        # {user_id: {book_id: [changes, number of merged updates]}}
+        self._pending = {}
+        # Taken by a running flush but maybe not committed yet.
+        self._inflight = {}
+        self._depth = 0
+        self._user_versions = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.received = 0
+            self.written = 0
+            self.written_updates = 0
+            self.flushes = 0
+            self.errors = 0
+            self.dropped = 0
+            self.max_depth = self._depth
+            self.flush_ms_total = 0.0
+            self.flush_ms_max = 0.0
+            self.last_flush_ms = None
+
+    def accepts(self, changes):
+        return (
+            settings.BOOKS_RELATION_BUFFER_ENABLED
+            and bool(changes)
+            and self.buffered_fields.issuperset(changes)
+        )
+
+    def add(self, user_id, book_id, changes):
+        """
+        Buffer ``changes``, returns all pending changes of the relation.
+        """
+        with self._lock:
+            relations = self._pending.setdefault(user_id, {})
+            entry = relations.get(book_id)
+            if entry is None:
+                entry = relations[book_id] = [{}, 0]
+                self._depth += 1
+                self.max_depth = max(self.max_depth, self._depth)
+            entry[0].update(changes)
+            entry[1] += 1
+            self.received += 1
+            self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+            pending = dict(entry[0])
+            full = self._depth >= settings.BOOKS_RELATION_BUFFER_MAX_ITEMS
+            if not full:
+                self._schedule()
+
+        if full:
+            self.flush()
+        return pending
+
+    def get_pending(self, user_id):
+        """
+        Pending changes of the user's relations by book id.
+        """
+        if not self._pending and not self._inflight:
+            return {}
+        with self._lock:
+            pending = {}
+            for relations in (self._inflight, self._pending):
+                for book_id, entry in relations.get(user_id, {}).items():
+                    pending.setdefault(book_id, {}).update(entry[0])
+            return pending
+
+    def get_user_version(self, user_id):
+        """
+        Changes every time the user's pending changes do.
+        """
+        return self._user_versions.get(user_id, 0)
+
+    def take(self, user_id, book_id):
+        """
+        Remove and return pending changes of one relation, so a direct write
+        can apply them first instead of being overwritten by them later.
+        """
+        if not self._pending and not self._inflight:
+            return {}
+        # Let a running flush finish, so it can't overwrite the direct write.
+        with self._flush_lock, self._lock:
+            relations = self._pending.get(user_id, {})
+            entry = relations.pop(book_id, None)
+            if entry is None:
+                return {}
+            if not relations:
+                del self._pending[user_id]
+            self._depth -= 1
+            self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+            return entry[0]
+
+    def flush(self):
+        """
+        Write everything pending, returns the number of relations written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._inflight = pending
+                self._depth = 0
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not pending:
+                return 0
+
+            started = time.perf_counter()
+            written = updates = 0
+            for user_id, relations in pending.items():
+                saved = self.write(user_id, relations)
+                # Relations with books deleted meanwhile are dropped.
+                written += len(saved)
+                updates += sum(relations[book_id][1] for book_id in saved)
+            flush_ms = (time.perf_counter() - started) * 1000
+
+            with self._lock:
+                self._inflight = {}
+                self.flushes += 1
+                self.written += written
+                self.written_updates += updates
+                self.last_flush_ms = flush_ms
+                self.flush_ms_total += flush_ms
+                self.flush_ms_max = max(self.flush_ms_max, flush_ms)
+            return written
+
+    def write(self, user_id, relations):
+        """
+        Write the user's relations, returns the ids of the saved books.
+        """
+        changes_by_book = {
+            book_id: changes for book_id, (changes, _) in relations.items()
+        }
+        try:
+            return list(upsert_relations(User(pk=user_id), changes_by_book))
+        except (OperationalError, InterfaceError):
+            logger.exception("Failed to flush relations of user %s", user_id)
+            self.requeue(user_id, relations)
+            return []
+        except (IntegrityError, DataError):
+            if len(relations) == 1:
+                self.drop(user_id, relations)
+                return []
+        except Exception:
+            # Retrying won't help, and would block the user's later changes.
+            self.drop(user_id, relations)
+            return []
+        # Find the rejected relations, the rest is written alone.
+        saved = []
+        for book_id, entry in relations.items():
+            saved += self.write(user_id, {book_id: entry})
+        return saved
+
+    def drop(self, user_id, relations):
+        logger.exception(
+            "Dropped relations of user %s with books %s: %s",
+            user_id,
+            sorted(relations),
+            {book_id: changes for book_id, (changes, _) in relations.items()},
+        )
+        with self._lock:
+            self.errors += 1
+            self.dropped += len(relations)
+
+    def requeue(self, user_id, relations):
+        with self._lock:
+            self.errors += 1
+            current = self._pending.setdefault(user_id, {})
+            for book_id, (changes, count) in relations.items():
+                entry = current.get(book_id)
+                if entry is None:
+                    current[book_id] = [changes, count]
+                    self._depth += 1
+                else:
+                    # Changes buffered during the failed flush are newer.
+                    entry[0] = {**changes, **entry[0]}
+                    entry[1] += count
+            self._schedule()
+
+    def _schedule(self):
+        interval = settings.BOOKS_RELATION_BUFFER_FLUSH_INTERVAL
+        if self._timer is not None or interval is None:
+            return
+        self._timer = Timer(interval, self._flush_in_thread)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        finally:
+            connections.close_all()
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "depth": self._depth,
+                "max_depth": self.max_depth,
+                "received": self.received,
+                "written": self.written,
+                "coalescing_ratio": (
+                    self.written_updates / self.written if self.written else None
+                ),
+                "flushes": self.flushes,
+                "errors": self.errors,
+                "dropped": self.dropped,
+                "last_flush_ms": self.last_flush_ms,
+                "mean_flush_ms": (
+                    self.flush_ms_total / self.flushes if self.flushes else None
+                ),
+                "max_flush_ms": self.flush_ms_max,
+            }
+
+
+relation_buffer = RelationWriteBuffer()
+atexit.register(relation_buffer.flush)
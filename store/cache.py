@@ -0,0 +1,100 @@
+import time
+from hashlib import md5
+from threading import Lock
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+BOOKS_VERSION_KEY = "store:books:version"
+BOOKS_CHANGED_KEY = "store:books:changed"
+
+
+def get_cache():
+    return caches[settings.BOOKS_CACHE_ALIAS]
+
+
+def is_process_local(cache):
+    """
+    Whether other processes miss what ``cache`` holds (and deletes).
+    """
+    return isinstance(cache, (LocMemCache, DummyCache))
+
+
+def get_books_version():
+    cache = get_cache()
+    version = cache.get(BOOKS_VERSION_KEY)
+    if version is None:
+        # Start from the clock, so an evicted version never revives old entries.
+        cache.add(BOOKS_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(BOOKS_VERSION_KEY)
+    return version
+
+
+def bump_books_version():
+    """
+    Invalidate every cached book response.
+
+    The version is bumped right away and once more on commit, so a response
+    computed from not yet committed data can't outlive the transaction.
+    """
+    _bump_books_version()
+    transaction.on_commit(_bump_books_version)
+
+
+def _bump_books_version():
+    get_cache().set(BOOKS_CHANGED_KEY, time.time(), timeout=None)
+    try:
+        get_cache().incr(BOOKS_VERSION_KEY)
+    except ValueError:
+        get_books_version()
+
+
+def make_response_cache_key(request, view, user_id=None):
+    params = sorted(
+        (key, value.strip())
+        for key, values in request.query_params.lists()
+        for value in values
+        if value.strip()
+    )
+    digest = md5(
+        f"{request.get_host()}?{urlencode(params)}".encode("utf-8"),
+        usedforsecurity=False,
+    ).hexdigest()
+    lookup = view.kwargs.get(view.lookup_url_kwarg or view.lookup_field, "")
+    user = "any" if user_id is None else user_id
+    return f"store:books:{get_books_version()}:{view.action}:{lookup}:{user}:{digest}"
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def as_dict(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else None,
+            }
+
+
+response_cache_stats = CacheStats()
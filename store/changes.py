@@ -0,0 +1,93 @@
+"""
+Change log of books for clients keeping an offline copy, see /book/changes/.
+
+Writes changing a book's fields or counters append a ``BookChange`` in the
+same transaction, deletes append a tombstone. A client asks for the changes
+after the last id it has seen and gets the books as they are now.
+
+Ids are handed out at insert but become visible at commit, so a later id can
+show up first. Changes younger than ``BOOKS_CHANGES_SETTLE_SECONDS`` are held
+back until every transaction that started before them is done.
+``compact_book_changes`` keeps the log bounded; tokens from before the
+rows it had to drop get a resync answer.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from store.models import BookChange, BookChangeCompaction
+
+
+def record_book_changes(book_ids, deleted=False):
+    BookChange.objects.bulk_create(
+        BookChange(book_id=book_id, deleted=deleted) for book_id in book_ids
+    )
+
+
+def settled_changes():
+    cutoff = timezone.now() - timedelta(seconds=settings.BOOKS_CHANGES_SETTLE_SECONDS)
+    return BookChange.objects.filter(created__lte=cutoff)
+
+
+def get_horizon():
+    """
+    The oldest token still served, older ones missed dropped changes.
+    """
+    horizon = (
+        BookChangeCompaction.objects.order_by("-id")
+        .values_list("horizon", flat=True)
+        .first()
+    )
+    return horizon or 0
+
+
+def get_head_token():
+    """
+    The token to continue from after downloading every book.
+    """
+    head = settled_changes().order_by("-id").values_list("id", flat=True).first()
+    return head or get_horizon()
+
+
+def read_changes(since, limit):
+    """
+    ``(token, changed book ids, deleted book ids, more)`` for up to ``limit``
+    changes after ``since``. A book is listed once, as its last change in
+    the page says.
+    """
+    rows = list(
+        settled_changes()
+        .filter(id__gt=since)
+        .order_by("id")
+        .values_list("id", "book_id", "deleted")[: limit + 1]
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+    token = rows[-1][0] if rows else since
+    last = {book_id: deleted for _, book_id, deleted in rows}
+    changed = [book_id for book_id, deleted in last.items() if not deleted]
+    deleted = [book_id for book_id, deleted in last.items() if deleted]
+    return token, changed, deleted, more
+
+
+def compact_book_changes(max_rows):
+    """
+    Drop all but the last change of every book, which no token needs, then
+    the oldest changes beyond ``max_rows``. Returns the compaction record.
+    """
+    with transaction.atomic():
+        newer = BookChange.objects.filter(
+            book_id=OuterRef("book_id"), id__gt=OuterRef("id")
+        )
+        removed, _ = BookChange.objects.filter(Exists(newer)).delete()
+        horizon = get_horizon()
+        excess = BookChange.objects.count() - max_rows
+        if excess > 0:
+            horizon = (BookChange.objects.order_by("id").values_list("id", flat=True))[
+                excess - 1
+            ]
+            removed += BookChange.objects.filter(id__lte=horizon).delete()[0]
+        return BookChangeCompaction.objects.create(horizon=horizon, removed=removed)
@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error, Tags, register
+
+from store.cache import get_cache, is_process_local
+
+CACHED_SESSION_ENGINES = (
+    "django.contrib.sessions.backends.cache",
+    "django.contrib.sessions.backends.cached_db",
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    State other processes have to see can't live in a per-process cache.
+    """
+    if not is_process_local(get_cache()):
+        return []
+    errors = []
+    if settings.BOOKS_CACHE_TIMEOUT:
+        errors.append(
+            Error(
+                "Book writes invalidate cached responses in one process only, "
+                "others serve them for BOOKS_CACHE_TIMEOUT.",
+                hint=(
+                    f"Point BOOKS_CACHE_ALIAS ({settings.BOOKS_CACHE_ALIAS!r}) "
+                    "at a shared cache, or set BOOKS_CACHE_TIMEOUT = 0."
+                ),
+                id="store.E004",
+            )
+        )
+    if settings.BOOKS_AUTH_USER_CACHE_TIMEOUT:
+        errors.append(
+            Error(
+                "Cached users are dropped in one process only, others keep "
+                "deactivated users for BOOKS_AUTH_USER_CACHE_TIMEOUT.",
+                hint=(
+                    f"Point BOOKS_CACHE_ALIAS ({settings.BOOKS_CACHE_ALIAS!r}) "
+                    "at a shared cache, or set BOOKS_AUTH_USER_CACHE_TIMEOUT = 0."
+                ),
+                id="store.E001",
+            )
+        )
+    if settings.BOOKS_DATABASE_REPLICAS:
+        errors.append(
+            Error(
+                "Writes of other processes aren't seen, responses read from "
+                "replicas lagging behind them get cached.",
+                hint=(
+                    f"Point BOOKS_CACHE_ALIAS ({settings.BOOKS_CACHE_ALIAS!r}) "
+                    "at a shared cache."
+                ),
+                id="store.E002",
+            )
+        )
+    return errors
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_session_cache(app_configs, **kwargs):
+    """
+    Sessions ended in one process must end in all of them.
+    """
+    if settings.SESSION_ENGINE not in CACHED_SESSION_ENGINES:
+        return []
+    if not is_process_local(caches[settings.SESSION_CACHE_ALIAS]):
+        return []
+    return [
+        Error(
+            "Cached sessions are dropped in one process only, others keep "
+            "logged out sessions until their entry expires.",
+            hint=(
+                f"Point SESSION_CACHE_ALIAS ({settings.SESSION_CACHE_ALIAS!r}) "
+                "at a shared cache, or set SESSION_ENGINE to "
+                "'django.contrib.sessions.backends.db'."
+            ),
+            id="store.E003",
+        )
+    ]
@@ -0,0 +1,342 @@
+"""
+Live like/rating changes of books as Server-Sent Events.
+
+``GET /book/events/?ids=1,2,3`` (ASGI only, see ``books/asgi.py``) first
+sends the current ``annotated_likes``/``rating`` of the books, then an event
+whenever their counters change. Counter deltas are published on commit to
+the ``BOOKS_EVENTS_BACKEND``, which hands them to the ``BookEventHub`` of
+each serving process. The hub merges the deltas of
+``BOOKS_EVENTS_FLUSH_INTERVAL`` seconds, reads the new counters of the
+changed books with one query and puts the same encoded frame into the queue
+of every subscriber of a book. When that query fails, the deltas wait for
+the next flush.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from functools import lru_cache, partial
+from threading import Lock
+from urllib.parse import parse_qs
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from store.models import Book
+
+logger = logging.getLogger(__name__)
+
+# Counter deltas in events, named after the fields they change.
+EVENT_DELTAS = {"likes_count": "annotated_likes", "rate_count": "rates"}
+# Counters whose change is worth an event: a rate_sum delta alone still
+# changes the rating. Bookmarks aren't in events.
+EVENT_COUNTERS = (*EVENT_DELTAS, "rate_sum")
+
+
+@lru_cache(maxsize=None)
+def load_event_backend(path):
+    return import_string(path)()
+
+
+def get_event_backend():
+    # One instance per process, hubs attach to it.
+    return load_event_backend(settings.BOOKS_EVENTS_BACKEND)
+
+
+def publish_counter_deltas(deltas):
+    """
+    Publish ``{book_id: {counter: delta}}`` once the transaction commits.
+    """
+    if deltas:
+        transaction.on_commit(partial(get_event_backend().publish, deltas))
+
+
+class BaseEventBackend:
+    def publish(self, deltas):
+        raise NotImplementedError
+
+    def attach(self, hub):
+        """
+        Deliver published deltas to ``hub.notify_threadsafe`` from now on.
+        """
+        raise NotImplementedError
+
+    def detach(self, hub):
+        raise NotImplementedError
+
+
+class InProcessEventBackend(BaseEventBackend):
+    """
+    Hubs of this process only: writes served by other processes aren't seen.
+    Publishing without any attached hub costs nothing.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._hubs = ()
+
+    def publish(self, deltas):
+        for hub in self._hubs:
+            hub.notify_threadsafe(deltas)
+
+    def attach(self, hub):
+        with self._lock:
+            self._hubs = (*self._hubs, hub)
+
+    def detach(self, hub):
+        with self._lock:
+            self._hubs = tuple(other for other in self._hubs if other is not hub)
+
+
+class Subscription:
+    def __init__(self, book_ids, queue_size):
+        self.book_ids = frozenset(book_ids)
+        # Encoded frames, None once the hub dropped the subscription.
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+
+class BookEventHub:
+    """
+    Subscriptions of one event loop and the deltas waiting to be sent.
+
+    A subscriber too slow to take ``queue_size`` frames is closed, clients
+    reconnect and start over from the current counters.
+    """
+
+    def __init__(self, loop, flush_interval=0.5, queue_size=100):
+        self.loop = loop
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.subscribers = defaultdict(set)
+        # {book_id: {counter: delta}} since the last flush.
+        self.pending = {}
+        self.flush_handle = None
+        self.event_id = 0
+
+    def subscribe(self, book_ids):
+        subscription = Subscription(book_ids, self.queue_size)
+        for book_id in subscription.book_ids:
+            self.subscribers[book_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for book_id in subscription.book_ids:
+            subscribers = self.subscribers.get(book_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[book_id]
+
+    def notify_threadsafe(self, deltas):
+        self.loop.call_soon_threadsafe(self.notify, deltas)
+
+    def notify(self, deltas):
+        for book_id, delta in deltas.items():
+            # Nobody here listens to most books.
+            if book_id not in self.subscribers:
+                continue
+            if not any(delta.get(counter, 0) for counter in EVENT_COUNTERS):
+                continue
+            pending = self.pending.setdefault(book_id, dict.fromkeys(EVENT_COUNTERS, 0))
+            for counter in EVENT_COUNTERS:
+                pending[counter] += delta.get(counter, 0)
+        if self.pending and self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(
+                self.flush_interval, self.start_flush
+            )
+
+    def start_flush(self):
+        self.loop.create_task(self.flush()).add_done_callback(self.flush_done)
+
+    @staticmethod
+    def flush_done(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Failed to flush book events", exc_info=task.exception())
+
+    async def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        pending, self.pending = self.pending, {}
+        book_ids = [book_id for book_id in pending if book_id in self.subscribers]
+        if not book_ids:
+            return
+        try:
+            rows = await read_counters(book_ids)
+        except Exception:
+            logger.exception("Failed to read counters of books %s", book_ids)
+            # Merged with anything notified meanwhile, flushed again later.
+            self.notify(pending)
+            return
+        for row in rows:
+            frame = self.encode(row, pending[row["id"]])
+            for subscription in tuple(self.subscribers.get(row["id"], ())):
+                self.put(subscription, frame)
+
+    def encode(self, row, delta=None):
+        self.event_id += 1
+        data = counters_data(row)
+        if delta is not None:
+            data["changes"] = {
+                name: delta[counter] for counter, name in EVENT_DELTAS.items()
+            }
+        return b"id: %d\nevent: book\ndata: %s\n\n" % (
+            self.event_id,
+            orjson.dumps(data),
+        )
+
+    def put(self, subscription, frame):
+        try:
+            subscription.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.unsubscribe(subscription)
+            while not subscription.queue.empty():
+                subscription.queue.get_nowait()
+            subscription.queue.put_nowait(None)
+
+
+def book_counters(book_ids):
+    return (
+        Book.objects.filter(pk__in=book_ids)
+        .order_by("pk")
+        .values("id", "likes_count", "rating", "rate_count")
+    )
+
+
+async def read_counters(book_ids):
+    """
+    ``book_counters`` rows. Outside of Django's request cycle, so broken and
+    expired connections are closed here, in the thread the queries run in.
+    """
+    await sync_to_async(close_old_connections)()
+    try:
+        return [row async for row in book_counters(book_ids)]
+    finally:
+        await sync_to_async(close_old_connections)()
+
+
+def counters_data(row):
+    return {
+        "id": row["id"],
+        "annotated_likes": row["likes_count"],
+        "rating": None if row["rating"] is None else str(row["rating"]),
+        "rates": row["rate_count"],
+    }
+
+
+class BookEventsApp:
+    """
+    ASGI app answering ``path`` with an event stream, other requests go to
+    ``application``.
+    """
+
+    path = "/book/events/"
+
+    def __init__(self, application):
+        self.application = application
+        self.hub = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != self.path:
+            return await self.application(scope, receive, send)
+        if scope["method"] not in ("GET", "HEAD"):
+            return await self.respond(send, 405, {"detail": "Method not allowed."})
+        try:
+            book_ids = self.parse_ids(scope)
+        except ValueError as exc:
+            return await self.respond(send, 400, {"ids": str(exc)})
+
+        hub = self.get_hub()
+        # Subscribed before the snapshot, so no change falls in between.
+        subscription = hub.subscribe(book_ids)
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [
+                        (b"content-type", b"text/event-stream"),
+                        (b"cache-control", b"no-cache"),
+                        (b"x-accel-buffering", b"no"),
+                    ],
+                }
+            )
+            if scope["method"] == "HEAD":
+                return await send({"type": "http.response.body"})
+            for row in await read_counters(book_ids):
+                await self.send_frame(send, hub.encode(row))
+            await self.stream(subscription, receive, send)
+        finally:
+            hub.unsubscribe(subscription)
+
+    def get_hub(self):
+        if self.hub is None:
+            self.hub = BookEventHub(
+                asyncio.get_running_loop(),
+                flush_interval=settings.BOOKS_EVENTS_FLUSH_INTERVAL,
+                queue_size=settings.BOOKS_EVENTS_QUEUE_SIZE,
+            )
+            get_event_backend().attach(self.hub)
+        return self.hub
+
+    @staticmethod
+    def parse_ids(scope):
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        values = ",".join(query.get("ids", ())).split(",")
+        try:
+            book_ids = {int(value) for value in values if value.strip()}
+        except ValueError:
+            raise ValueError("Expected comma separated book ids.")
+        if not book_ids:
+            raise ValueError("This field is required.")
+        if len(book_ids) > settings.BOOKS_EVENTS_MAX_BOOKS:
+            raise ValueError(
+                f"Ensure there are no more than {settings.BOOKS_EVENTS_MAX_BOOKS} ids."
+            )
+        return book_ids
+
+    async def stream(self, subscription, receive, send):
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            while True:
+                frame_ready = asyncio.ensure_future(subscription.queue.get())
+                done, _ = await asyncio.wait(
+                    {frame_ready, disconnected},
+                    timeout=settings.BOOKS_EVENTS_HEARTBEAT,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnected in done:
+                    frame_ready.cancel()
+                    return
+                if frame_ready not in done:
+                    frame_ready.cancel()
+                    await self.send_frame(send, b": ping\n\n")
+                    continue
+                frame = frame_ready.result()
+                if frame is None:
+                    return await send({"type": "http.response.body"})
+                await self.send_frame(send, frame)
+        finally:
+            disconnected.cancel()
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    @staticmethod
+    async def send_frame(send, frame):
+        await send({"type": "http.response.body", "body": frame, "more_body": True})
+
+    @staticmethod
+    async def respond(send, status, data):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": orjson.dumps(data)})
@@ -0,0 +1,74 @@
+import csv
+import json
+from itertools import islice
+
+from rest_framework.negotiation import BaseContentNegotiation
+
+from store.renderers import ORJSONRenderer
+
+
+class ExportContentNegotiation(BaseContentNegotiation):
+    """
+    Exports pick their format with ``?type=``, ``Accept: text/csv`` and the
+    like must not end in 406. Errors are still rendered with the first
+    renderer.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class Echo:
+    """
+    File-like object ``csv.writer`` writes to, returning the line instead.
+    """
+
+    def write(self, value):
+        return value
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def ndjson_chunks(rows, row_serializer, batch_size):
+    """
+    One JSON document per row, ``batch_size`` rows per yielded chunk.
+    """
+    renderer = ORJSONRenderer()
+    for batch in batched(rows, batch_size):
+        yield b"".join(
+            renderer.render(row_serializer.to_representation(row)) + b"\n"
+            for row in batch
+        )
+
+
+def csv_chunks(rows, row_serializer, batch_size):
+    """
+    A header line and one line per row, ``batch_size`` rows per chunk.
+    """
+    writer = csv.writer(Echo())
+    names = [name for name, _, _ in row_serializer.converters]
+    yield writer.writerow(names)
+    # Fields built from several columns go into one JSON encoded cell.
+    nested = {
+        index
+        for index, (_, column, _) in enumerate(row_serializer.converters)
+        if isinstance(column, tuple)
+    }
+    for batch in batched(rows, batch_size):
+        yield "".join(
+            writer.writerow(csv_values(row_serializer, row, nested)) for row in batch
+        )
+
+
+def csv_values(row_serializer, row, nested):
+    values = list(row_serializer.to_representation(row).values())
+    for index in nested:
+        values[index] = json.dumps(values[index])
+    return values
@@ -0,0 +1,137 @@
+import codecs
+import csv
+import json
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from store.cache import bump_books_version
+from store.changes import record_book_changes
+from store.models import Book
+from store.search import get_search_backend
+from store.serializers import BooksSerializer
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def read_csv(lines):
+    """
+    Rows of a CSV file with a header line, from an iterable of str lines.
+    """
+    yield from csv.DictReader(lines)
+
+
+def read_ndjson(lines):
+    """
+    Rows of newline delimited JSON, blank lines are skipped.
+    """
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            row = ImportFormatError(f"Line {number}: {exc}")
+        yield row
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def decode_lines(stream, encoding="utf-8"):
+    """
+    Lines of a binary file-like object (or request) decoded on the fly.
+    """
+    return codecs.iterdecode(stream, encoding)
+
+
+class ImportResult:
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row, errors):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "errors": errors})
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+class BookImporter:
+    """
+    Validate rows with ``BooksSerializer`` and insert them in batches.
+
+    Every ``batch_size`` valid rows are inserted with one ``bulk_create`` in
+    a transaction of their own, together with their search index entries.
+    Invalid rows are reported by number (1-based, header excluded) and
+    skipped, the rest of the input still gets imported.
+    """
+
+    serializer_class = BooksSerializer
+
+    def __init__(self, owner=None, batch_size=1000, max_errors=1000):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        # One bound serializer validates every row, fields are built once.
+        self.serializer = self.serializer_class()
+
+    def import_rows(self, rows):
+        result = ImportResult(self.max_errors)
+        batch = []
+        rows = iter(rows)
+        while True:
+            try:
+                row = next(rows)
+            except StopIteration:
+                break
+            except (UnicodeDecodeError, csv.Error) as exc:
+                # The rest of the input can't be read, keep what was read.
+                result.add_error(result.rows + 1, {"non_field_errors": [str(exc)]})
+                break
+            result.rows += 1
+            book = self.validate(result.rows, row, result)
+            if book is None:
+                continue
+            batch.append(book)
+            if len(batch) >= self.batch_size:
+                result.created += self.insert(batch)
+                batch = []
+        if batch:
+            result.created += self.insert(batch)
+        return result
+
+    def validate(self, number, row, result):
+        if isinstance(row, ImportFormatError):
+            result.add_error(number, {"non_field_errors": [str(row)]})
+            return None
+        if not isinstance(row, dict):
+            result.add_error(number, {"non_field_errors": ["Expected an object."]})
+            return None
+        try:
+            data = self.serializer.run_validation(row)
+        except ValidationError as exc:
+            result.add_error(number, exc.detail)
+            return None
+        return Book(owner=self.owner, **data)
+
+    def insert(self, books):
+        with transaction.atomic():
+            Book.objects.bulk_create(books)
+            # bulk_create skips post_save, so index and invalidate here.
+            get_search_backend().index(books)
+            record_book_changes(book.pk for book in books)
+            bump_books_version()
+        return len(books)
@@ -1,3 +1,36 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    FilteredRelation,
+    Q,
+    Value,
+)
+from django.db.models.functions import NullIf, Now
+
+from store.cache import bump_books_version
+from store.changes import record_book_changes
+from store.events import publish_counter_deltas
+from store.models import Book, UserBookRelation
+
+# Number of relations with each rate, rating_histogram in the API.
+RATE_HISTOGRAM_FIELDS = tuple(
+    f"rate_{rate}_count" for rate, _ in UserBookRelation.RATE_CHOICES
+)
+COUNTER_FIELDS = (
+    "likes_count",
+    "bookmarks_count",
+    "rate_sum",
+    "rate_count",
+    *RATE_HISTOGRAM_FIELDS,
+)
+RELATION_FIELDS = ("like", "in_bookmarks", "rate")
+
+
 def operations(a, b, c):
     if c == "+":
         return a + b
@@ -5,3 +38,183 @@ def operations(a, b, c):
         return a - b
     if c == "*":
         return a * b
+
+
+def relation_counter_deltas(old_state, new_state):
+    """
+    Book counter changes caused by a relation going from one state to another.
+
+    States are ``(book_id, like, in_bookmarks, rate)`` tuples, ``None`` stands for a relation
+    that is not counted at all (not created yet or already deleted).
+    """
+    deltas = {}
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None or state[0] is None:
+            continue
+        book_id, like, in_bookmarks, rate = state
+        delta = deltas.setdefault(book_id, dict.fromkeys(COUNTER_FIELDS, 0))
+        delta["likes_count"] += sign * int(bool(like))
+        delta["bookmarks_count"] += sign * int(bool(in_bookmarks))
+        if rate is not None:
+            delta["rate_sum"] += sign * rate
+            delta["rate_count"] += sign
+            delta[f"rate_{rate}_count"] += sign
+    return {book_id: delta for book_id, delta in deltas.items() if any(delta.values())}
+
+
+def counter_update_expressions(delta):
+    """Expressions for ``Book`` UPDATE that apply ``delta`` in place."""
+    rate_sum = F("rate_sum") + delta["rate_sum"]
+    rate_count = F("rate_count") + delta["rate_count"]
+    expressions = {
+        "likes_count": F("likes_count") + delta["likes_count"],
+        "bookmarks_count": F("bookmarks_count") + delta["bookmarks_count"],
+        "rate_sum": rate_sum,
+        "rate_count": rate_count,
+        "rating": rating_expression(rate_sum, rate_count),
+        "weighted_rating": weighted_rating_expression(rate_sum, rate_count),
+        "modified": Now(),
+    }
+    # Only the histogram columns that change, a rate touches one or two.
+    for field in RATE_HISTOGRAM_FIELDS:
+        if delta[field]:
+            expressions[field] = F(field) + delta[field]
+    return expressions
+
+
+def rating_expression(rate_sum, rate_count):
+    # NULLIF turns "no rates" into NULL rating instead of a division by zero.
+    return ExpressionWrapper(
+        rate_sum * Value(1.0) / NullIf(rate_count, Value(0)),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def weighted_rating_expression(rate_sum, rate_count):
+    weight = settings.BOOKS_LEADERBOARD_PRIOR_WEIGHT
+    prior = float(settings.BOOKS_LEADERBOARD_PRIOR_MEAN) * weight
+    return ExpressionWrapper(
+        (Value(prior) + rate_sum) / (Value(weight) + rate_count),
+        output_field=DecimalField(max_digits=5, decimal_places=4),
+    )
+
+
+def apply_counter_deltas(deltas):
+    if not deltas:
+        return
+    publish_counter_deltas(deltas)
+    record_book_changes(deltas)
+    if len(deltas) == 1:
+        [(book_id, delta)] = deltas.items()
+        Book.objects.filter(pk=book_id).update(**counter_update_expressions(delta))
+        return
+
+    # bulk_update turns the per-book expressions into CASE WHEN pk = ... THEN.
+    expressions = {
+        book_id: counter_update_expressions(delta) for book_id, delta in deltas.items()
+    }
+    fields = sorted(set().union(*expressions.values()))
+    books = []
+    for book_id, book_expressions in expressions.items():
+        book = Book(pk=book_id)
+        for field in fields:
+            # Columns changed for other books only stay as they are.
+            setattr(book, field, book_expressions.get(field, F(field)))
+        books.append(book)
+    Book.objects.bulk_update(books, fields)
+
+
+def calculate_rating(rate_sum, rate_count):
+    if not rate_count:
+        return None
+    return (Decimal(rate_sum) / rate_count).quantize(
+        Decimal("0.01"), rounding=ROUND_HALF_UP
+    )
+
+
+def calculate_weighted_rating(rate_sum, rate_count):
+    """
+    Bayesian average: the book's rates plus ``BOOKS_LEADERBOARD_PRIOR_WEIGHT``
+    votes of ``BOOKS_LEADERBOARD_PRIOR_MEAN``.
+    """
+    weight = settings.BOOKS_LEADERBOARD_PRIOR_WEIGHT
+    prior = Decimal(str(settings.BOOKS_LEADERBOARD_PRIOR_MEAN)) * weight
+    return ((prior + rate_sum) / (weight + rate_count)).quantize(
+        Decimal("0.0001"), rounding=ROUND_HALF_UP
+    )
+
+
+def upsert_relation(user, book_id, changes):
+    """
+    Apply ``changes`` to the user's relation with a book, creating it if needed.
+
+    Returns the resulting (unsaved) relation or None if there is no such book.
+    """
+    return upsert_relations(user, {book_id: changes}).get(book_id)
+
+
+def upsert_relations(user, changes_by_book):
+    """
+    Apply changes to the user's relations with several books at once.
+
+    ``changes_by_book`` maps book ids to ``{field: value}`` dicts. The books
+    are locked in id order together with reading the current relations, so
+    concurrent writes of the same book serialize and counter deltas stay
+    exact. Relations are written with one ``INSERT ... ON CONFLICT DO UPDATE``
+    and counters with one ``UPDATE`` whatever the number of books.
+    Returns the resulting (unsaved) relations by book id, unknown books are
+    left out.
+    """
+    with transaction.atomic():
+        rows = (
+            Book.objects.select_for_update(of=("self",))
+            .filter(pk__in=changes_by_book)
+            .annotate(
+                relation=FilteredRelation(
+                    "userbookrelation", condition=Q(userbookrelation__user=user)
+                )
+            )
+            .values(
+                "id",
+                "relation__id",
+                *(f"relation__{field}" for field in RELATION_FIELDS),
+            )
+            .order_by("id")
+        )
+
+        relations = {}
+        written = []
+        deltas = {}
+        for row in rows:
+            relation = UserBookRelation(user=user, book_id=row["id"])
+            old_state = None
+            if row["relation__id"] is not None:
+                for field in RELATION_FIELDS:
+                    setattr(relation, field, row[f"relation__{field}"])
+                old_state = relation.counter_state()
+            changes = changes_by_book[row["id"]]
+            for field, value in changes.items():
+                setattr(relation, field, value)
+            if old_state is None or changes:
+                written.append(relation)
+            deltas.update(relation_counter_deltas(old_state, relation.counter_state()))
+            relations[row["id"]] = relation
+
+        # Rows hold the full locked state, so writing the union is safe.
+        update_fields = sorted(
+            {field for changes in changes_by_book.values() for field in changes}
+        )
+        if written:
+            UserBookRelation.objects.bulk_create(
+                written,
+                update_conflicts=bool(update_fields),
+                ignore_conflicts=not update_fields,
+                unique_fields=["user", "book"],
+                update_fields=update_fields or None,
+            )
+            bump_books_version()
+        apply_counter_deltas(deltas)
+
+    for relation in relations.values():
+        relation._counted_state = relation.counter_state()
+    return relations
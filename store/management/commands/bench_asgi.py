@@ -0,0 +1,176 @@
+import asyncio
+import json
+import multiprocessing
+import time
+from collections import deque
+from statistics import mean
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from store.models import Book
+from store.timing import percentile
+
+MODES = ("wsgi", "asgi")
+
+
+def run_worker(mode, urls, requests, clients):
+    """
+    Serve ``requests`` requests from ``clients`` concurrent clients in one
+    worker, returns ``(started, finished, latencies in ms)``.
+
+    A WSGI worker handles one request at a time, the others wait in line.
+    An ASGI worker interleaves them on its event loop.
+    """
+    if mode == "wsgi":
+        return run_wsgi_worker(urls, requests, clients)
+    return asyncio.run(run_asgi_worker(urls, requests, clients))
+
+
+def check_response(url, response):
+    if response.status_code != 200:
+        raise CommandError(f"{url}: {response.status_code}")
+
+
+def run_wsgi_worker(urls, requests, clients):
+    client = Client()
+    latencies = []
+    started = time.time()
+    # Every client sends its next request as soon as it has an answer.
+    queue = deque([time.perf_counter()] * clients)
+    for index in range(requests):
+        sent = queue.popleft()
+        url = urls[index % len(urls)]
+        check_response(url, client.get(url))
+        answered = time.perf_counter()
+        latencies.append((answered - sent) * 1000)
+        queue.append(answered)
+    return started, time.time(), latencies
+
+
+async def run_asgi_worker(urls, requests, clients):
+    client = AsyncClient()
+    latencies = []
+    indexes = iter(range(requests))
+
+    async def run_client():
+        for index in indexes:
+            url = urls[index % len(urls)]
+            sent = time.perf_counter()
+            response = await client.get(url)
+            latencies.append((time.perf_counter() - sent) * 1000)
+            check_response(url, response)
+
+    started = time.time()
+    await asyncio.gather(*(run_client() for _ in range(clients)))
+    return started, time.time(), latencies
+
+
+def run_forked_worker(args):
+    try:
+        return run_worker(*args)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare book reads under WSGI (/book/) and ASGI (/async/book/) at a "
+        "fixed number of worker processes and growing client concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=500, help="Requests per run."
+        )
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--concurrency",
+            default="1,8,32,128",
+            help="Comma separated numbers of concurrent clients.",
+        )
+        parser.add_argument("--scenario", choices=("list", "detail"), default="list")
+        parser.add_argument(
+            "--inline",
+            action="store_true",
+            help="Run workers one after another in this process instead of "
+            "forking (for databases that can't be shared, e.g. in-memory).",
+        )
+        parser.add_argument("--output", help="Write the report to this file.")
+
+    def handle(self, *args, **options):
+        ids = list(Book.objects.order_by("id").values_list("id", flat=True)[:100])
+        if not ids:
+            raise CommandError("Nothing to call, run seed_store first.")
+        try:
+            levels = [int(level) for level in options["concurrency"].split(",")]
+        except ValueError:
+            raise CommandError("--concurrency expects numbers, e.g. 1,8,32.")
+
+        report = {
+            "workers": options["workers"],
+            "requests": options["requests"],
+            "scenario": options["scenario"],
+            "runs": [],
+        }
+        # The test clients always call the server "testserver".
+        with override_settings(ALLOWED_HOSTS=["testserver"]):
+            for mode in MODES:
+                urls = self.get_urls(mode, options["scenario"], ids)
+                for clients in levels:
+                    run = self.run(mode, urls, clients, options)
+                    report["runs"].append(run)
+                    if options["verbosity"] > 1:
+                        self.stderr.write(json.dumps(run))
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+        self.stdout.write(output)
+
+    def get_urls(self, mode, scenario, ids):
+        prefix = "async-" if mode == "asgi" else ""
+        if scenario == "list":
+            return [reverse(f"{prefix}book-list")]
+        return [reverse(f"{prefix}book-detail", args=(pk,)) for pk in ids]
+
+    def run(self, mode, urls, clients, options):
+        workers = options["workers"]
+        jobs = [
+            (
+                mode,
+                urls,
+                options["requests"] // workers
+                + (index < options["requests"] % workers),
+                max(1, clients // workers + (index < clients % workers)),
+            )
+            for index in range(workers)
+        ]
+        if options["inline"]:
+            results = [run_worker(*job) for job in jobs]
+        else:
+            # Children open their own connections, none may be inherited.
+            connections.close_all()
+            context = multiprocessing.get_context("fork")
+            with context.Pool(workers) as pool:
+                results = pool.map(run_forked_worker, jobs)
+
+        latencies = [latency for _, _, worker in results for latency in worker]
+        # Inline workers run one after another, so their times add up.
+        if options["inline"]:
+            elapsed = sum(finished - started for started, finished, _ in results)
+        else:
+            elapsed = max(r[1] for r in results) - min(r[0] for r in results)
+        return {
+            "mode": mode,
+            "clients": clients,
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(mean(latencies), 3),
+        }
@@ -0,0 +1,76 @@
+import json
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.importer import BookImporter
+from store.serializers import BooksSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure book import throughput (rows/sec) for several batch sizes "
+        "against creating books one by one. Everything is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument(
+            "--batch-sizes",
+            default="100,1000,5000",
+            help="Comma separated bulk_create batch sizes.",
+        )
+        parser.add_argument(
+            "--baseline-rows",
+            type=int,
+            default=1000,
+            help="Rows created one by one for comparison, 0 to skip.",
+        )
+
+    def handle(self, *args, **options):
+        rows = [
+            {
+                "name": f"Imported book {i}",
+                "price": str(Decimal(i % 50000) / 100),
+                "author_name": f"Author {i % 997}",
+            }
+            for i in range(options["rows"])
+        ]
+        report = {"rows": options["rows"], "runs": []}
+        if options["baseline_rows"]:
+            report["runs"].append(
+                self.measure("one_by_one", rows[: options["baseline_rows"]])
+            )
+        for batch_size in options["batch_sizes"].split(","):
+            report["runs"].append(
+                self.measure(f"batch_{int(batch_size)}", rows, int(batch_size))
+            )
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def measure(self, name, rows, batch_size=None):
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                if batch_size is None:
+                    for row in rows:
+                        serializer = BooksSerializer(data=row)
+                        serializer.is_valid(raise_exception=True)
+                        serializer.save()
+                else:
+                    BookImporter(batch_size=batch_size).import_rows(rows)
+                elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        return {
+            "name": name,
+            "rows": len(rows),
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(len(rows) / elapsed, 1),
+        }
@@ -0,0 +1,81 @@
+import json
+import random
+import timeit
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from store.logic import calculate_rating, calculate_weighted_rating
+from store.models import Book
+from store.renderers import ORJSONRenderer
+from store.serializers import BooksSerializer, RowSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure rows/sec of book list serialization: model instances through "
+        "BooksSerializer and JSONRenderer against .values() rows through "
+        "RowSerializer and ORJSONRenderer. Runs in memory, no database needed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, rows=1000, repeat=5, seed=0, **options):
+        generator = random.Random(seed)
+        books = []
+        for pk in range(1, rows + 1):
+            rates = [generator.randint(0, 10) for _ in range(5)]
+            rate_count = sum(rates)
+            rate_sum = sum(rate * count for rate, count in enumerate(rates, 1))
+            books.append(
+                Book(
+                    id=pk,
+                    name=f"Book {pk}",
+                    price=Decimal(generator.randint(100, 99999)) / 100,
+                    author_name=f"Author {generator.randint(1, rows // 10 + 1)}",
+                    likes_count=generator.randint(0, 100),
+                    bookmarks_count=generator.randint(0, 100),
+                    rate_sum=rate_sum,
+                    rate_count=rate_count,
+                    **{
+                        f"rate_{rate}_count": count
+                        for rate, count in enumerate(rates, 1)
+                    },
+                    rating=calculate_rating(rate_sum, rate_count),
+                    weighted_rating=calculate_weighted_rating(rate_sum, rate_count),
+                )
+            )
+        serializer = RowSerializer.for_serializer(BooksSerializer())
+        # What .values(*serializer.columns) returns for these books.
+        values = [
+            {column: getattr(book, column) for column in serializer.columns}
+            for book in books
+        ]
+
+        def model_serializer():
+            # Model instances are part of the cost, the ORM builds them too.
+            books = [Book(**row) for row in values]
+            return JSONRenderer().render(BooksSerializer(books, many=True).data)
+
+        def row_serializer():
+            data = [serializer.to_representation(row) for row in values]
+            return ORJSONRenderer().render(data)
+
+        if model_serializer() != row_serializer():
+            self.stderr.write("Outputs of both paths differ.")
+
+        results = {"rows": rows}
+        for name, function in (
+            ("before", model_serializer),
+            ("after", row_serializer),
+        ):
+            best = min(timeit.repeat(function, number=1, repeat=repeat))
+            results[name] = {"seconds": best, "rows_per_sec": round(rows / best)}
+        results["speedup"] = round(
+            results["after"]["rows_per_sec"] / results["before"]["rows_per_sec"], 2
+        )
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,126 @@
+import json
+import random
+import subprocess
+import time
+from statistics import mean
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from store.cache import bump_books_version
+from store.models import Book
+from store.timing import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Call the store API in-process and report latency percentiles, "
+        "throughput and SQL queries per scenario as JSON. Run against a "
+        "database filled by seed_store."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per scenario."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Invalidate the response cache before every request.",
+        )
+        parser.add_argument("--output", help="Write the report to this file.")
+
+    def handle(self, *args, **options):
+        generator = random.Random(options["seed"])
+        books = list(Book.objects.values("id", "price", "author_name")[:10000])
+        user = User.objects.filter(username__startswith="seed_user_").first()
+        if not books or user is None:
+            raise CommandError("Nothing to call, run seed_store first.")
+
+        anonymous = APIClient(HTTP_HOST="localhost")
+        authenticated = APIClient(HTTP_HOST="localhost")
+        authenticated.force_authenticate(user)
+        words = [book["author_name"].split()[-1] for book in books]
+
+        scenarios = {
+            "list": lambda: anonymous.get(reverse("book-list")),
+            "list_search": lambda: anonymous.get(
+                reverse("book-list"), {"search": generator.choice(words)}
+            ),
+            "list_ordering": lambda: anonymous.get(
+                reverse("book-list"), {"ordering": "-price"}
+            ),
+            "list_price_filter": lambda: anonymous.get(
+                reverse("book-list"), {"price": generator.choice(books)["price"]}
+            ),
+            "detail": lambda: anonymous.get(
+                reverse("book-detail", args=(generator.choice(books)["id"],))
+            ),
+            "relation_patch": lambda: authenticated.patch(
+                reverse(
+                    "userbookrelation-detail", args=(generator.choice(books)["id"],)
+                ),
+                {"like": generator.random() < 0.5, "rate": generator.randint(1, 5)},
+                format="json",
+            ),
+        }
+
+        report = {
+            "commit": self.get_commit(),
+            "created": timezone.now().isoformat(),
+            "books": Book.objects.count(),
+            "requests": options["requests"],
+            "cold": options["cold"],
+            "scenarios": {},
+        }
+        for name, call in scenarios.items():
+            report["scenarios"][name] = self.run(call, options["requests"], options)
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output)
+        self.stdout.write(output)
+
+    def run(self, call, requests, options):
+        latencies = []
+        queries = []
+        statuses = {}
+        started = time.perf_counter()
+        for _ in range(requests):
+            if options["cold"]:
+                bump_books_version()
+            with CaptureQueriesContext(connection) as context:
+                request_started = time.perf_counter()
+                response = call()
+                latencies.append((time.perf_counter() - request_started) * 1000)
+            queries.append(len(context))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        elapsed = time.perf_counter() - started
+        return {
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "mean_ms": round(mean(latencies), 3),
+            "throughput_rps": round(requests / elapsed, 1),
+            "queries_mean": round(mean(queries), 2),
+            "queries_max": max(queries),
+            "statuses": statuses,
+        }
+
+    def get_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
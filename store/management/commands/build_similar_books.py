@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store.models import SimilarityBuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the most similar books of every book from the readers who "
+        "liked or rated both, for /book/<id>/similar/. Incremental after the "
+        "first run, only books touched since the last run are recomputed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Recompute every book.")
+        parser.add_argument("--top", type=int, default=settings.BOOKS_SIMILAR_BOOKS)
+        parser.add_argument(
+            "--min-common",
+            type=int,
+            default=settings.BOOKS_SIMILAR_MIN_COMMON_READERS,
+            help="Readers two books need in common to count as similar.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            from store.recommendations import SimilarityBuilder
+        except ImportError as exc:
+            raise CommandError(f"Similar books need NumPy and SciPy: {exc}")
+
+        since = None
+        if not options["full"]:
+            last = SimilarityBuild.objects.order_by("-started", "-id").first()
+            since = last and last.started
+
+        started = time.perf_counter()
+        build = SimilarityBuilder(
+            top_n=options["top"],
+            min_common=options["min_common"],
+            batch_size=options["batch_size"],
+        ).build(since=since)
+        kind = "incremental" if build.incremental else "full"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt similar books of {build.books} books ({kind}) "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.changes import compact_book_changes
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact the book change log behind /book/changes/: keep the last "
+        "change of every book and at most --max-rows changes. Clients with "
+        "older tokens are told to download the books again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-rows", type=int, default=settings.BOOKS_CHANGES_MAX_ROWS
+        )
+
+    def handle(self, *args, **options):
+        compaction = compact_book_changes(options["max_rows"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Removed {compaction.removed} changes, tokens before "
+                f"{compaction.horizon} need a resync."
+            )
+        )
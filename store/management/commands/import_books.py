@@ -0,0 +1,59 @@
+import json
+import sys
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importer import READERS, BookImporter, decode_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Import books from a CSV (with a header line) or NDJSON file, "
+        "validating every row and inserting them in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, - for stdin.")
+        parser.add_argument(
+            "--type",
+            choices=tuple(READERS),
+            help="Input type, guessed from the file extension by default.",
+        )
+        parser.add_argument("--owner", help="Username of the books' owner.")
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.BOOKS_IMPORT_BATCH_SIZE
+        )
+
+    def handle(self, *args, path, owner=None, batch_size=1000, **options):
+        import_type = options["type"] or path.rsplit(".", 1)[-1].lower()
+        if import_type not in READERS:
+            raise CommandError("Pass --type, it can't be told from the file name.")
+        if owner is not None:
+            try:
+                owner = User.objects.get(username=owner)
+            except User.DoesNotExist:
+                raise CommandError(f"No user {owner}.")
+
+        importer = BookImporter(owner=owner, batch_size=batch_size)
+        if path == "-":
+            result = importer.import_rows(
+                READERS[import_type](decode_lines(sys.stdin.buffer))
+            )
+        else:
+            with open(path, "rb") as file:
+                result = importer.import_rows(READERS[import_type](decode_lines(file)))
+
+        for error in result.errors:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(
+                f"... and {result.error_count - len(result.errors)} more errors."
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {result.created} of {result.rows} rows, "
+                f"{result.error_count} rejected."
+            )
+        )
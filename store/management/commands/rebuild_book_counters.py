@@ -0,0 +1,116 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, Now
+
+from store.cache import bump_books_version
+from store.changes import record_book_changes
+from store.logic import (
+    COUNTER_FIELDS,
+    calculate_rating,
+    calculate_weighted_rating,
+)
+from store.models import Book, UserBookRelation
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate like/bookmark/rating counters, rating histograms and "
+        "weighted ratings of books from their relations. Run it after "
+        "changing the BOOKS_LEADERBOARD_PRIOR_* settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report books with stale counters, do not fix them.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, check=False, batch_size=1000, **options):
+        checked = stale_count = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                books = Book.objects.filter(id__gt=last_id).order_by("id")
+                if not check:
+                    # Relation writes lock their books as well, so none can
+                    # land between reading the relations and writing the
+                    # counters, and the in-place increments of the ones
+                    # waiting apply on top of the repaired values.
+                    books = books.select_for_update()
+                book_ids = list(books.values_list("id", flat=True)[:batch_size])
+                if not book_ids:
+                    break
+                last_id = book_ids[-1]
+                checked += len(book_ids)
+
+                stale = self.get_stale_books(book_ids)
+                stale_count += len(stale)
+                for book in stale:
+                    if check or options["verbosity"] > 1:
+                        self.stdout.write(f"Book {book.pk}: stale counters")
+                if check or not stale:
+                    continue
+
+                Book.objects.bulk_update(
+                    stale, (*COUNTER_FIELDS, "rating", "weighted_rating", "modified")
+                )
+                record_book_changes(book.pk for book in stale)
+                bump_books_version()
+
+        if check:
+            if stale_count:
+                raise CommandError(f"{stale_count} of {checked} books are stale.")
+            self.stdout.write(self.style.SUCCESS(f"All {checked} books are valid."))
+            return
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {stale_count} of {checked} books.")
+        )
+
+    def get_stale_books(self, book_ids):
+        """
+        Books of ``book_ids`` whose counters don't match their relations,
+        with the expected values set.
+        """
+        books = (
+            Book.objects.filter(pk__in=book_ids)
+            .annotate(
+                expected_likes_count=Count(
+                    "userbookrelation", filter=Q(userbookrelation__like=True)
+                ),
+                expected_bookmarks_count=Count(
+                    "userbookrelation", filter=Q(userbookrelation__in_bookmarks=True)
+                ),
+                expected_rate_sum=Coalesce(Sum("userbookrelation__rate"), 0),
+                expected_rate_count=Count("userbookrelation__rate"),
+                **{
+                    f"expected_rate_{rate}_count": Count(
+                        "userbookrelation", filter=Q(userbookrelation__rate=rate)
+                    )
+                    for rate, _ in UserBookRelation.RATE_CHOICES
+                },
+            )
+            .order_by("id")
+        )
+
+        stale = []
+        for book in books:
+            expected = {
+                field: getattr(book, f"expected_{field}") for field in COUNTER_FIELDS
+            }
+            expected["rating"] = calculate_rating(
+                expected["rate_sum"], expected["rate_count"]
+            )
+            expected["weighted_rating"] = calculate_weighted_rating(
+                expected["rate_sum"], expected["rate_count"]
+            )
+            if all(getattr(book, field) == value for field, value in expected.items()):
+                continue
+            for field, value in expected.items():
+                setattr(book, field, value)
+            # Clients revalidating against modified must see the repair.
+            book.modified = Now()
+            stale.append(book)
+        return stale
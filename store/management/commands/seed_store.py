@@ -0,0 +1,145 @@
+import random
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.cache import bump_books_version
+from store.changes import record_book_changes
+from store.models import Book, UserBookRelation
+
+USERNAME_PREFIX = "seed_user_"
+BOOK_NAME_PREFIX = "Seed book "
+
+WORDS = (
+    "Python",
+    "Django",
+    "Databases",
+    "Algorithms",
+    "Networks",
+    "Compilers",
+    "Design",
+    "Patterns",
+    "Testing",
+    "Systems",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a reproducible synthetic catalog: books, users "
+        "and relations whose popularity follows a Zipf-like distribution."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument(
+            "--relations-per-user",
+            type=int,
+            default=20,
+            help="Average number of books every user has a relation with.",
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.0,
+            help="Zipf exponent of book popularity, 0 for a uniform spread.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete previously seeded users and books first.",
+        )
+
+    def handle(self, *args, **options):
+        generator = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+
+        with transaction.atomic():
+            if options["clear"]:
+                Book.objects.filter(name__startswith=BOOK_NAME_PREFIX).delete()
+                User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+            start = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+            User.objects.bulk_create(
+                (
+                    User(username=f"{USERNAME_PREFIX}{start + i}", password="!")
+                    for i in range(options["users"])
+                ),
+                batch_size=batch_size,
+            )
+            users = list(
+                User.objects.filter(username__startswith=USERNAME_PREFIX)
+                .order_by("id")
+                .values_list("id", flat=True)[start:]
+            )
+
+            authors = max(options["books"] // 10, 1)
+            Book.objects.bulk_create(
+                (
+                    Book(
+                        name=f"{BOOK_NAME_PREFIX}{i} {generator.choice(WORDS)}",
+                        price=Decimal(generator.randint(100, 500000)) / 100,
+                        author_name=f"Author {generator.randint(1, authors)}",
+                        owner_id=generator.choice(users) if users else None,
+                    )
+                    for i in range(options["books"])
+                ),
+                batch_size=batch_size,
+            )
+            books = list(
+                Book.objects.filter(name__startswith=BOOK_NAME_PREFIX)
+                .order_by("-id")
+                .values_list("id", flat=True)[: options["books"]]
+            )
+            # bulk_create skips post_save, so log and invalidate here.
+            record_book_changes(sorted(books))
+            bump_books_version()
+            generator.shuffle(books)
+
+            cum_weights = list(
+                accumulate(
+                    1 / rank ** options["skew"] for rank in range(1, len(books) + 1)
+                )
+            )
+            relations = []
+            for user_id in users:
+                count = min(
+                    len(books),
+                    max(0, round(generator.gauss(options["relations_per_user"], 3))),
+                )
+                picked = set(generator.choices(books, cum_weights=cum_weights, k=count))
+                # Popular books repeat, top up the rest uniformly.
+                while len(picked) < count:
+                    picked.add(generator.choice(books))
+                for book_id in sorted(picked):
+                    relations.append(
+                        UserBookRelation(
+                            user_id=user_id,
+                            book_id=book_id,
+                            like=generator.random() < 0.4,
+                            in_bookmarks=generator.random() < 0.2,
+                            rate=(
+                                generator.choices(range(1, 6), (1, 2, 4, 6, 4))[0]
+                                if generator.random() < 0.5
+                                else None
+                            ),
+                        )
+                    )
+            UserBookRelation.objects.bulk_create(relations, batch_size=batch_size)
+
+        # bulk_create skips the counter and search index bookkeeping of save().
+        call_command("rebuild_book_counters", stdout=self.stdout)
+        call_command("rebuild_search_index", stdout=self.stdout)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {len(users)} users, {len(books)} books "
+                f"and {len(relations)} relations."
+            )
+        )
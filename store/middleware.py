@@ -0,0 +1,118 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.functional import SimpleLazyObject
+
+from rest_framework.permissions import SAFE_METHODS
+
+from store.auth import get_cached_user
+from store.routers import current_request, pin_to_primary
+from store.timing import RequestTimings, current_timings, route_stats
+
+
+class TimingMiddleware:
+    """
+    Count SQL queries and time request phases, see ``store.timing``.
+
+    Adds a ``Server-Timing`` header with ``db``, ``view``, ``serialize``,
+    ``render`` and ``total`` entries (``view`` includes ``serialize`` and most
+    of ``db``) and records every request in the per-route stats. Put it first
+    in ``MIDDLEWARE``, it's left out of the chain unless
+    ``BOOKS_TIMING_ENABLED`` is set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.BOOKS_TIMING_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        route_stats.window = settings.BOOKS_TIMING_WINDOW
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        request._timing_view_started = None
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute_wrapper)
+                    )
+                response = self.get_response(request)
+            self.finish_view(request, timings)
+        finally:
+            current_timings.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+
+        response["Server-Timing"] = timings.server_timing(total_ms)
+        match = request.resolver_match
+        if match is not None:
+            route_stats.record(f"{request.method} {match.view_name}", total_ms, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing_view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Being first in MIDDLEWARE this runs last, right before rendering.
+        timings = current_timings.get()
+        self.finish_view(request, timings)
+        render_started = time.perf_counter()
+
+        def finish_render(response):
+            timings.add("render", (time.perf_counter() - render_started) * 1000)
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+    @staticmethod
+    def finish_view(request, timings):
+        if request._timing_view_started is not None:
+            view_ms = (time.perf_counter() - request._timing_view_started) * 1000
+            timings.add("view", view_ms)
+            request._timing_view_started = None
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    ``AuthenticationMiddleware`` resolving ``request.user`` through the user
+    cache, see ``store.auth.get_cached_user``. Still once per request at most
+    and only when something looks at the user.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: self.get_user(request))
+
+    @staticmethod
+    def get_user(request):
+        if not hasattr(request, "_cached_user"):
+            request._cached_user = get_cached_user(request)
+        return request._cached_user
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Expose the request to ``store.routers.ReplicaRouter`` and keep the
+    client's reads on the primary for a while after every successful write.
+    Left out of the chain when there are no replicas.
+    """
+
+    def __init__(self, get_response):
+        if not settings.BOOKS_DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(response)
+        return response
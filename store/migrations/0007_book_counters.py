@@ -0,0 +1,66 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:18
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model("store", "Book")
+    books = Book.objects.annotate(
+        relation_likes=Count("userbookrelation", filter=Q(userbookrelation__like=True)),
+        relation_rate_sum=Sum("userbookrelation__rate"),
+        relation_rate_count=Count("userbookrelation__rate"),
+    )
+    updated = []
+    for book in books.iterator(chunk_size=1000):
+        book.likes_count = book.relation_likes
+        book.rate_sum = book.relation_rate_sum or 0
+        book.rate_count = book.relation_rate_count
+        if book.rate_count:
+            book.rating = (Decimal(book.rate_sum) / book.rate_count).quantize(
+                Decimal("0.01"), rounding=ROUND_HALF_UP
+            )
+        updated.append(book)
+    Book.objects.bulk_update(
+        updated, ["likes_count", "rate_sum", "rate_count", "rating"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0006_alter_userbookrelation_rate"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="likes_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Лайки"),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rate_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Количество оценок"
+            ),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rate_sum",
+            field=models.PositiveIntegerField(default=0, verbose_name="Сумма оценок"),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=None,
+                max_digits=3,
+                null=True,
+                verbose_name="Рейтинг",
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0008_book_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="modified",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, verbose_name="Изменена"
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:22
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Fold duplicate (user, book) relations into the oldest one: a like or a
+    bookmark on any duplicate is kept, the rate is the latest one given.
+    """
+    UserBookRelation = apps.get_model("store", "UserBookRelation")
+    Book = apps.get_model("store", "Book")
+
+    duplicates = (
+        UserBookRelation.objects.values("user_id", "book_id")
+        .annotate(relations=Count("id"))
+        .filter(relations__gt=1)
+    )
+    book_ids = set()
+    for group in duplicates.iterator():
+        relations = list(
+            UserBookRelation.objects.filter(
+                user_id=group["user_id"], book_id=group["book_id"]
+            ).order_by("id")
+        )
+        kept = relations[0]
+        kept.like = any(relation.like for relation in relations)
+        kept.in_bookmarks = any(relation.in_bookmarks for relation in relations)
+        rates = [relation.rate for relation in relations if relation.rate is not None]
+        kept.rate = rates[-1] if rates else None
+        kept.save(update_fields=["like", "in_bookmarks", "rate"])
+        UserBookRelation.objects.filter(
+            pk__in=[relation.pk for relation in relations[1:]]
+        ).delete()
+        book_ids.add(group["book_id"])
+
+    books = Book.objects.filter(pk__in=book_ids).annotate(
+        relation_likes=Count("userbookrelation", filter=Q(userbookrelation__like=True)),
+        relation_rate_sum=Sum("userbookrelation__rate"),
+        relation_rate_count=Count("userbookrelation__rate"),
+    )
+    updated = []
+    for book in books:
+        book.likes_count = book.relation_likes
+        book.rate_sum = book.relation_rate_sum or 0
+        book.rate_count = book.relation_rate_count
+        book.rating = None
+        if book.rate_count:
+            book.rating = (Decimal(book.rate_sum) / book.rate_count).quantize(
+                Decimal("0.01"), rounding=ROUND_HALF_UP
+            )
+        updated.append(book)
+    Book.objects.bulk_update(
+        updated, ["likes_count", "rate_sum", "rate_count", "rating"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0009_book_modified"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0010_merge_duplicate_relations"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="userbookrelation",
+            constraint=models.UniqueConstraint(
+                fields=("user", "book"), name="unique_user_book_relation"
+            ),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:33
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen copy of TokenIndexSearchBackend's tokenizer and weights.
+FIELD_WEIGHTS = {"name": 2, "author_name": 1}
+
+
+def fill_search_tokens(apps, schema_editor):
+    Book = apps.get_model("store", "Book")
+    BookSearchToken = apps.get_model("store", "BookSearchToken")
+    tokens = []
+    for row in Book.objects.values("id", *FIELD_WEIGHTS).iterator(chunk_size=1000):
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in re.findall(r"\w+", row[field].casefold()):
+                weights[token[:64]] = weights.get(token[:64], 0) + weight
+        tokens += [
+            BookSearchToken(book_id=row["id"], token=token, weight=weight)
+            for token, weight in weights.items()
+        ]
+    BookSearchToken.objects.bulk_create(tokens, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0011_unique_user_book_relation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookSearchToken",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("token", models.CharField(max_length=64, verbose_name="Токен")),
+                ("weight", models.PositiveSmallIntegerField(verbose_name="Вес")),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_tokens",
+                        to="store.book",
+                        verbose_name="Книга",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Поисковый токен книги",
+                "verbose_name_plural": "Поисковые токены книг",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="booksearchtoken",
+            index=models.Index(
+                fields=["token"],
+                name="book_search_token_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="booksearchtoken",
+            constraint=models.UniqueConstraint(
+                fields=("book", "token"), name="unique_book_search_token"
+            ),
+        ),
+        migrations.RunPython(fill_search_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:43
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+RATES = range(1, 6)
+
+
+def fill_rate_histogram(apps, schema_editor):
+    Book = apps.get_model("store", "Book")
+    books = Book.objects.annotate(
+        **{
+            f"relation_rate_{rate}": Count(
+                "userbookrelation", filter=Q(userbookrelation__rate=rate)
+            )
+            for rate in RATES
+        }
+    )
+    updated = []
+    for book in books.iterator(chunk_size=1000):
+        for rate in RATES:
+            setattr(book, f"rate_{rate}_count", getattr(book, f"relation_rate_{rate}"))
+        updated.append(book)
+    Book.objects.bulk_update(
+        updated, [f"rate_{rate}_count" for rate in RATES], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0012_book_search_tokens"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="rate_1_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Оценок 1"),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rate_2_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Оценок 2"),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rate_3_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Оценок 3"),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rate_4_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Оценок 4"),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rate_5_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Оценок 5"),
+        ),
+        migrations.RunPython(fill_rate_histogram, migrations.RunPython.noop),
+    ]
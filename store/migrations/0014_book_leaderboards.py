@@ -0,0 +1,74 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:47
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+import store.models
+
+
+def fill_leaderboard_columns(apps, schema_editor):
+    Book = apps.get_model("store", "Book")
+    weight = settings.BOOKS_LEADERBOARD_PRIOR_WEIGHT
+    prior = Decimal(str(settings.BOOKS_LEADERBOARD_PRIOR_MEAN)) * weight
+    books = Book.objects.annotate(
+        relation_bookmarks=Count(
+            "userbookrelation", filter=Q(userbookrelation__in_bookmarks=True)
+        )
+    )
+    updated = []
+    for book in books.iterator(chunk_size=1000):
+        book.bookmarks_count = book.relation_bookmarks
+        book.weighted_rating = (
+            (prior + book.rate_sum) / (weight + book.rate_count)
+        ).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
+        updated.append(book)
+    Book.objects.bulk_update(
+        updated, ["bookmarks_count", "weighted_rating"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0013_book_rate_histogram"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="bookmarks_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="В закладках"),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="weighted_rating",
+            field=models.DecimalField(
+                decimal_places=4,
+                default=store.models.default_weighted_rating,
+                max_digits=5,
+                verbose_name="Взвешенный рейтинг",
+            ),
+        ),
+        migrations.RunPython(fill_leaderboard_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["-likes_count", "id"], name="book_top_liked_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["-weighted_rating", "-rate_count", "id"],
+                name="book_top_rated_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["-bookmarks_count", "id"], name="book_top_bookmarked_idx"
+            ),
+        ),
+    ]
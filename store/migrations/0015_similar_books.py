@@ -0,0 +1,83 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0014_book_leaderboards"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilarityBuild",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("started", models.DateTimeField(verbose_name="Начало")),
+                (
+                    "finished",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Окончание"),
+                ),
+                ("incremental", models.BooleanField(verbose_name="Инкрементальный")),
+                ("books", models.PositiveIntegerField(verbose_name="Пересчитано книг")),
+            ],
+            options={
+                "verbose_name": "Расчёт похожих книг",
+                "verbose_name_plural": "Расчёты похожих книг",
+                "get_latest_by": ("started", "id"),
+            },
+        ),
+        migrations.CreateModel(
+            name="SimilarBook",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField(verbose_name="Место")),
+                ("score", models.FloatField(verbose_name="Сходство")),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_books",
+                        to="store.book",
+                        verbose_name="Книга",
+                    ),
+                ),
+                (
+                    "similar",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_to",
+                        to="store.book",
+                        verbose_name="Похожая книга",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Похожая книга",
+                "verbose_name_plural": "Похожие книги",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="similarbook",
+            constraint=models.UniqueConstraint(
+                fields=("book", "rank"), name="unique_similar_book_rank"
+            ),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0015_similar_books"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RevokedToken",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "jti",
+                    models.CharField(
+                        max_length=64, unique=True, verbose_name="Идентификатор токена"
+                    ),
+                ),
+                (
+                    "expires",
+                    models.DateTimeField(db_index=True, verbose_name="Истекает"),
+                ),
+            ],
+            options={
+                "verbose_name": "Отозванный токен",
+                "verbose_name_plural": "Отозванные токены",
+            },
+        ),
+    ]
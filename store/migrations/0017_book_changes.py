@@ -0,0 +1,86 @@
+# Generated by Django 4.1.7 on 2026-10-18 14:03
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def record_existing_books(apps, schema_editor):
+    # since=0 has to list every book, not only those changed from now on.
+    Book = apps.get_model("store", "Book")
+    BookChange = apps.get_model("store", "BookChange")
+    book_ids = Book.objects.order_by("id").values_list("id", flat=True)
+    BookChange.objects.bulk_create(
+        (BookChange(book_id=book_id) for book_id in book_ids.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("store", "0016_revoked_tokens"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("book_id", models.BigIntegerField(verbose_name="Книга")),
+                ("deleted", models.BooleanField(default=False, verbose_name="Удалена")),
+                (
+                    "created",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Создано"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Изменение книги",
+                "verbose_name_plural": "Изменения книг",
+            },
+        ),
+        migrations.CreateModel(
+            name="BookChangeCompaction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "horizon",
+                    models.BigIntegerField(verbose_name="Удалено до изменения"),
+                ),
+                (
+                    "removed",
+                    models.PositiveIntegerField(verbose_name="Удалено изменений"),
+                ),
+                (
+                    "finished",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Окончание"),
+                ),
+            ],
+            options={
+                "verbose_name": "Сжатие журнала изменений",
+                "verbose_name_plural": "Сжатия журнала изменений",
+                "get_latest_by": "id",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="bookchange",
+            index=models.Index(fields=["book_id", "id"], name="book_change_book_idx"),
+        ),
+        migrations.RunPython(record_existing_books, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,296 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.exceptions import (
+    FieldDoesNotExist,
+    ValidationError as DjangoValidationError,
+)
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.response import Response
+
+from store.cache import get_cache, make_response_cache_key, response_cache_stats
+from store.routers import may_be_stale
+from store.serializers import RowSerializer
+from store.timing import timed
+
+
+class ConditionalGetMixin:
+    """
+    Answer list/retrieve with 304 when the client already has the response.
+
+    Validators come from ``modified`` of the books in the response, which
+    every book or relation write updates: a primary key lookup for a detail,
+    the keys of the page for a list (inserts and deletes change the keys,
+    updates the latest ``modified``). They are read from the database, so
+    every process agrees on them, and a 304 skips serialization and
+    rendering.
+    """
+
+    modified_field = "modified"
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_conditional(request):
+            return super().list(request, *args, **kwargs)
+        validators = self.get_validators(list(self.get_validator_rows()))
+        return self.conditional_response(
+            super().list, validators, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.is_conditional(request):
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            rows = list(self.get_validator_rows())
+        except (TypeError, ValueError, DjangoValidationError):
+            # A malformed lookup, get_object() answers 404 for it.
+            return super().retrieve(request, *args, **kwargs)
+        validators = self.get_validators(rows)
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            super().retrieve, validators, request, *args, **kwargs
+        )
+
+    def get_validator_rows(self):
+        """
+        ``(pk, modified)`` of the books in the response: the book of a
+        detail, the page (with its look-ahead row) of a list.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == "retrieve":
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )[:1]
+        elif self.paginator is not None:
+            queryset = self.paginator.get_page_queryset(queryset, self.request, self)
+        return queryset.values_list("pk", self.modified_field)
+
+    def get_validators(self, rows):
+        """
+        Validators of the ``get_validator_rows()`` rows, None for a missing
+        book.
+        """
+        if not rows and self.action == "retrieve":
+            return None
+        return {
+            "keys": [pk for pk, modified in rows],
+            "last_modified": max((modified for pk, modified in rows), default=None),
+        }
+
+    def is_conditional(self, request):
+        """
+        Whether book timestamps cover everything the response depends on.
+        """
+        return True
+
+    def get_etag(self, request, validators):
+        params = sorted(request.query_params.lists())
+        source = f"{self.action}:{self.kwargs}:{params}:{sorted(validators.items())}"
+        return f'"{md5(source.encode("utf-8"), usedforsecurity=False).hexdigest()}"'
+
+    def get_validator_headers(self, request, validators):
+        headers = {"ETag": self.get_etag(request, validators)}
+        if validators["last_modified"]:
+            headers["Last-Modified"] = http_date(
+                int(validators["last_modified"].timestamp())
+            )
+        return headers
+
+    def get_not_modified_response(self, request, headers):
+        """
+        304/412 response if the request's preconditions say so, else None.
+        """
+        last_modified = headers.get("Last-Modified")
+        return get_conditional_response(
+            request,
+            etag=headers["ETag"],
+            last_modified=parse_http_date(last_modified) if last_modified else None,
+        )
+
+    def conditional_response(self, handler, validators, request, *args, **kwargs):
+        if may_be_stale(request):
+            # A lagging replica's validators would label its old body as
+            # current, and every revalidation would keep it.
+            return handler(request, *args, **kwargs)
+        headers = self.get_validator_headers(request, validators)
+        response = self.get_not_modified_response(request, headers)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+
+class CachedResponseMixin:
+    """
+    Cache list/retrieve responses until any book or relation changes.
+
+    Entries are keyed by the books version, so writes invalidate them by
+    bumping the version instead of deleting keys.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def get_cache_user_id(self, request):
+        """
+        Return the user the response is personal to, None if it is shared.
+        """
+        return None
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        cache = get_cache()
+        key = make_response_cache_key(request, self, self.get_cache_user_id(request))
+        data = cache.get(key)
+        if data is not None:
+            response_cache_stats.hit()
+            return Response(data, headers={"X-Cache": "HIT"})
+
+        response_cache_stats.miss()
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK and not may_be_stale(request):
+            cache.set(key, response.data, settings.BOOKS_CACHE_TIMEOUT)
+        response["X-Cache"] = "MISS"
+        return response
+
+
+class SparseFieldsMixin:
+    """
+    Let clients pick output fields with ``?fields=id,name``.
+
+    Only the model columns behind the picked fields (plus the pk and the
+    ordering field) are selected. The serializer has to accept ``fields``
+    and ``exclude`` arguments, see ``DynamicFieldsModelSerializer``.
+    ``detail_only_fields`` are left out of ``summary_actions`` unless picked
+    explicitly.
+    """
+
+    fields_query_param = "fields"
+    sparse_fields_actions = (
+        "list",
+        "retrieve",
+        "export",
+        "top",
+        "similar",
+        "changes",
+    )
+    summary_actions = ("list", "export", "similar", "changes")
+    detail_only_fields = ()
+
+    def get_requested_field_names(self):
+        """
+        Raw field names from the query, None when all fields are wanted.
+        """
+        if self.action not in self.sparse_fields_actions:
+            return None
+        value = self.request.query_params.get(self.fields_query_param, "")
+        names = [name.strip() for name in value.split(",") if name.strip()]
+        return names or None
+
+    def get_requested_fields(self):
+        names = self.get_requested_field_names()
+        if names is None:
+            return None
+        available = self.get_serializer_class()().fields
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValidationError(
+                {self.fields_query_param: [f"Unknown fields: {', '.join(unknown)}."]}
+            )
+        return {name: available[name] for name in names}
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs["fields"] = list(fields)
+        elif self.action in self.summary_actions:
+            kwargs["exclude"] = self.detail_only_fields
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_requested_fields()
+        if fields is None:
+            return queryset
+
+        columns = {queryset.model._meta.pk.name}
+        for field in fields.values():
+            # Fields computed from several columns, see RowSerializer.
+            columns.update(getattr(field, "row_columns", ()))
+            try:
+                columns.add(queryset.model._meta.get_field(field.source).name)
+            except FieldDoesNotExist:
+                continue
+        ordering = OrderingFilter().get_ordering(self.request, queryset, self)
+        for term in ordering or ():
+            try:
+                columns.add(queryset.model._meta.get_field(term.lstrip("-")).name)
+            except FieldDoesNotExist:
+                # Annotations such as the search rank aren't columns to load.
+                continue
+        return queryset.only(*columns)
+
+
+class ValuesReadMixin:
+    """
+    Serve list/retrieve from ``.values()`` rows instead of model instances.
+
+    ``RowSerializer`` gives the same output as the regular serializer but
+    skips model instances and field objects per row. Requests it can't
+    express (method fields, ``BOOKS_VALUES_READ_PATH`` off) take the regular
+    path.
+    """
+
+    def get_row_serializer(self):
+        if not settings.BOOKS_VALUES_READ_PATH:
+            return None
+        return RowSerializer.for_serializer(self.get_serializer())
+
+    def get_rows(self, queryset, row_serializer, *extra_columns):
+        # The cursor needs the ordering field even when it isn't in output.
+        ordering = OrderingFilter().get_ordering(self.request, queryset, self) or ()
+        columns = {
+            *row_serializer.columns,
+            *extra_columns,
+            queryset.model._meta.pk.attname,
+        }
+        columns.update(term.lstrip("-") for term in ordering)
+        return queryset.values(*columns)
+
+    def list(self, request, *args, **kwargs):
+        row_serializer = self.get_row_serializer()
+        if row_serializer is None:
+            return super().list(request, *args, **kwargs)
+
+        rows = self.get_rows(self.filter_queryset(self.get_queryset()), row_serializer)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            with timed("serialize"):
+                data = [row_serializer.to_representation(row) for row in page]
+            return self.get_paginated_response(data)
+        rows = list(rows)
+        with timed("serialize"):
+            data = [row_serializer.to_representation(row) for row in rows]
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        row_serializer = self.get_row_serializer()
+        if row_serializer is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        # A single instance keeps lookup and object permissions as they are.
+        instance = self.get_object()
+        row = {column: getattr(instance, column) for column in row_serializer.columns}
+        with timed("serialize"):
+            data = row_serializer.to_representation(row)
+        return Response(data)
@@ -1,5 +1,14 @@
-from django.db import models
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+def default_weighted_rating():
+    """Weighted rating of a book nobody has rated yet: the prior mean."""
+    return Decimal(str(settings.BOOKS_LEADERBOARD_PRIOR_MEAN))
 
 
 class Book(models.Model):
@@ -16,21 +25,246 @@ class Book(models.Model):
     readers = models.ManyToManyField(
         User, through="UserBookRelation", related_name="books"
     )
+    likes_count = models.PositiveIntegerField("Лайки", default=0)
+    bookmarks_count = models.PositiveIntegerField("В закладках", default=0)
+    rate_sum = models.PositiveIntegerField("Сумма оценок", default=0)
+    rate_count = models.PositiveIntegerField("Количество оценок", default=0)
+    rate_1_count = models.PositiveIntegerField("Оценок 1", default=0)
+    rate_2_count = models.PositiveIntegerField("Оценок 2", default=0)
+    rate_3_count = models.PositiveIntegerField("Оценок 3", default=0)
+    rate_4_count = models.PositiveIntegerField("Оценок 4", default=0)
+    rate_5_count = models.PositiveIntegerField("Оценок 5", default=0)
+    rating = models.DecimalField(
+        "Рейтинг", max_digits=3, decimal_places=2, null=True, default=None
+    )
+    # Bayesian average, see BOOKS_LEADERBOARD_PRIOR_MEAN.
+    weighted_rating = models.DecimalField(
+        "Взвешенный рейтинг",
+        max_digits=5,
+        decimal_places=4,
+        default=default_weighted_rating,
+    )
+    modified = models.DateTimeField("Изменена", auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = "Книга"
         verbose_name_plural = "Книги"
+        # Composite keys for keyset pagination over every ordering option.
+        indexes = [
+            models.Index(fields=["price", "id"], name="book_price_id_idx"),
+            models.Index(fields=["author_name", "id"], name="book_author_name_id_idx"),
+            models.Index(fields=["name", "id"], name="book_name_id_idx"),
+            # Leaderboards, the top K is the first K index entries.
+            models.Index(fields=["-likes_count", "id"], name="book_top_liked_idx"),
+            models.Index(
+                fields=["-weighted_rating", "-rate_count", "id"],
+                name="book_top_rated_idx",
+            ),
+            models.Index(
+                fields=["-bookmarks_count", "id"], name="book_top_bookmarked_idx"
+            ),
+        ]
+
+    # Kept up to date by relation writes with in-place UPDATEs, see
+    # store.logic. Saving a loaded book must not write back what it read.
+    counter_fields = frozenset(
+        (
+            "likes_count",
+            "bookmarks_count",
+            "rate_sum",
+            "rate_count",
+            "rate_1_count",
+            "rate_2_count",
+            "rate_3_count",
+            "rate_4_count",
+            "rate_5_count",
+            "rating",
+            "weighted_rating",
+        )
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Name and author the search index has for the book, None if unknown.
+        self._indexed_text = None
 
     def __str__(self):
         return f"{self.name} by {self.author_name} ({self.price} rub.)"
 
-    # def save(self):
-    #     pass
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not {"name", "author_name"} & instance.get_deferred_fields():
+            instance._indexed_text = instance.search_text()
+        return instance
+
+    def search_text(self):
+        """Fields the search index is built from, see store.search."""
+        return self.name, self.author_name
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not kwargs.get("force_insert")
+            and kwargs.get("update_fields") is None
+        ):
+            skipped = self.counter_fields | self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
 
     # def get_absolute_url(self):
     #     pass
 
 
+class BookSearchToken(models.Model):
+    """
+    Inverted index entry: a word of the book name or author and its weight.
+    """
+
+    book = models.ForeignKey(
+        Book,
+        verbose_name="Книга",
+        on_delete=models.CASCADE,
+        related_name="search_tokens",
+    )
+    token = models.CharField("Токен", max_length=64)
+    weight = models.PositiveSmallIntegerField("Вес")
+
+    class Meta:
+        verbose_name = "Поисковый токен книги"
+        verbose_name_plural = "Поисковые токены книг"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["book", "token"], name="unique_book_search_token"
+            )
+        ]
+        # varchar_pattern_ops lets PostgreSQL use the index for LIKE 'prefix%'.
+        indexes = [
+            models.Index(
+                fields=["token"],
+                name="book_search_token_idx",
+                opclasses=["varchar_pattern_ops"],
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.token} ({self.weight}) -> {self.book_id}"
+
+
+class SimilarBook(models.Model):
+    """
+    One of a book's nearest neighbours by readers, see store.recommendations.
+    """
+
+    book = models.ForeignKey(
+        Book,
+        verbose_name="Книга",
+        on_delete=models.CASCADE,
+        related_name="similar_books",
+    )
+    similar = models.ForeignKey(
+        Book,
+        verbose_name="Похожая книга",
+        on_delete=models.CASCADE,
+        related_name="similar_to",
+    )
+    rank = models.PositiveSmallIntegerField("Место")
+    score = models.FloatField("Сходство")
+
+    class Meta:
+        verbose_name = "Похожая книга"
+        verbose_name_plural = "Похожие книги"
+        # Also the index the neighbours are read in order from.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["book", "rank"], name="unique_similar_book_rank"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.similar_id} ({self.score:.3f})"
+
+
+class SimilarityBuild(models.Model):
+    """
+    A run of build_similar_books, incremental runs start from the last one.
+    """
+
+    started = models.DateTimeField("Начало")
+    finished = models.DateTimeField("Окончание", auto_now_add=True)
+    incremental = models.BooleanField("Инкрементальный")
+    books = models.PositiveIntegerField("Пересчитано книг")
+
+    class Meta:
+        verbose_name = "Расчёт похожих книг"
+        verbose_name_plural = "Расчёты похожих книг"
+        get_latest_by = ("started", "id")
+
+    def __str__(self):
+        return f"{self.started:%Y-%m-%d %H:%M} ({self.books} books)"
+
+
+class RevokedToken(models.Model):
+    """
+    A signed API token revoked before it expires, see store.authentication.
+    """
+
+    jti = models.CharField("Идентификатор токена", max_length=64, unique=True)
+    expires = models.DateTimeField("Истекает", db_index=True)
+
+    class Meta:
+        verbose_name = "Отозванный токен"
+        verbose_name_plural = "Отозванные токены"
+
+    def __str__(self):
+        return self.jti
+
+
+class BookChange(models.Model):
+    """
+    An entry of the book change log behind /book/changes/, see store.changes.
+    Ids only grow, the last one a client has seen is its sync token.
+    """
+
+    book_id = models.BigIntegerField("Книга")
+    deleted = models.BooleanField("Удалена", default=False)
+    created = models.DateTimeField("Создано", default=timezone.now)
+
+    class Meta:
+        verbose_name = "Изменение книги"
+        verbose_name_plural = "Изменения книг"
+        indexes = [
+            # Finding older changes of the same book when compacting.
+            models.Index(fields=["book_id", "id"], name="book_change_book_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.book_id}{' deleted' if self.deleted else ''}"
+
+
+class BookChangeCompaction(models.Model):
+    """
+    A run of compact_book_changes. Tokens older than the horizon need a
+    full resync.
+    """
+
+    horizon = models.BigIntegerField("Удалено до изменения")
+    removed = models.PositiveIntegerField("Удалено изменений")
+    finished = models.DateTimeField("Окончание", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Сжатие журнала изменений"
+        verbose_name_plural = "Сжатия журнала изменений"
+        get_latest_by = "id"
+
+    def __str__(self):
+        return f"{self.finished:%Y-%m-%d %H:%M} (up to {self.horizon})"
+
+
 class UserBookRelation(models.Model):
     RATE_CHOICES = (
         (1, "Ok"),
@@ -39,6 +273,8 @@ class UserBookRelation(models.Model):
         (4, "Amazing"),
         (5, "Incredible"),
     )
+    # Marks relations loaded without the fields needed to diff counters.
+    UNKNOWN_STATE = object()
 
     user = models.ForeignKey(
         User, verbose_name="Пользователь", on_delete=models.CASCADE, null=True
@@ -53,6 +289,56 @@ class UserBookRelation(models.Model):
     class Meta:
         verbose_name = "Отношение книги и пользователя"
         verbose_name_plural = "Отношения книг и пользователей"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "book"], name="unique_user_book_relation"
+            )
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # State already reflected in the book counters, None if nothing is.
+        self._counted_state = None
 
     def __str__(self):
         return f"{self.user.username}: {self.book.name}, ({self.rate})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not {"book_id", "like", "in_bookmarks", "rate"} & (
+            instance.get_deferred_fields()
+        ):
+            instance._counted_state = instance.counter_state()
+        else:
+            instance._counted_state = cls.UNKNOWN_STATE
+        return instance
+
+    def counter_state(self):
+        """Part of the relation that contributes to the book counters."""
+        return self.book_id, self.like, self.in_bookmarks, self.rate
+
+    def save(self, *args, **kwargs):
+        from store.logic import apply_counter_deltas, relation_counter_deltas
+
+        with transaction.atomic(using=kwargs.get("using")):
+            old_state = self._counted_state
+            if old_state is self.UNKNOWN_STATE:
+                old_state = (
+                    UserBookRelation.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list("book_id", "like", "in_bookmarks", "rate")
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None and not {
+                "book",
+                "like",
+                "in_bookmarks",
+                "rate",
+            } & set(update_fields):
+                return
+            new_state = self.counter_state()
+            apply_counter_deltas(relation_counter_deltas(old_state, new_state))
+        self._counted_state = new_state
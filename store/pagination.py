@@ -0,0 +1,166 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict, namedtuple
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+Cursor = namedtuple("Cursor", ["reverse", "position"])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over ``(ordering field, id)`` keys.
+
+    Unlike ``CursorPagination`` the cursor stores the full key of the
+    boundary row, so every page is a ``WHERE key > position LIMIT n`` index
+    range scan: no OFFSET for duplicate values and no ``COUNT(*)``.
+    The ordering field comes from the view's ``OrderingFilter``.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    tie_breaker = "id"
+    invalid_cursor_message = _("Invalid cursor")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request, view)
+        return self.set_page([item async for item in queryset])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """
+        Slice of ``queryset`` holding the page and one row to look ahead.
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.keys = self.get_keys(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        queryset = queryset.order_by(*self.get_order_by(reverse))
+        if self.cursor is not None:
+            queryset = queryset.filter(self.get_keyset_filter(self.cursor))
+        return queryset[: self.page_size + 1]
+
+    def set_page(self, results):
+        reverse = self.cursor is not None and self.cursor.reverse
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size,
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_keys(self, request, queryset, view):
+        """
+        Return ``(field, descending)`` pairs the rows are ordered by.
+
+        Only the first ordering term is honoured, ties are always broken by
+        ``tie_breaker`` in the same direction so a composite index applies.
+        """
+        ordering = OrderingFilter().get_ordering(request, queryset, view) or ()
+        ordering = [term for term in ordering if term.lstrip("-") != self.tie_breaker]
+        if not ordering:
+            return ((self.tie_breaker, False),)
+        field = ordering[0]
+        descending = field.startswith("-")
+        return ((field.lstrip("-"), descending), (self.tie_breaker, descending))
+
+    def get_fields(self):
+        return [field for field, descending in self.keys]
+
+    def get_order_by(self, reverse=False):
+        return [
+            f"{'-' if descending != reverse else ''}{field}"
+            for field, descending in self.keys
+        ]
+
+    def get_keyset_filter(self, cursor):
+        """
+        Lexicographic "row comes after position" condition:
+        ``k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...``.
+        """
+        conditions = []
+        for index, (field, descending) in enumerate(self.keys):
+            lookup = "lt" if descending != cursor.reverse else "gt"
+            condition = Q(**{f"{field}__{lookup}": cursor.position[index]})
+            for previous, value in zip(self.get_fields()[:index], cursor.position):
+                condition &= Q(**{previous: value})
+            conditions.append(condition)
+        return reduce(or_, conditions)
+
+    def get_position(self, item):
+        if isinstance(item, dict):
+            return [item[field] for field in self.get_fields()]
+        return [getattr(item, field) for field in self.get_fields()]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(False, self.get_position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(True, self.get_position(self.page[0])))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            data = json.loads(b64decode(encoded.encode("ascii")).decode("utf-8"))
+            fields = self.get_fields()
+            if data["k"] != fields or len(data["p"]) != len(fields):
+                raise ValueError
+            return Cursor(bool(data["r"]), data["p"])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, cursor):
+        data = {
+            "r": int(cursor.reverse),
+            "k": self.get_fields(),
+            "p": cursor.position,
+        }
+        encoded = b64encode(
+            json.dumps(data, default=str, separators=(",", ":")).encode("utf-8")
+        ).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
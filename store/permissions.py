@@ -1,9 +1,40 @@
+from asgiref.sync import sync_to_async
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 
+async def ahas_permission(permission, request, view):
+    """
+    ``has_permission`` from async code, in a thread unless the permission
+    has its own ``ahas_permission``.
+    """
+    if hasattr(permission, "ahas_permission"):
+        return await permission.ahas_permission(request, view)
+    return await sync_to_async(permission.has_permission)(request, view)
+
+
+async def ahas_object_permission(permission, request, view, obj):
+    if hasattr(permission, "ahas_object_permission"):
+        return await permission.ahas_object_permission(request, view, obj)
+    return await sync_to_async(permission.has_object_permission)(request, view, obj)
+
+
+def filter_permitted(request, view, queryset):
+    """
+    Narrow ``queryset`` down to the objects every permission of the view
+    allows, for writes to many objects at once. Permissions without a
+    ``filter_queryset`` leave it as it is.
+    """
+    for permission in view.get_permissions():
+        if hasattr(permission, "filter_queryset"):
+            queryset = permission.filter_queryset(request, view, queryset)
+    return queryset
+
+
 class IsOwnerOrStaffOrReadOnly(BasePermission):
     """
     The request is authenticated as a user, or is a read-only request.
+
+    Ownership is checked on ``owner_id``, the owner row is never loaded.
     """
 
     def has_object_permission(self, request, view, obj):
@@ -11,5 +42,32 @@ class IsOwnerOrStaffOrReadOnly(BasePermission):
             request.method in SAFE_METHODS
             or request.user
             and request.user.is_authenticated
-            and (obj.owner == request.user or request.user.is_staff)
+            and (obj.owner_id == request.user.pk or request.user.is_staff)
+        )
+
+    def filter_queryset(self, request, view, queryset):
+        """
+        ``has_object_permission`` for a whole queryset, as one WHERE clause.
+        """
+        if request.method in SAFE_METHODS:
+            return queryset
+        user = request.user
+        if not user or not user.is_authenticated:
+            return queryset.none()
+        if user.is_staff:
+            return queryset
+        return queryset.filter(owner_id=user.pk)
+
+    async def ahas_permission(self, request, view):
+        return True
+
+    async def ahas_object_permission(self, request, view, obj):
+        # Reads don't need the user, so don't authenticate for them.
+        if request.method in SAFE_METHODS:
+            return True
+        user = await sync_to_async(lambda: request.user)()
+        return bool(
+            user
+            and user.is_authenticated
+            and (obj.owner_id == user.pk or user.is_staff)
         )
@@ -0,0 +1,173 @@
+"""
+"Readers who liked this also liked": item-to-item neighbours of books.
+
+Relations become a sparse users x books matrix; the cosine similarity of two
+book columns says how much the same readers liked both. Only the ``top_n``
+neighbours of every book are kept, in ``SimilarBook``, so reading them is an
+index range scan. Needs NumPy and SciPy, only the build step imports this.
+"""
+from itertools import chain
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from scipy import sparse
+
+from store.cache import bump_books_version
+from store.models import Book, SimilarBook, SimilarityBuild, UserBookRelation
+
+
+def relation_matrix(chunk_size=10000):
+    """
+    Users x books CSC matrix of how much each reader liked each book, and
+    the (sorted) book ids of its columns.
+
+    A like counts 1, a rate ``(rate - 1) / 4``, a relation the larger of
+    both. Relations worth nothing (no like, rate 1 or none) are left out.
+    """
+    rows = (
+        UserBookRelation.objects.filter(user__isnull=False, book__isnull=False)
+        .filter(Q(like=True) | Q(rate__gt=1))
+        .values_list("user_id", "book_id", "like", Coalesce("rate", 1))
+    )
+    values = np.fromiter(
+        chain.from_iterable(rows.iterator(chunk_size=chunk_size)), dtype=np.int64
+    ).reshape(-1, 4)
+    user_ids, user_index = np.unique(values[:, 0], return_inverse=True)
+    book_ids, book_index = np.unique(values[:, 1], return_inverse=True)
+    weights = np.maximum(values[:, 2], (values[:, 3] - 1) / 4)
+    matrix = sparse.csc_matrix(
+        (weights, (user_index, book_index)), shape=(len(user_ids), len(book_ids))
+    )
+    return matrix, book_ids
+
+
+def binary(matrix):
+    result = matrix.copy()
+    result.data[:] = 1
+    return result
+
+
+class SimilarityBuilder:
+    """
+    Compute and store the ``top_n`` most similar books of every book.
+
+    Pairs with fewer than ``min_common`` readers in common are ignored, one
+    shared reader says little. ``build(since=...)`` only recomputes books
+    whose scores can have changed since then, see ``affected_books``.
+    """
+
+    def __init__(self, top_n=20, min_common=2, batch_size=1000):
+        self.top_n = top_n
+        self.min_common = min_common
+        self.batch_size = batch_size
+
+    def build(self, since=None):
+        """
+        Rebuild everything, or only what changed ``since`` a datetime.
+        Returns the ``SimilarityBuild`` record of the run.
+        """
+        # Whole seconds, counter updates may stamp Book.modified in seconds.
+        started = timezone.now().replace(microsecond=0)
+        matrix, book_ids = relation_matrix()
+        if since is None:
+            targets = np.arange(len(book_ids))
+            stale = None
+        else:
+            targets, stale = self.affected_books(matrix, book_ids, since)
+
+        neighbours = list(self.neighbours(matrix, book_ids, targets))
+        with transaction.atomic():
+            if stale is None:
+                SimilarBook.objects.all().delete()
+            else:
+                SimilarBook.objects.filter(book_id__in=stale).delete()
+            SimilarBook.objects.bulk_create(
+                (
+                    SimilarBook(
+                        book_id=book_id, similar_id=similar_id, rank=rank, score=score
+                    )
+                    for book_id, similar in neighbours
+                    for rank, (similar_id, score) in enumerate(similar, start=1)
+                ),
+                batch_size=self.batch_size,
+            )
+            bump_books_version()
+            return SimilarityBuild.objects.create(
+                started=started,
+                incremental=since is not None,
+                books=len(targets) if stale is None else len(stale),
+            )
+
+    def affected_books(self, matrix, book_ids, since):
+        """
+        Column indexes to recompute and the ids of books whose stored
+        neighbours are to be replaced.
+
+        A book's scores change when the book itself changed (its relations
+        bump ``Book.modified`` through the counters) or when it shares readers
+        with a changed book. Books still listing a changed book as neighbour
+        are redone too, they may share nobody with it any more.
+        """
+        changed = set(
+            Book.objects.filter(modified__gte=since).values_list("id", flat=True)
+        )
+        changed_columns = np.flatnonzero(np.isin(book_ids, list(changed)))
+        readers = binary(matrix)
+        stale = changed | set(
+            SimilarBook.objects.filter(similar_id__in=changed).values_list(
+                "book_id", flat=True
+            )
+        )
+        for start in range(0, len(changed_columns), self.batch_size):
+            columns = changed_columns[start : start + self.batch_size]
+            shared = readers[:, columns].T @ readers
+            stale.update(book_ids[np.unique(shared.indices)].tolist())
+        targets = np.flatnonzero(np.isin(book_ids, list(stale)))
+        return targets, stale
+
+    def neighbours(self, matrix, book_ids, targets):
+        """
+        ``(book id, [(similar book id, score), ...])`` for the target columns,
+        best first.
+
+        Targets are scored ``batch_size`` at a time, so only that many rows
+        of the book x book products are held at once.
+        """
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+        readers = binary(matrix)
+        for start in range(0, len(targets), self.batch_size):
+            batch = targets[start : start + self.batch_size]
+            yield from self.batch_neighbours(matrix, readers, norms, book_ids, batch)
+
+    def batch_neighbours(self, matrix, readers, norms, book_ids, targets):
+        # Cosine similarity of the target columns with every column.
+        scores = (matrix[:, targets].T @ matrix).tocsr()
+        scores = sparse.diags(1 / norms[targets]) @ scores @ sparse.diags(1 / norms)
+        common = (readers[:, targets].T @ readers).tocsr()
+        common.data = (common.data >= self.min_common).astype(np.float64)
+        scores = scores.multiply(common).tocsr()
+        # A book is not its own neighbour.
+        scores = scores - scores.multiply(
+            sparse.csr_matrix(
+                (np.ones(len(targets)), (np.arange(len(targets)), targets)),
+                shape=scores.shape,
+            )
+        )
+        scores.eliminate_zeros()
+        scores.sort_indices()
+
+        for row, column in enumerate(targets):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            data, indices = scores.data[start:end], scores.indices[start:end]
+            if len(data) > self.top_n:
+                top = np.argpartition(-data, self.top_n - 1)[: self.top_n]
+                data, indices = data[top], indices[top]
+            # Best first, ties by book id.
+            order = np.lexsort((indices, -data))
+            yield int(book_ids[column]), [
+                (int(book_ids[index]), float(score))
+                for index, score in zip(indices[order], data[order])
+            ]
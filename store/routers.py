@@ -0,0 +1,94 @@
+"""
+Read replicas for the heavy book reads, see ``BOOKS_DATABASE_REPLICAS``.
+
+Only reads of safe requests go to a replica, and only for ``read_models``.
+Everything else (writes, reads of writing requests, management commands,
+reads inside transactions) stays on the primary. A client who just wrote
+reads from the primary for ``BOOKS_DATABASE_STICKY_SECONDS``, so they see
+their own changes: the pin is a cookie, any process serving them sees it.
+``ReplicaRoutingMiddleware`` sets it and makes the request visible here.
+``may_be_stale`` needs the last write time of every process, so the
+``BOOKS_CACHE_ALIAS`` cache has to be shared (``check --deploy`` fails
+otherwise).
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from store.cache import BOOKS_CHANGED_KEY, get_cache
+
+PRIMARY_PIN_COOKIE = "store_primary"
+
+current_request = ContextVar("current_request", default=None)
+
+
+def pin_to_primary(response):
+    """
+    Keep the reads of the client getting ``response`` on the primary.
+    """
+    seconds = settings.BOOKS_DATABASE_STICKY_SECONDS
+    # The expiry is checked too, clients may keep cookies longer.
+    response.set_cookie(
+        PRIMARY_PIN_COOKIE,
+        str(int(time.time() + seconds)),
+        max_age=seconds,
+        httponly=True,
+        samesite="Lax",
+    )
+
+
+def reads_from_primary(request):
+    """
+    Whether the store reads of ``request`` need the primary.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return True
+    pinned_until = request.COOKIES.get(PRIMARY_PIN_COOKIE)
+    try:
+        return pinned_until is not None and int(pinned_until) > time.time()
+    except ValueError:
+        return False
+
+
+def may_be_stale(request):
+    """
+    Whether ``request`` read from a replica shortly after some write, which
+    the replica may not have caught up with yet. Shared caches shouldn't keep
+    such responses, they would outlive the lag.
+    """
+    if not getattr(request, "_used_replica", False):
+        return False
+    changed = get_cache().get(BOOKS_CHANGED_KEY, 0)
+    return time.time() - changed < settings.BOOKS_DATABASE_STICKY_SECONDS
+
+
+class ReplicaRouter:
+    read_models = {"store.book", "store.userbookrelation", "store.similarbook"}
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.BOOKS_DATABASE_REPLICAS
+        if not replicas or model._meta.label_lower not in self.read_models:
+            return None
+        request = current_request.get()
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or reads_from_primary(request):
+            return DEFAULT_DB_ALIAS
+        request._used_replica = True
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.BOOKS_DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.BOOKS_DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,173 @@
+import re
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Case,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.utils.module_loading import import_string
+from rest_framework.filters import SearchFilter
+
+from store.models import Book, BookSearchToken
+
+TOKEN_RE = re.compile(r"\w+")
+TOKEN_MAX_LENGTH = BookSearchToken._meta.get_field("token").max_length
+
+
+def tokenize(text):
+    return [token[:TOKEN_MAX_LENGTH] for token in TOKEN_RE.findall(text.casefold())]
+
+
+def get_search_backend():
+    return import_string(settings.BOOKS_SEARCH_BACKEND)()
+
+
+class BaseSearchBackend:
+    # Whether results carry a ``search_rank`` annotation to order by.
+    ranked = False
+
+    def search(self, queryset, terms, search_fields):
+        raise NotImplementedError
+
+    def index(self, books):
+        """
+        Bring the index up to date with the given (saved) books.
+        """
+
+    def rebuild(self, batch_size=1000):
+        """
+        Index every book from scratch, returns the number of books indexed.
+        """
+        return 0
+
+
+class ContainsSearchBackend(BaseSearchBackend):
+    """
+    What ``SearchFilter`` does: every term ``icontains`` in any field. No index.
+    """
+
+    def search(self, queryset, terms, search_fields):
+        for term in terms:
+            queryset = queryset.filter(
+                reduce(
+                    or_, (Q(**{f"{field}__icontains": term}) for field in search_fields)
+                )
+            )
+        return queryset
+
+
+class TokenIndexSearchBackend(BaseSearchBackend):
+    """
+    Prefix search over the ``BookSearchToken`` inverted index.
+
+    Every query word has to be a prefix of some word of the name or the
+    author, each lookup is an index range scan instead of a table scan.
+    ``search_rank`` sums the weights of matched words, name words weigh more
+    and whole-word matches count twice. The indexed fields are fixed, the
+    view's ``search_fields`` are not used.
+    """
+
+    ranked = True
+    field_weights = {"name": 2, "author_name": 1}
+
+    def book_tokens(self, book_id, values):
+        weights = {}
+        for field, weight in self.field_weights.items():
+            for token in tokenize(values[field]):
+                weights[token] = weights.get(token, 0) + weight
+        return [
+            BookSearchToken(book_id=book_id, token=token, weight=weight)
+            for token, weight in weights.items()
+        ]
+
+    def index(self, books):
+        books = list(books)
+        with transaction.atomic():
+            BookSearchToken.objects.filter(
+                book_id__in=[book.pk for book in books]
+            ).delete()
+            BookSearchToken.objects.bulk_create(
+                token
+                for book in books
+                for token in self.book_tokens(
+                    book.pk,
+                    {field: getattr(book, field) for field in self.field_weights},
+                )
+            )
+
+    def rebuild(self, batch_size=1000):
+        count = 0
+        with transaction.atomic():
+            BookSearchToken.objects.all().delete()
+            rows = Book.objects.values("id", *self.field_weights).order_by("id")
+            tokens = []
+            for row in rows.iterator(chunk_size=batch_size):
+                tokens += self.book_tokens(row["id"], row)
+                count += 1
+                if len(tokens) >= batch_size:
+                    BookSearchToken.objects.bulk_create(tokens)
+                    tokens = []
+            BookSearchToken.objects.bulk_create(tokens)
+        return count
+
+    def search(self, queryset, terms, search_fields):
+        tokens = sorted(set(tokenize(" ".join(terms))))
+        if not tokens:
+            return queryset.annotate(search_rank=Value(0)).none()
+
+        index = BookSearchToken.objects.all()
+        for token in tokens:
+            queryset = queryset.filter(
+                pk__in=index.filter(token__startswith=token).values("book")
+            )
+        rank = (
+            index.filter(
+                reduce(or_, (Q(token__startswith=token) for token in tokens)),
+                book=OuterRef("pk"),
+            )
+            .values("book")
+            .annotate(
+                rank=Sum(
+                    Case(
+                        When(token__in=tokens, then=F("weight") * 2),
+                        default=F("weight"),
+                        output_field=IntegerField(),
+                    )
+                )
+            )
+            .values("rank")
+        )
+        return queryset.annotate(
+            search_rank=Subquery(rank, output_field=IntegerField())
+        )
+
+
+class BookSearchFilter(SearchFilter):
+    """
+    ``SearchFilter`` answered by the ``BOOKS_SEARCH_BACKEND`` backend.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        search_fields = self.get_search_fields(view, request)
+        return get_search_backend().search(queryset, terms, search_fields)
+
+    def get_default_ordering(self, request):
+        """
+        Ordering for ranked search results, None if nothing is searched.
+        """
+        if self.get_search_terms(request) and get_search_backend().ranked:
+            return ("-search_rank",)
+        return None
@@ -1,17 +1,71 @@
+import decimal
+
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
+from rest_framework.settings import api_settings
 
+from store.logic import RATE_HISTOGRAM_FIELDS
 from store.models import Book, UserBookRelation
-from django.db.models import Count, Case, When
+from store.timing import TimedListSerializer, timed
+
+
+class DynamicFieldsModelSerializer(ModelSerializer):
+    """
+    Takes an optional ``fields`` argument with the subset of fields to output
+    and an ``exclude`` one with fields to leave out.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        exclude = kwargs.pop("exclude", ())
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        for name in set(self.fields) & set(exclude):
+            self.fields.pop(name)
+
+    @property
+    def data(self):
+        with timed("serialize"):
+            return super().data
+
+
+class RatingHistogramField(serializers.Field):
+    """
+    Number of rates per value, ``{"1": 0, ..., "5": 0}``, read from the
+    book's ``rate_<n>_count`` counter columns.
+    """
+
+    row_columns = RATE_HISTOGRAM_FIELDS
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
 
+    def to_representation(self, instance):
+        return self.from_columns([getattr(instance, c) for c in self.row_columns])
 
-class BooksSerializer(ModelSerializer):
-    likes_count = serializers.SerializerMethodField()
-    annotated_likes = serializers.IntegerField(read_only=True)
+    @staticmethod
+    def from_columns(values):
+        return {str(rate): count for rate, count in enumerate(values, start=1)}
+
+
+class BooksSerializer(DynamicFieldsModelSerializer):
+    likes_count = serializers.IntegerField(read_only=True)
+    annotated_likes = serializers.IntegerField(source="likes_count", read_only=True)
     rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
+    bookmarks_count = serializers.IntegerField(read_only=True)
+    weighted_rating = serializers.DecimalField(
+        max_digits=5, decimal_places=4, read_only=True
+    )
+    rating_histogram = RatingHistogramField()
 
     class Meta:
         model = Book
+        list_serializer_class = TimedListSerializer
         fields = (
             "id",
             "name",
@@ -20,13 +74,138 @@ class BooksSerializer(ModelSerializer):
             "likes_count",
             "annotated_likes",
             "rating",
+            "bookmarks_count",
+            "weighted_rating",
+            "rating_histogram",
         )
 
-    def get_likes_count(self, instance):
-        return UserBookRelation.objects.filter(book=instance, like=True).count()
+
+class BooksWithUserRelationSerializer(BooksSerializer):
+    """
+    Books with the requesting user's relation, read from ``user_relation_*``
+    annotations. Null when there is nobody to relate to.
+    """
+
+    user_relation = serializers.SerializerMethodField()
+
+    class Meta(BooksSerializer.Meta):
+        fields = BooksSerializer.Meta.fields + ("user_relation",)
+
+    def get_user_relation(self, instance):
+        if not hasattr(instance, "user_relation_id"):
+            return None
+        if instance.user_relation_id is None:
+            relation = {"like": False, "in_bookmarks": False, "rate": None}
+        else:
+            relation = {
+                "like": instance.user_relation_like,
+                "in_bookmarks": instance.user_relation_in_bookmarks,
+                "rate": instance.user_relation_rate,
+            }
+        # Buffered writes of the user, see store.buffer.
+        pending = self.context.get("pending_relations")
+        if pending and instance.pk in pending:
+            relation.update(pending[instance.pk])
+        return relation
 
 
 class UserBookRelationSerializer(ModelSerializer):
     class Meta:
         model = UserBookRelation
         fields = ("book", "like", "in_bookmarks", "rate")
+
+
+class UserBookRelationBulkItemSerializer(UserBookRelationSerializer):
+    # Existence is checked for the whole batch at once instead of per item.
+    book = serializers.IntegerField(min_value=1)
+
+
+class BookIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000
+    )
+
+
+class RowSerializer:
+    """
+    Turns ``.values()`` rows into the same output a ``ModelSerializer`` gives.
+
+    Converters are built once from the serializer's fields, so no model
+    instances or field objects are touched per row. Only fields backed by
+    plain columns are supported, ``for_serializer`` returns None otherwise.
+    """
+
+    plain_fields = (
+        serializers.BooleanField,
+        serializers.CharField,
+        serializers.IntegerField,
+    )
+
+    def __init__(self, converters):
+        # (output name, column, converter or None) triples, the column is a
+        # tuple of columns for fields built from several.
+        self.converters = converters
+        self.columns = []
+        for _, column, _ in converters:
+            if isinstance(column, tuple):
+                self.columns.extend(column)
+            else:
+                self.columns.append(column)
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        opts = serializer.Meta.model._meta
+        converters = []
+        for name, field in serializer.fields.items():
+            if hasattr(field, "row_columns"):
+                converters.append((name, field.row_columns, field.from_columns))
+                continue
+            try:
+                column = opts.get_field(field.source).attname
+            except FieldDoesNotExist:
+                return None
+            if isinstance(field, serializers.DecimalField):
+                converters.append((name, column, cls.decimal_converter(field)))
+            elif isinstance(field, cls.plain_fields):
+                converters.append((name, column, None))
+            else:
+                return None
+        return cls(converters)
+
+    @staticmethod
+    def decimal_converter(field):
+        coerce_to_string = getattr(
+            field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING
+        )
+        if field.localize or not coerce_to_string or field.decimal_places is None:
+            return field.to_representation
+
+        exponent = decimal.Decimal(".1") ** field.decimal_places
+        context = decimal.getcontext().copy()
+        if field.max_digits is not None:
+            context.prec = field.max_digits
+        rounding = field.rounding
+
+        def convert(value):
+            if not isinstance(value, decimal.Decimal):
+                value = decimal.Decimal(str(value).strip())
+            return format(value.quantize(exponent, rounding, context), "f")
+
+        return convert
+
+    def to_representation(self, row):
+        data = {}
+        for name, column, convert in self.converters:
+            if column.__class__ is tuple:
+                data[name] = convert([row[c] for c in column])
+                continue
+            value = row[column]
+            # Like Serializer.to_representation, None skips the field itself.
+            if convert is not None and value is not None:
+                value = convert(value)
+            data[name] = value
+        return data
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
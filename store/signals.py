@@ -0,0 +1,57 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from store.auth import forget_user
+from store.cache import bump_books_version
+from store.changes import record_book_changes
+from store.logic import apply_counter_deltas, relation_counter_deltas
+from store.models import Book, UserBookRelation
+from store.search import get_search_backend
+
+
+@receiver(post_delete, sender=UserBookRelation)
+def discount_deleted_relation(sender, instance, origin=None, **kwargs):
+    # Relations removed together with their book have nothing left to update.
+    if getattr(origin, "model", type(origin)) is Book:
+        return
+    old_state = instance._counted_state
+    if old_state in (None, UserBookRelation.UNKNOWN_STATE):
+        old_state = instance.counter_state()
+    apply_counter_deltas(relation_counter_deltas(old_state, None))
+    instance._counted_state = None
+
+
+@receiver(post_save, sender=Book)
+def index_saved_book(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {"name", "author_name"} & set(update_fields):
+        return
+    # Book.save() lists every column it writes, compare with what was loaded.
+    if instance._indexed_text == instance.search_text():
+        return
+    get_search_backend().index([instance])
+    instance._indexed_text = instance.search_text()
+
+
+@receiver(post_save, sender=Book)
+def record_saved_book(sender, instance, **kwargs):
+    record_book_changes([instance.pk])
+
+
+@receiver(post_delete, sender=Book)
+def record_deleted_book(sender, instance, **kwargs):
+    record_book_changes([instance.pk], deleted=True)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=UserBookRelation)
+@receiver(post_delete, sender=UserBookRelation)
+def invalidate_book_responses(sender, **kwargs):
+    bump_books_version()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
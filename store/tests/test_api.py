@@ -1,17 +1,35 @@
+import csv
+import io
 import json
+from decimal import Decimal
+from unittest.mock import patch
 
 from django.contrib.auth.models import User
-from django.db.models import Count, When, Case
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.exceptions import ErrorDetail
 from rest_framework.test import APITestCase
 
+from store.cache import response_cache_stats
+from store.checks import check_shared_cache
 from store.models import Book, UserBookRelation
 from store.serializers import BooksSerializer
+from store.views import BookViewSet
+from store.tests.utils import QueryBudgetMixin
 
 
-class BooksTestCase(APITestCase):
+class BooksTestCase(QueryBudgetMixin, APITestCase):
+    # Queries allowed per request, regardless of the number of books: the
+    # validators and the page.
+    LIST_QUERY_BUDGET = 2
+    DETAIL_QUERY_BUDGET = 2
+
     def setUp(self):
         self.user = User.objects.create(username="testusername")
         self.book_1 = Book.objects.create(
@@ -32,18 +50,35 @@ class BooksTestCase(APITestCase):
         url = reverse("book-list")
         response = self.client.get(url)
 
-        books = (
-            Book.objects.all()
-            .annotate(
-                annotated_likes=Count(Case(When(userbookrelation__like=True, then=1)))
-            )
-            .order_by("id")
-        )
+        books = Book.objects.all().order_by("id")
 
         # Getting data from serializer.
-        serializer_data = BooksSerializer(books, many=True).data
+        serializer_data = BooksSerializer(
+            books, many=True, exclude=BookViewSet.detail_only_fields
+        ).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data["results"])
+        self.assertIsNone(response.data["next"])
+        self.assertIsNone(response.data["previous"])
+
+    def test_get_query_budget(self):
+        users = [User.objects.create(username=f"reader{i}") for i in range(3)]
+        for i in range(30):
+            book = Book.objects.create(
+                name=f"Book {i}", price=i, author_name="Author", owner=self.user
+            )
+            for user in users:
+                UserBookRelation.objects.create(user=user, book=book, like=True)
+
+        with self.assertMaxQueries(self.LIST_QUERY_BUDGET):
+            response = self.client.get(reverse("book-list"))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(3, response.data["results"][-1]["likes_count"])
+
+        with self.assertMaxQueries(self.DETAIL_QUERY_BUDGET):
+            response = self.client.get(reverse("book-detail", args=(book.id,)))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(3, response.data["likes_count"])
 
     def test_get_detail(self):
         # Request to server via router name from "url.py".
@@ -59,62 +94,69 @@ class BooksTestCase(APITestCase):
         # Request to server via router name from "url.py".
         url = reverse("book-list")
         response = self.client.get(url, data={"search": "Author 2"})
-        books = (
-            Book.objects.all()
-            .filter(id__in=[self.book_2.id, self.book_3.id])
-            .annotate(
-                annotated_likes=Count(Case(When(userbookrelation__like=True, then=1)))
-            )
-            .order_by("id")
+        books = Book.objects.filter(id__in=[self.book_2.id, self.book_3.id]).order_by(
+            "id"
         )
         # Getting data from serializer.
-        serializer_data = BooksSerializer(books, many=True).data
+        serializer_data = BooksSerializer(
+            books, many=True, exclude=BookViewSet.detail_only_fields
+        ).data
 
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data["results"])
 
     def test_get_order_1(self):
         url = reverse("book-list")
         response = self.client.get(url, data={"ordering": "author_name"})
 
         serializer_data = BooksSerializer(
-            [self.book_1, self.book_2, self.book_3], many=True
+            [self.book_1, self.book_2, self.book_3],
+            many=True,
+            exclude=BookViewSet.detail_only_fields,
         ).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data["results"])
 
     def test_get_order_2(self):
         url = reverse("book-list")
         response = self.client.get(url, data={"ordering": "-author_name"})
 
         serializer_data_1 = BooksSerializer(
-            [self.book_3, self.book_2, self.book_1], many=True
+            [self.book_3, self.book_2, self.book_1],
+            many=True,
+            exclude=BookViewSet.detail_only_fields,
         ).data
         serializer_data_2 = BooksSerializer(
-            [self.book_3, self.book_1, self.book_2], many=True
+            [self.book_3, self.book_1, self.book_2],
+            many=True,
+            exclude=BookViewSet.detail_only_fields,
         ).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertIn(response.data, [serializer_data_1, serializer_data_2])
+        self.assertIn(response.data["results"], [serializer_data_1, serializer_data_2])
 
     def test_get_order_3(self):
         url = reverse("book-list")
         response = self.client.get(url, data={"ordering": "price"})
 
         serializer_data = BooksSerializer(
-            [self.book_1, self.book_2, self.book_3], many=True
+            [self.book_1, self.book_2, self.book_3],
+            many=True,
+            exclude=BookViewSet.detail_only_fields,
         ).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data["results"])
 
     def test_get_order_4(self):
         url = reverse("book-list")
         response = self.client.get(url, data={"ordering": "-price"})
 
         serializer_data = BooksSerializer(
-            [self.book_3, self.book_2, self.book_1], many=True
+            [self.book_3, self.book_2, self.book_1],
+            many=True,
+            exclude=BookViewSet.detail_only_fields,
         ).data
         self.assertEqual(status.HTTP_200_OK, response.status_code)
-        self.assertEqual(serializer_data, response.data)
+        self.assertEqual(serializer_data, response.data["results"])
 
     def test_create(self):
         self.assertEqual(Book.objects.all().count(), 3)
@@ -212,6 +254,254 @@ class BooksTestCase(APITestCase):
         self.assertEqual(Book.objects.all().count(), 2)
 
 
+class BooksPaginationTestCase(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.books = [
+            Book.objects.create(name=name, price=price, author_name=author)
+            for name, price, author in (
+                ("Book E", 30, "Author 1"),
+                ("Book D", 10, "Author 2"),
+                ("Book C", 20, "Author 1"),
+                ("Book B", 10, "Author 2"),
+                ("Book A", 20, "Author 1"),
+            )
+        ]
+
+    def collect(self, data):
+        """Follow "next" links and return ids of every page."""
+        pages = []
+        url = reverse("book-list")
+        while url:
+            response = self.client.get(url, data=data)
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            pages.append([book["id"] for book in response.data["results"]])
+            url, data = response.data["next"], None
+        return pages
+
+    def test_pages_by_id(self):
+        ids = [book.id for book in self.books]
+        self.assertEqual([ids[0:2], ids[2:4], ids[4:]], self.collect({"page_size": 2}))
+
+    def test_pages_with_ties(self):
+        e, d, c, b, a = (book.id for book in self.books)
+        self.assertEqual(
+            [[d, b], [c, a], [e]],
+            self.collect({"page_size": 2, "ordering": "price"}),
+        )
+        self.assertEqual(
+            [[e, a], [c, b], [d]],
+            self.collect({"page_size": 2, "ordering": "-price"}),
+        )
+        self.assertEqual(
+            [[e, c, a], [d, b]],
+            self.collect({"page_size": 3, "ordering": "author_name"}),
+        )
+
+    def test_pages_with_filters(self):
+        e, d, c, b, a = (book.id for book in self.books)
+        pages = self.collect(
+            {"page_size": 1, "ordering": "-name", "price": 20, "search": "Author 1"}
+        )
+        self.assertEqual([[c], [a]], pages)
+
+    def test_previous(self):
+        url = reverse("book-list")
+        first = self.client.get(url, data={"page_size": 2, "ordering": "name"})
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+
+        self.assertEqual(first.data["results"], back.data["results"])
+        self.assertIsNone(back.data["previous"])
+        self.assertEqual(
+            second.data["next"], self.client.get(back.data["next"]).data["next"]
+        )
+
+    def test_deep_page_query_budget(self):
+        response = self.client.get(reverse("book-list"), data={"page_size": 1})
+        for _ in range(3):
+            with self.assertMaxQueries(2):
+                response = self.client.get(response.data["next"])
+        self.assertEqual(self.books[3].id, response.data["results"][0]["id"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("book-list"), data={"cursor": "garbage"})
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+
+class BooksCacheTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="testusername")
+        self.book = Book.objects.create(
+            name="Test Book 1", price=25, author_name="Author 1", owner=self.user
+        )
+        response_cache_stats.reset()
+
+    def test_hit(self):
+        url = reverse("book-list")
+        response = self.client.get(url, data={"search": "Test", "ordering": "price"})
+        self.assertEqual("MISS", response["X-Cache"])
+
+        # Only the validators.
+        with self.assertNumQueries(1):
+            cached = self.client.get(
+                url, data={"ordering": "price ", "search": "Test", "price": ""}
+            )
+        self.assertEqual("HIT", cached["X-Cache"])
+        self.assertEqual(response.data, cached.data)
+        self.assertEqual(
+            {"hits": 1, "misses": 1, "hit_ratio": 0.5}, response_cache_stats.as_dict()
+        )
+
+    def test_different_params(self):
+        url = reverse("book-list")
+        self.client.get(url, data={"ordering": "price"})
+        response = self.client.get(url, data={"ordering": "-price"})
+        self.assertEqual("MISS", response["X-Cache"])
+
+    def test_invalidated_by_relation(self):
+        url = reverse("book-detail", args=(self.book.id,))
+        self.client.get(url)
+        self.assertEqual("HIT", self.client.get(url)["X-Cache"])
+
+        UserBookRelation.objects.create(user=self.user, book=self.book, like=True)
+
+        response = self.client.get(url)
+        self.assertEqual("MISS", response["X-Cache"])
+        self.assertEqual(1, response.data["likes_count"])
+
+    def test_invalidated_by_book(self):
+        url = reverse("book-list")
+        self.client.get(url)
+        self.client.force_login(self.user)
+        self.client.patch(
+            reverse("book-detail", args=(self.book.id,)),
+            data={"price": 30},
+            format="json",
+        )
+
+        response = self.client.get(url)
+        self.assertEqual("MISS", response["X-Cache"])
+        self.assertEqual("30.00", response.data["results"][0]["price"])
+
+    def test_stats_view(self):
+        url = reverse("book-list")
+        self.client.get(url)
+        self.client.get(url)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("response-cache"))
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse("response-cache"))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual({"hits": 1, "misses": 1, "hit_ratio": 0.5}, response.data)
+
+        response = self.client.delete(reverse("response-cache"))
+
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertEqual(0, response_cache_stats.as_dict()["misses"])
+
+    @override_settings(BOOKS_DATABASE_REPLICAS=[], BOOKS_AUTH_USER_CACHE_TIMEOUT=0)
+    def test_shared_cache_check(self):
+        self.assertEqual(
+            ["store.E004"], [error.id for error in check_shared_cache(None)]
+        )
+
+        with override_settings(BOOKS_CACHE_TIMEOUT=0):
+            self.assertEqual([], check_shared_cache(None))
+
+
+class BooksConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="testusername")
+        self.book_1 = Book.objects.create(
+            name="Test Book 1", price=25, author_name="Author 1", owner=self.user
+        )
+        self.book_2 = Book.objects.create(
+            name="Test Book 2", price=55, author_name="Author 2", owner=self.user
+        )
+
+    def test_detail_etag(self):
+        url = reverse("book-detail", args=(self.book_1.id,))
+        response = self.client.get(url)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, cached.status_code)
+        self.assertEqual(response["ETag"], cached["ETag"])
+
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, response.data["likes_count"])
+
+    def test_detail_last_modified(self):
+        url = reverse("book-detail", args=(self.book_1.id,))
+        response = self.client.get(url)
+
+        cached = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, cached.status_code)
+
+    def test_list_etag(self):
+        url = reverse("book-list")
+        response = self.client.get(url, data={"ordering": "price"})
+
+        cached = self.client.get(
+            url, data={"ordering": "price"}, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, cached.status_code)
+
+        other = self.client.get(
+            url, data={"ordering": "-price"}, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(status.HTTP_200_OK, other.status_code)
+
+    def test_etag_follows_database(self):
+        # Writes of other processes don't bump this process' books version.
+        detail_url = reverse("book-detail", args=(self.book_1.id,))
+        for url in (reverse("book-list"), detail_url):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                Book.objects.filter(pk=self.book_1.pk).update(
+                    likes_count=F("likes_count") + 1, modified=timezone.now()
+                )
+
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+                self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_no_validators_while_stale(self):
+        url = reverse("book-detail", args=(self.book_1.id,))
+        etag = self.client.get(url)["ETag"]
+
+        # Read from a replica right after a write, see may_be_stale.
+        with patch("store.mixins.may_be_stale", return_value=True):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotIn("ETag", response)
+        self.assertNotIn("Last-Modified", response)
+
+    def test_detail_malformed_pk(self):
+        for url in ("/book/abc/", "/book/events/"):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+    def test_list_etag_after_delete(self):
+        url = reverse("book-list")
+        response = self.client.get(url)
+        Book.objects.filter(pk=self.book_1.pk).delete()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, len(response.data["results"]))
+
+
 class BooksRelationTestCase(APITestCase):
     def setUp(self):
         self.user = User.objects.create(username="testusername")
@@ -242,3 +532,633 @@ class BooksRelationTestCase(APITestCase):
         relation = UserBookRelation.objects.get(user=self.user, book_id=self.book_1.id)
         self.assertTrue(relation.like)
         self.assertEqual(relation.rate, 5)
+
+    def test_like_updates_counters(self):
+        url = reverse("userbookrelation-detail", args=(self.book_1.id,))
+        self.client.force_login(self.user)
+
+        self.client.patch(url, data={"like": True, "rate": 4}, format="json")
+        self.client.force_login(self.user2)
+        self.client.patch(url, data={"like": True, "rate": 5}, format="json")
+        self.book_1.refresh_from_db()
+        self.assertEqual(2, self.book_1.likes_count)
+        self.assertEqual(Decimal("4.50"), self.book_1.rating)
+
+        self.client.patch(url, data={"like": False, "rate": 3}, format="json")
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.likes_count)
+        self.assertEqual(7, self.book_1.rate_sum)
+        self.assertEqual(2, self.book_1.rate_count)
+        self.assertEqual(Decimal("3.50"), self.book_1.rating)
+
+        self.client.patch(url, data={"in_bookmarks": True}, format="json")
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.likes_count)
+        self.assertEqual(Decimal("3.50"), self.book_1.rating)
+
+    def test_rate_updates_histogram(self):
+        url = reverse("userbookrelation-detail", args=(self.book_1.id,))
+
+        def histogram():
+            self.book_1.refresh_from_db()
+            return [getattr(self.book_1, f"rate_{rate}_count") for rate in range(1, 6)]
+
+        self.client.force_login(self.user)
+        self.client.patch(url, data={"rate": 4}, format="json")
+        self.client.force_login(self.user2)
+        self.client.patch(url, data={"rate": 4}, format="json")
+        self.assertEqual([0, 0, 0, 2, 0], histogram())
+
+        self.client.patch(url, data={"rate": 1}, format="json")
+        self.assertEqual([1, 0, 0, 1, 0], histogram())
+
+        self.client.patch(url, data={"like": True}, format="json")
+        self.assertEqual([1, 0, 0, 1, 0], histogram())
+
+        self.client.patch(url, data={"rate": None}, format="json")
+        self.assertEqual([0, 0, 0, 1, 0], histogram())
+
+        UserBookRelation.objects.get(user=self.user, book=self.book_1).delete()
+        self.assertEqual([0, 0, 0, 0, 0], histogram())
+
+    def test_delete_relation_updates_counters(self):
+        UserBookRelation.objects.create(
+            user=self.user, book=self.book_1, like=True, rate=2
+        )
+        relation = UserBookRelation.objects.create(
+            user=self.user2, book=self.book_1, like=True, rate=5
+        )
+        relation.delete()
+
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.likes_count)
+        self.assertEqual(Decimal("2.00"), self.book_1.rating)
+
+        self.user.delete()
+        self.book_1.refresh_from_db()
+        self.assertEqual(0, self.book_1.likes_count)
+        self.assertEqual(0, self.book_1.rate_count)
+        self.assertIsNone(self.book_1.rating)
+
+    def test_patch_twice_keeps_one_relation(self):
+        url = reverse("userbookrelation-detail", args=(self.book_1.id,))
+        self.client.force_login(self.user)
+
+        self.client.patch(url, data={"like": True}, format="json")
+        response = self.client.patch(url, data={"rate": 3}, format="json")
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            {"book": self.book_1.id, "like": True, "in_bookmarks": False, "rate": 3},
+            response.data,
+        )
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book_1)
+        self.assertTrue(relation.like)
+        self.assertEqual(3, relation.rate)
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.likes_count)
+        self.assertEqual(1, self.book_1.rate_count)
+
+    def test_patch_queries(self):
+        url = reverse("userbookrelation-detail", args=(self.book_1.id,))
+        self.client.force_login(self.user)
+        self.client.patch(url, data={"like": True}, format="json")
+
+        # Session, user, locked read, upsert, counters, the change log entry
+        # and the savepoint pair.
+        with self.assertNumQueries(8):
+            self.client.patch(url, data={"like": False}, format="json")
+
+    def test_patch_unknown_book(self):
+        url = reverse("userbookrelation-detail", args=(self.book_2.id + 100,))
+        self.client.force_login(self.user)
+
+        response = self.client.patch(url, data={"like": True}, format="json")
+
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    def test_unique_relation(self):
+        UserBookRelation.objects.create(user=self.user, book=self.book_1)
+        with self.assertRaises(IntegrityError):
+            UserBookRelation.objects.create(user=self.user, book=self.book_1)
+
+
+class BooksLeaderboardTestCase(APITestCase):
+    def setUp(self):
+        users = [User.objects.create(username=f"user{i}") for i in range(10)]
+        self.book_1 = Book.objects.create(name="Book 1", price=25, author_name="A")
+        self.book_2 = Book.objects.create(name="Book 2", price=15, author_name="B")
+        self.book_3 = Book.objects.create(name="Book 3", price=35, author_name="C")
+        # One perfect vote loses to many good ones.
+        UserBookRelation.objects.create(user=users[0], book=self.book_1, rate=5)
+        for user in users:
+            UserBookRelation.objects.create(
+                user=user, book=self.book_2, rate=4, in_bookmarks=True
+            )
+        for user in users[:3]:
+            UserBookRelation.objects.create(user=user, book=self.book_3, like=True)
+
+    def top(self, board, **params):
+        response = self.client.get(reverse("book-top", args=(board,)), data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(board, response.data["board"])
+        return response.data["results"]
+
+    def test_rated(self):
+        results = self.top("rated")
+
+        self.assertEqual(
+            [self.book_2.id, self.book_1.id, self.book_3.id],
+            [book["id"] for book in results],
+        )
+        self.assertEqual(
+            ["3.5000", "3.1818", "3.0000"],
+            [book["weighted_rating"] for book in results],
+        )
+
+    def test_liked_and_bookmarked(self):
+        results = self.top("liked", limit=1)
+        self.assertEqual(
+            [(self.book_3.id, 3)], [(b["id"], b["likes_count"]) for b in results]
+        )
+
+        results = self.top("bookmarked", limit=2, fields="id,bookmarks_count")
+        self.assertEqual(
+            [
+                {"id": self.book_2.id, "bookmarks_count": 10},
+                {"id": self.book_1.id, "bookmarks_count": 0},
+            ],
+            results,
+        )
+
+    def test_follows_relation_writes(self):
+        self.top("liked")
+        for index in range(4):
+            user = User.objects.create(username=f"late{index}")
+            UserBookRelation.objects.create(user=user, book=self.book_1, like=True)
+
+        results = self.top("liked")
+
+        self.assertEqual(
+            [self.book_1.id, self.book_3.id, self.book_2.id],
+            [book["id"] for book in results],
+        )
+
+    def test_queries(self):
+        # The top K, no aggregation whatever the number of relations.
+        with self.assertNumQueries(1):
+            self.top("rated")
+        with self.assertNumQueries(0):
+            self.top("rated")
+
+    def test_invalid(self):
+        response = self.client.get(reverse("book-top", args=("rated",)), {"limit": 0})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+        response = self.client.get("/book/top/unknown/")
+        self.assertEqual(status.HTTP_404_NOT_FOUND, response.status_code)
+
+
+class BooksRelationBulkTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="testusername")
+        self.books = [
+            Book.objects.create(name=f"Book {i}", price=10, author_name="Author")
+            for i in range(40)
+        ]
+        self.url = reverse("userbookrelation-bulk")
+        self.client.force_login(self.user)
+
+    def test_bulk(self):
+        UserBookRelation.objects.create(
+            user=self.user, book=self.books[1], like=True, rate=2
+        )
+        data = [
+            {"book": self.books[0].id, "like": True, "rate": 5},
+            {"book": self.books[1].id, "like": False},
+            {"book": self.books[2].id, "rate": 9},
+            {"book": 100500, "in_bookmarks": True},
+            {"book": self.books[0].id, "in_bookmarks": True},
+        ]
+
+        response = self.client.post(self.url, data=data, format="json")
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        results = response.data["results"]
+        self.assertEqual(
+            [200, 200, 400, 404, 200], [result["status"] for result in results]
+        )
+        self.assertEqual(
+            {
+                "book": self.books[0].id,
+                "like": True,
+                "in_bookmarks": True,
+                "rate": 5,
+            },
+            results[0]["data"],
+        )
+        self.assertEqual(
+            {"book": self.books[1].id, "like": False, "in_bookmarks": False, "rate": 2},
+            results[1]["data"],
+        )
+        self.assertIn("rate", results[2]["errors"])
+
+        self.assertEqual(2, UserBookRelation.objects.count())
+        counters = Book.objects.filter(pk__in=[self.books[0].id, self.books[1].id])
+        self.assertEqual(
+            [(1, 5, 1, Decimal("5.00")), (0, 2, 1, Decimal("2.00"))],
+            list(
+                counters.order_by("id").values_list(
+                    "likes_count", "rate_sum", "rate_count", "rating"
+                )
+            ),
+        )
+        # Each book changes other histogram columns, the rest stay as they are.
+        self.assertEqual(
+            [(0, 0, 1), (1, 0, 0)],
+            list(
+                counters.order_by("id").values_list(
+                    "rate_2_count", "rate_4_count", "rate_5_count"
+                )
+            ),
+        )
+
+    def test_bulk_constant_queries(self):
+        data = [{"book": book.id, "like": True} for book in self.books[:5]]
+        # Caches the user, which the first request reads from the database.
+        self.client.post(self.url, data=data[:1], format="json")
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, data=data, format="json")
+
+        data = [
+            {"book": book.id, "like": True, "in_bookmarks": True} for book in self.books
+        ]
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(self.url, data=data, format="json")
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(40, len(response.data["results"]))
+        self.assertEqual(40, UserBookRelation.objects.filter(in_bookmarks=True).count())
+        self.assertEqual(40, Book.objects.filter(likes_count=1).count())
+
+    def test_bulk_not_a_list(self):
+        response = self.client.post(self.url, data={"book": 1}, format="json")
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+class BooksUserRelationTestCase(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="testusername")
+        self.user2 = User.objects.create(username="testusername2")
+        self.book_1 = Book.objects.create(name="Book 1", price=25, author_name="A")
+        self.book_2 = Book.objects.create(name="Book 2", price=55, author_name="B")
+        UserBookRelation.objects.create(
+            user=self.user, book=self.book_1, like=True, rate=4
+        )
+        UserBookRelation.objects.create(
+            user=self.user2, book=self.book_2, in_bookmarks=True
+        )
+        self.url = reverse("book-list")
+        self.data = {"with_user_relation": "true"}
+
+    def test_authenticated(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, data=self.data)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            [
+                {"like": True, "in_bookmarks": False, "rate": 4},
+                {"like": False, "in_bookmarks": False, "rate": None},
+            ],
+            [book["user_relation"] for book in response.data["results"]],
+        )
+
+    def test_no_per_row_queries(self):
+        self.client.force_login(self.user)
+        for i in range(20):
+            book = Book.objects.create(name=f"Book {i}", price=i, author_name="C")
+            UserBookRelation.objects.create(user=self.user, book=book, like=True)
+
+        # Session, user and the page itself.
+        with self.assertMaxQueries(3):
+            response = self.client.get(self.url, data=self.data)
+        self.assertEqual(22, len(response.data["results"]))
+
+    def test_anonymous(self):
+        with self.assertMaxQueries(1):
+            response = self.client.get(self.url, data=self.data)
+
+        self.assertEqual(
+            [None, None], [book["user_relation"] for book in response.data["results"]]
+        )
+
+    def test_cache_is_per_user(self):
+        self.client.force_login(self.user)
+        self.client.get(self.url, data=self.data)
+        self.client.force_login(self.user2)
+
+        response = self.client.get(self.url, data=self.data)
+
+        self.assertEqual("MISS", response["X-Cache"])
+        self.assertEqual(
+            {"like": False, "in_bookmarks": True, "rate": None},
+            response.data["results"][1]["user_relation"],
+        )
+
+    def test_detail(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("book-detail", args=(self.book_1.id,)), data=self.data
+        )
+        self.assertEqual(
+            {"like": True, "in_bookmarks": False, "rate": 4},
+            response.data["user_relation"],
+        )
+
+
+class BooksSparseFieldsTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="testusername")
+        self.book_1 = Book.objects.create(name="Book 1", price=25, author_name="A")
+        self.book_2 = Book.objects.create(name="Book 2", price=15, author_name="B")
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True)
+        self.url = reverse("book-list")
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                self.url, data={"fields": "id,name,price", "ordering": "-price"}
+            )
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            [
+                {"id": self.book_1.id, "name": "Book 1", "price": "25.00"},
+                {"id": self.book_2.id, "name": "Book 2", "price": "15.00"},
+            ],
+            response.data["results"],
+        )
+        page_sql = context.captured_queries[-1]["sql"]
+        self.assertNotIn("likes_count", page_sql)
+        self.assertNotIn("author_name", page_sql)
+
+    def test_detail_fields(self):
+        response = self.client.get(
+            reverse("book-detail", args=(self.book_1.id,)),
+            data={"fields": "annotated_likes"},
+        )
+        self.assertEqual({"annotated_likes": 1}, response.data)
+
+    def test_user_relation_field(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, data={"fields": "id,user_relation"})
+        self.assertEqual(
+            {
+                "id": self.book_1.id,
+                "user_relation": {"like": True, "in_bookmarks": False, "rate": None},
+            },
+            response.data["results"][0],
+        )
+
+    def test_without_user_relation_field(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                self.url, data={"fields": "id", "with_user_relation": "true"}
+            )
+        self.assertEqual({"id": self.book_1.id}, response.data["results"][0])
+        self.assertNotIn("JOIN", context.captured_queries[-1]["sql"])
+
+    def test_rating_histogram(self):
+        UserBookRelation.objects.filter(book=self.book_1).update(rate=5)
+        Book.objects.filter(pk=self.book_1.pk).update(rate_5_count=1)
+        histogram = {"1": 0, "2": 0, "3": 0, "4": 0, "5": 1}
+
+        response = self.client.get(reverse("book-detail", args=(self.book_1.id,)))
+        self.assertEqual(histogram, response.data["rating_histogram"])
+
+        # Lists leave it out unless asked for, both paths read the columns.
+        response = self.client.get(self.url)
+        self.assertNotIn("rating_histogram", response.data["results"][0])
+        for values_read_path in (True, False):
+            with self.subTest(values_read_path=values_read_path):
+                cache.clear()
+                with self.settings(BOOKS_VALUES_READ_PATH=values_read_path):
+                    # The validators and the page, no query per book.
+                    with self.assertNumQueries(2):
+                        response = self.client.get(
+                            self.url, data={"fields": "id,rating_histogram"}
+                        )
+                self.assertEqual(
+                    {"id": self.book_1.id, "rating_histogram": histogram},
+                    response.data["results"][0],
+                )
+
+    def test_unknown_field(self):
+        response = self.client.get(self.url, data={"fields": "id,owner"})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+class BooksExportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="testusername")
+        self.book_1 = Book.objects.create(
+            name="Test book 1", price=25, author_name="Author 1"
+        )
+        self.book_2 = Book.objects.create(
+            name='Book "2", with comma', price=55, author_name="Author 5"
+        )
+        self.book_3 = Book.objects.create(
+            name="Test book Author 1", price=55, author_name="Author 2"
+        )
+        UserBookRelation.objects.create(
+            user=self.user, book=self.book_1, like=True, rate=4
+        )
+        self.url = reverse("book-export")
+
+    def export(self, **params):
+        response = self.client.get(self.url, data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode("utf-8")
+
+    def test_ndjson(self):
+        response, content = self.export()
+
+        self.assertEqual("application/x-ndjson", response["Content-Type"])
+        self.assertEqual(
+            'attachment; filename="books.ndjson"', response["Content-Disposition"]
+        )
+        self.assertEqual(
+            self.client.get(reverse("book-list")).data["results"],
+            [json.loads(line) for line in content.splitlines()],
+        )
+        self.assertEqual(
+            {
+                "id": self.book_1.id,
+                "name": "Test book 1",
+                "price": "25.00",
+                "author_name": "Author 1",
+                "likes_count": 1,
+                "annotated_likes": 1,
+                "rating": "4.00",
+            },
+            json.loads(content.splitlines()[0]),
+        )
+
+    def test_csv(self):
+        response, content = self.export(type="csv", fields="id,name,rating")
+
+        self.assertEqual("text/csv; charset=utf-8", response["Content-Type"])
+        self.assertEqual(
+            [
+                ["id", "name", "rating"],
+                [str(self.book_1.id), "Test book 1", "4.00"],
+                [str(self.book_2.id), 'Book "2", with comma', ""],
+                [str(self.book_3.id), "Test book Author 1", ""],
+            ],
+            list(csv.reader(io.StringIO(content))),
+        )
+
+    def test_csv_rating_histogram(self):
+        _, content = self.export(type="csv", fields="id,rating_histogram")
+
+        self.assertEqual(
+            [str(self.book_1.id), '{"1": 0, "2": 0, "3": 0, "4": 1, "5": 0}'],
+            list(csv.reader(io.StringIO(content)))[1],
+        )
+
+    def test_filters(self):
+        _, content = self.export(price=55, search="author 1", fields="id")
+
+        self.assertEqual(f'{{"id":{self.book_3.id}}}\n', content)
+
+    def test_streamed(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, HTTP_ACCEPT="text/csv")
+
+        # Nothing is read before the body is consumed.
+        self.assertEqual(0, len(context))
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(3, len(b"".join(response.streaming_content).splitlines()))
+
+    def test_invalid(self):
+        for params in (
+            {"type": "xml"},
+            {"fields": "unknown"},
+            {"with_user_relation": "true"},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, data=params)
+                self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+
+class BooksImportTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="testusername")
+        self.url = reverse("book-import")
+        self.client.force_authenticate(self.user)
+
+    def post(self, content, content_type, **params):
+        url = self.url
+        if params:
+            url += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+        return self.client.generic("POST", url, content, content_type=content_type)
+
+    def test_csv(self):
+        content = (
+            "name,price,author_name\n"
+            "Book 1,25.50,Author 1\n"
+            "Book 2,cheap,Author 2\n"
+            '"Book 3, second edition",10,Author 3\n'
+        )
+
+        response = self.post(content, "text/csv")
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            {
+                "rows": 3,
+                "created": 2,
+                "error_count": 1,
+                "errors": [
+                    {
+                        "row": 2,
+                        "errors": {
+                            "price": [
+                                ErrorDetail("A valid number is required.", "invalid")
+                            ]
+                        },
+                    }
+                ],
+            },
+            response.data,
+        )
+        self.assertEqual(
+            [
+                ("Book 1", Decimal("25.50"), self.user.id),
+                ("Book 3, second edition", Decimal("10.00"), self.user.id),
+            ],
+            list(Book.objects.values_list("name", "price", "owner").order_by("id")),
+        )
+        response = self.client.get(reverse("book-list"), data={"search": "edition"})
+        self.assertEqual(
+            ["Book 3, second edition"], [b["name"] for b in response.data["results"]]
+        )
+
+    def test_ndjson(self):
+        content = (
+            '{"name": "Book 1", "price": 25, "author_name": "Author 1"}\n'
+            "\n"
+            "not json\n"
+            "[1, 2]\n"
+            '{"name": "Book 2", "price": 5, "author_name": "Author 2", "id": 100}\n'
+        )
+
+        response = self.post(content, "text/plain", type="ndjson")
+
+        self.assertEqual(4, response.data["rows"])
+        self.assertEqual(2, response.data["created"])
+        self.assertEqual([2, 3], [error["row"] for error in response.data["errors"]])
+        self.assertFalse(Book.objects.filter(id=100).exists())
+
+    @override_settings(BOOKS_IMPORT_BATCH_SIZE=2)
+    def test_batches(self):
+        content = "".join(
+            f'{{"name": "Book {i}", "price": 1, "author_name": "A"}}\n'
+            for i in range(5)
+        )
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.post(content, "application/x-ndjson")
+
+        self.assertEqual(5, response.data["created"])
+        inserts = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith('INSERT INTO "store_book"')
+        ]
+        self.assertEqual(3, len(inserts))
+
+    def test_invalid_encoding(self):
+        response = self.post(
+            b"name,price,author_name\nBook 1,1,A\nBook \xff,1,A\n", "text/csv"
+        )
+
+        self.assertEqual(1, response.data["created"])
+        self.assertEqual(2, response.data["errors"][0]["row"])
+
+    def test_unknown_type(self):
+        response = self.post("name\n", "application/json")
+
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+
+        response = self.post("name,price,author_name\nBook,1,A\n", "text/csv")
+
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertFalse(Book.objects.exists())
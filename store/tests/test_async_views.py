@@ -0,0 +1,146 @@
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser, User
+from django.test import TestCase
+from django.urls import reverse
+
+from store.auth import forget_user
+from store.models import Book, UserBookRelation
+from store.permissions import IsOwnerOrStaffOrReadOnly, ahas_object_permission
+
+
+class AsyncBookViewTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="test_username")
+        self.book_1 = Book.objects.create(
+            name="Test book 1", price=25, author_name="Author 1", owner=self.user
+        )
+        self.book_2 = Book.objects.create(
+            name="Test book 2", price=55, author_name="Author 5"
+        )
+        self.book_3 = Book.objects.create(
+            name="Test book Author 1", price=55, author_name="Author 2"
+        )
+        UserBookRelation.objects.create(user=self.user, book=self.book_1, like=True)
+
+    async def assertSameResponse(self, sync_url, async_url, data=None):
+        expected = await sync_to_async(self.client.get)(sync_url, data)
+        response = await self.async_client.get(async_url, data)
+
+        self.assertEqual(expected.status_code, response.status_code)
+        self.assertEqual(expected["Content-Type"], response["Content-Type"])
+        # Next/previous links differ by the path only.
+        self.assertEqual(
+            expected.content.replace(sync_url.encode(), async_url.encode()),
+            response.content,
+        )
+        return expected, response
+
+    async def test_list(self):
+        for data in (
+            None,
+            {"price": 55},
+            {"search": "author 1"},
+            {"ordering": "-price", "page_size": 1},
+            {"fields": "name,rating"},
+            {"fields": "unknown"},
+            {"cursor": "broken"},
+        ):
+            with self.subTest(data=data):
+                await self.assertSameResponse(
+                    reverse("book-list"), reverse("async-book-list"), data
+                )
+
+    async def test_pages(self):
+        url = reverse("async-book-list")
+        response = await self.async_client.get(url, {"page_size": 2})
+        next_url = response.json()["next"]
+
+        self.assertIn(url, next_url)
+
+        response = await self.async_client.get(next_url)
+
+        self.assertEqual(
+            [self.book_3.id], [b["id"] for b in response.json()["results"]]
+        )
+
+    async def test_retrieve(self):
+        for pk in (self.book_1.id, self.book_2.id + 100):
+            with self.subTest(pk=pk):
+                await self.assertSameResponse(
+                    reverse("book-detail", args=(pk,)),
+                    reverse("async-book-detail", args=(pk,)),
+                )
+
+    async def test_conditional(self):
+        for sync_url, async_url in (
+            (reverse("book-list"), reverse("async-book-list")),
+            (
+                reverse("book-detail", args=(self.book_1.id,)),
+                reverse("async-book-detail", args=(self.book_1.id,)),
+            ),
+        ):
+            with self.subTest(url=async_url):
+                expected, response = await self.assertSameResponse(sync_url, async_url)
+                self.assertEqual(expected["ETag"], response["ETag"])
+                self.assertEqual(expected["Last-Modified"], response["Last-Modified"])
+
+                response = await self.async_client.get(
+                    async_url, **{"If-None-Match": response["ETag"]}
+                )
+
+                self.assertEqual(304, response.status_code)
+
+    async def test_logged_in(self):
+        await sync_to_async(self.client.force_login)(self.user)
+        await sync_to_async(self.async_client.force_login)(self.user)
+        for sync_url, async_url in (
+            (reverse("book-list"), reverse("async-book-list")),
+            (
+                reverse("book-detail", args=(self.book_1.id,)),
+                reverse("async-book-detail", args=(self.book_1.id,)),
+            ),
+        ):
+            with self.subTest(url=async_url):
+                # Not cached, the user comes from the database.
+                forget_user(self.user.pk)
+                response = await self.async_client.get(async_url)
+                expected = await sync_to_async(self.client.get)(sync_url)
+
+                self.assertEqual(200, response.status_code)
+                self.assertEqual(
+                    expected.content.replace(sync_url.encode(), async_url.encode()),
+                    response.content,
+                )
+
+    async def test_user_relation_fallback(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+
+        response = await self.async_client.get(
+            reverse("async-book-detail", args=(self.book_1.id,)),
+            {"with_user_relation": "true"},
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            {"like": True, "in_bookmarks": False, "rate": None},
+            response.json()["user_relation"],
+        )
+
+    async def test_object_permission(self):
+        permission = IsOwnerOrStaffOrReadOnly()
+        book = Book(pk=1, owner_id=self.user.pk)
+        for method, user, allowed in (
+            ("GET", AnonymousUser(), True),
+            ("PUT", AnonymousUser(), False),
+            ("PUT", self.user, True),
+            ("PUT", User(pk=self.user.pk + 1), False),
+            ("PUT", User(pk=self.user.pk + 1, is_staff=True), True),
+        ):
+            request = SimpleNamespace(method=method, user=user)
+            with self.subTest(method=method, user=user):
+                self.assertEqual(
+                    allowed,
+                    await ahas_object_permission(permission, request, None, book),
+                )
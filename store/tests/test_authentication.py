@@ -0,0 +1,156 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.authentication import REVOKED_TOKENS_KEY, issue_tokens, make_token
+from store.models import Book, RevokedToken
+
+
+def auth_queries(context):
+    return [
+        query["sql"]
+        for query in context.captured_queries
+        if any(
+            table in query["sql"]
+            for table in ("auth_user", "django_session", "revokedtoken")
+        )
+    ]
+
+
+class TokenAuthenticationTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username="owner")
+        self.other = User.objects.create(username="other")
+        self.book = Book.objects.create(
+            name="Book", price=10, author_name="Author", owner=self.owner
+        )
+        self.url = reverse("book-detail", args=(self.book.id,))
+
+    def bearer(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def refresh(self, token):
+        return self.client.post(
+            reverse("token-refresh"), data={"refresh": token}, format="json"
+        )
+
+    def test_obtain(self):
+        url = reverse("token-obtain")
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.post(url).status_code)
+
+        self.client.force_login(self.owner)
+        response = self.client.post(url)
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual("Bearer", response.data["token_type"])
+        self.assertEqual(300, response.data["expires_in"])
+
+        # An access token doesn't mint new tokens.
+        self.client.logout()
+        self.bearer(response.data["access"])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.post(url).status_code)
+
+    def test_no_auth_queries(self):
+        self.bearer(issue_tokens(self.owner)["access"])
+        self.client.get(reverse("book-list"))
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse("book-list"), {"with_user_relation": "true"}
+            )
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+            response = self.client.patch(
+                self.url, data={"price": "11.00"}, format="json"
+            )
+            self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+        self.assertEqual([], auth_queries(context))
+        self.book.refresh_from_db()
+        self.assertEqual("11.00", str(self.book.price))
+
+    def test_owner_and_staff(self):
+        self.bearer(issue_tokens(self.other)["access"])
+        response = self.client.patch(self.url, data={"price": "11.00"}, format="json")
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        # The staff flag travels in the token.
+        self.other.is_staff = True
+        self.other.save()
+        response = self.client.patch(self.url, data={"price": "11.00"}, format="json")
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        self.bearer(issue_tokens(self.other)["access"])
+        response = self.client.patch(self.url, data={"price": "11.00"}, format="json")
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_invalid_tokens(self):
+        tokens = {
+            "expired": make_token(self.owner, "access", timedelta(seconds=-1)),
+            "refresh": issue_tokens(self.owner)["refresh"],
+            "garbage": "not.a.token",
+        }
+        with override_settings(BOOKS_JWT_SIGNING_KEY="other key"):
+            tokens["foreign"] = issue_tokens(self.owner)["access"]
+
+        for name, token in tokens.items():
+            with self.subTest(token=name):
+                self.bearer(token)
+                response = self.client.get(reverse("book-list"))
+                self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_refresh(self):
+        tokens = issue_tokens(self.owner)
+
+        response = self.refresh(tokens["refresh"])
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.bearer(response.data["access"])
+        response = self.client.patch(self.url, data={"price": "11.00"}, format="json")
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # Refresh tokens are used once.
+        response = self.refresh(tokens["refresh"])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        self.client.credentials()
+        self.owner.is_active = False
+        self.owner.save()
+        response = self.refresh(issue_tokens(self.owner)["refresh"])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    def test_concurrent_refresh(self):
+        tokens = issue_tokens(self.owner)
+        self.assertEqual(
+            status.HTTP_200_OK, self.refresh(tokens["refresh"]).status_code
+        )
+
+        # Another process, its cached list doesn't have the token yet.
+        cache.set(REVOKED_TOKENS_KEY, frozenset())
+        response = self.refresh(tokens["refresh"])
+
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertEqual(1, RevokedToken.objects.count())
+
+    def test_revoke(self):
+        tokens = issue_tokens(self.owner)
+        self.bearer(tokens["access"])
+        self.client.get(reverse("book-list"))
+
+        response = self.client.post(
+            reverse("token-revoke"), data={"refresh": tokens["refresh"]}, format="json"
+        )
+
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertEqual(2, RevokedToken.objects.count())
+        response = self.client.get(reverse("book-list"))
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.client.credentials()
+        response = self.refresh(tokens["refresh"])
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
@@ -0,0 +1,177 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store import logic
+from store.buffer import relation_buffer
+from store.models import Book, UserBookRelation
+
+
+@override_settings(
+    BOOKS_RELATION_BUFFER_ENABLED=True,
+    BOOKS_RELATION_BUFFER_MAX_ITEMS=3,
+    BOOKS_RELATION_BUFFER_FLUSH_INTERVAL=None,
+)
+class RelationWriteBufferTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="test_username")
+        self.book_1 = Book.objects.create(
+            name="Test book 1", price=25, author_name="Author 1"
+        )
+        self.book_2 = Book.objects.create(
+            name="Test book 2", price=55, author_name="Author 2"
+        )
+        self.client.force_authenticate(self.user)
+        relation_buffer.reset_stats()
+
+    def tearDown(self):
+        relation_buffer.flush()
+
+    def patch(self, book_id, data):
+        return self.client.patch(
+            reverse("userbookrelation-detail", args=(book_id,)), data, format="json"
+        )
+
+    def test_buffered(self):
+        response = self.patch(self.book_1.id, {"like": True})
+
+        self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
+        self.assertEqual({"book": self.book_1.id, "like": True}, response.data)
+        self.assertFalse(UserBookRelation.objects.exists())
+
+        self.assertEqual(1, relation_buffer.flush())
+
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book_1)
+        self.assertTrue(relation.like)
+        self.book_1.refresh_from_db()
+        self.assertEqual(1, self.book_1.likes_count)
+
+    def test_read_your_writes(self):
+        url = reverse("book-detail", args=(self.book_1.id,))
+        self.client.get(url, data={"with_user_relation": "true"})
+        self.patch(self.book_1.id, {"in_bookmarks": True})
+
+        response = self.client.get(url, data={"with_user_relation": "true"})
+
+        self.assertEqual(
+            {"like": False, "in_bookmarks": True, "rate": None},
+            response.data["user_relation"],
+        )
+
+        other = User.objects.create(username="other")
+        self.client.force_authenticate(other)
+        response = self.client.get(url, data={"with_user_relation": "true"})
+
+        self.assertFalse(response.data["user_relation"]["in_bookmarks"])
+
+    def test_coalescing(self):
+        for like in (True, False, True):
+            self.patch(self.book_1.id, {"like": like})
+
+        relation_buffer.flush()
+
+        self.assertEqual(1, UserBookRelation.objects.count())
+        stats = relation_buffer.as_dict()
+        self.assertEqual(3, stats["received"])
+        self.assertEqual(1, stats["written"])
+        self.assertEqual(3, stats["coalescing_ratio"])
+        self.assertEqual(1, stats["flushes"])
+        self.assertEqual(0, stats["depth"])
+
+    def test_flush_on_size(self):
+        book_3 = Book.objects.create(name="Test book 3", price=5, author_name="A")
+
+        for book in (self.book_1, self.book_2):
+            self.patch(book.id, {"like": True})
+
+        self.assertEqual(2, relation_buffer.as_dict()["depth"])
+
+        self.patch(book_3.id, {"like": True})
+
+        self.assertEqual(3, UserBookRelation.objects.filter(like=True).count())
+        self.assertEqual(0, relation_buffer.as_dict()["depth"])
+        self.assertEqual(3, relation_buffer.as_dict()["max_depth"])
+
+    def test_direct_write_applies_pending(self):
+        self.patch(self.book_1.id, {"like": True})
+
+        response = self.patch(self.book_1.id, {"rate": 4})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            {"book": self.book_1.id, "like": True, "in_bookmarks": False, "rate": 4},
+            response.data,
+        )
+        self.assertEqual(0, relation_buffer.as_dict()["depth"])
+
+    def test_bulk_applies_pending(self):
+        self.patch(self.book_1.id, {"like": True})
+
+        self.client.post(
+            reverse("userbookrelation-bulk"),
+            [{"book": self.book_1.id, "rate": 2}],
+            format="json",
+        )
+
+        relation = UserBookRelation.objects.get(user=self.user, book=self.book_1)
+        self.assertEqual((True, 2), (relation.like, relation.rate))
+        self.assertEqual(0, relation_buffer.as_dict()["depth"])
+
+    def test_unknown_book(self):
+        response = self.patch(self.book_2.id + 100, {"like": True})
+
+        self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
+        self.assertEqual(0, relation_buffer.flush())
+        self.assertFalse(UserBookRelation.objects.exists())
+
+    def test_failed_flush(self):
+        self.patch(self.book_1.id, {"like": True})
+
+        with mock.patch("store.buffer.upsert_relations", side_effect=OperationalError):
+            with self.assertLogs("store.buffer", "ERROR"):
+                self.assertEqual(0, relation_buffer.flush())
+
+        self.assertEqual(1, relation_buffer.as_dict()["errors"])
+        self.assertEqual(1, relation_buffer.as_dict()["depth"])
+
+        relation_buffer.flush()
+
+        self.assertTrue(UserBookRelation.objects.get(book=self.book_1).like)
+
+    def test_rejected_changes(self):
+        self.patch(self.book_1.id, {"like": True})
+        self.patch(self.book_2.id, {"like": True})
+
+        def upsert_relations(user, changes_by_book):
+            if self.book_2.id in changes_by_book:
+                raise IntegrityError
+            return logic.upsert_relations(user, changes_by_book)
+
+        with mock.patch("store.buffer.upsert_relations", upsert_relations):
+            with self.assertLogs("store.buffer", "ERROR") as logs:
+                self.assertEqual(1, relation_buffer.flush())
+
+        self.assertIn(f"with books [{self.book_2.id}]", logs.output[0])
+        stats = relation_buffer.as_dict()
+        self.assertEqual((1, 1, 0), (stats["errors"], stats["dropped"], stats["depth"]))
+        self.assertTrue(UserBookRelation.objects.get(book=self.book_1).like)
+        self.assertFalse(UserBookRelation.objects.filter(book=self.book_2).exists())
+
+    def test_stats_view(self):
+        self.patch(self.book_1.id, {"like": True})
+        response = self.client.get(reverse("relation-buffer"))
+
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse("relation-buffer"))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(1, response.data["depth"])
+        self.assertEqual(1, response.data["received"])
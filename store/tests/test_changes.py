@@ -0,0 +1,111 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.logic import upsert_relation
+from store.models import Book, BookChange, BookChangeCompaction
+
+
+@override_settings(BOOKS_CHANGES_SETTLE_SECONDS=0)
+class BookChangesTestCase(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="reader")
+        self.books = [
+            Book.objects.create(name=f"Book {i}", price=10, author_name="Author")
+            for i in range(3)
+        ]
+        self.url = reverse("book-changes")
+
+    def changes(self, since, **params):
+        response = self.client.get(self.url, {"since": since, **params})
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return response.data
+
+    def test_sync(self):
+        book_1, book_2, book_3 = self.books
+
+        with self.assertNumQueries(3):
+            data = self.changes(0)
+
+        self.assertEqual(
+            [book.id for book in self.books], [b["id"] for b in data["results"]]
+        )
+        self.assertEqual([], data["deleted"])
+        self.assertFalse(data["more"])
+        token = data["token"]
+        self.assertEqual(
+            {"token": token, "more": False, "results": [], "deleted": []},
+            self.changes(token),
+        )
+
+        upsert_relation(self.user, book_1.id, {"like": True})
+        upsert_relation(self.user, book_1.id, {"rate": 5})
+        deleted_id = book_2.id
+        book_2.delete()
+        data = self.changes(token)
+
+        [book] = data["results"]
+        self.assertEqual(book_1.id, book["id"])
+        self.assertEqual(1, book["annotated_likes"])
+        self.assertEqual("5.00", book["rating"])
+        self.assertEqual([deleted_id], data["deleted"])
+        self.assertGreater(int(data["token"]), int(token))
+
+    def test_pages(self):
+        data = self.changes(0, limit=2)
+
+        self.assertTrue(data["more"])
+        self.assertEqual(2, len(data["results"]))
+        data = self.changes(data["token"], limit=2)
+        self.assertFalse(data["more"])
+        self.assertEqual([self.books[2].id], [book["id"] for book in data["results"]])
+
+    def test_fields(self):
+        data = self.changes(0, fields="id,name")
+
+        self.assertEqual({"id", "name"}, set(data["results"][0]))
+
+    @override_settings(BOOKS_CHANGES_SETTLE_SECONDS=60)
+    def test_recent_changes_wait(self):
+        data = self.changes(0)
+
+        self.assertEqual([], data["results"])
+        self.assertEqual("0", data["token"])
+
+    def test_compaction(self):
+        token = self.changes(0)["token"]
+        for _ in range(3):
+            self.books[0].save()
+        self.books[1].save()
+
+        out = StringIO()
+        call_command("compact_book_changes", "--max-rows=1", stdout=out)
+
+        # The last change of every book is left, then the oldest ones go too.
+        compaction = BookChangeCompaction.objects.latest()
+        self.assertEqual(6, compaction.removed)
+        self.assertEqual(1, BookChange.objects.count())
+        self.assertIn("Removed 6 changes", out.getvalue())
+        response = self.client.get(self.url, {"since": token})
+        self.assertEqual(status.HTTP_410_GONE, response.status_code)
+        self.assertTrue(response.data["resync"])
+
+        head = response.data["token"]
+        self.assertEqual([], self.changes(head)["results"])
+        data = self.changes(compaction.horizon)
+        self.assertEqual([self.books[1].id], [book["id"] for book in data["results"]])
+
+        # Nothing to drop, tokens stay valid.
+        call_command("compact_book_changes", "--max-rows=1", stdout=out)
+        self.assertEqual(1, len(self.changes(compaction.horizon)["results"]))
+
+    def test_invalid(self):
+        for params in ({}, {"since": "x"}, {"since": "-1"}, {"since": 0, "limit": 0}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
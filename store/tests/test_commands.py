@@ -0,0 +1,208 @@
+import json
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command, CommandError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from store.cache import get_books_version
+from store.models import Book, BookChange, UserBookRelation
+
+
+class RebuildBookCountersTestCase(TestCase):
+    def setUp(self):
+        self.user_1 = User.objects.create(username="user1")
+        self.user_2 = User.objects.create(username="user2")
+        self.book = Book.objects.create(
+            name="Test Book 1", price=25, author_name="Test Author"
+        )
+        UserBookRelation.objects.create(
+            user=self.user_1, book=self.book, like=True, rate=4
+        )
+        UserBookRelation.objects.create(user=self.user_2, book=self.book, rate=3)
+
+    def test_check_valid(self):
+        out = StringIO()
+        call_command("rebuild_book_counters", "--check", stdout=out)
+        self.assertIn("All 1 books are valid.", out.getvalue())
+
+    def test_rebuild_stale(self):
+        Book.objects.filter(pk=self.book.pk).update(
+            likes_count=10,
+            rate_sum=0,
+            rate_count=0,
+            rating=None,
+            rate_1_count=3,
+            bookmarks_count=2,
+            weighted_rating=5,
+        )
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_book_counters", "--check", stdout=out)
+        self.assertIn(f"Book {self.book.pk}: stale counters", out.getvalue())
+        Book.objects.filter(pk=self.book.pk).update(
+            modified=timezone.now() - timedelta(hours=1)
+        )
+        version = get_books_version()
+
+        call_command("rebuild_book_counters", stdout=StringIO())
+
+        self.assertNotEqual(version, get_books_version())
+        self.book.refresh_from_db()
+        self.assertGreater(self.book.modified, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(1, self.book.likes_count)
+        self.assertEqual(7, self.book.rate_sum)
+        self.assertEqual(2, self.book.rate_count)
+        self.assertEqual(Decimal("3.50"), self.book.rating)
+        self.assertEqual(0, self.book.bookmarks_count)
+        self.assertEqual(Decimal("3.0833"), self.book.weighted_rating)
+        self.assertEqual(
+            (0, 0, 1, 1, 0),
+            (
+                self.book.rate_1_count,
+                self.book.rate_2_count,
+                self.book.rate_3_count,
+                self.book.rate_4_count,
+                self.book.rate_5_count,
+            ),
+        )
+
+    def test_rebuild_in_batches(self):
+        other = Book.objects.create(name="Test Book 2", price=5, author_name="B")
+        UserBookRelation.objects.create(user=self.user_1, book=other, like=True)
+        Book.objects.update(likes_count=5)
+        out = StringIO()
+
+        call_command("rebuild_book_counters", "--batch-size=1", stdout=out)
+
+        self.assertIn("Rebuilt 2 of 2 books.", out.getvalue())
+        likes = Book.objects.order_by("id").values_list("likes_count", flat=True)
+        self.assertEqual([1, 1], list(likes))
+        call_command("rebuild_book_counters", "--check", stdout=StringIO())
+
+
+class SeedAndBenchmarkTestCase(TestCase):
+    def test_seed(self):
+        call_command(
+            "seed_store",
+            "--books=50",
+            "--users=10",
+            "--relations-per-user=5",
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(50, Book.objects.count())
+        self.assertEqual(10, User.objects.count())
+        self.assertTrue(40 <= UserBookRelation.objects.count() <= 60)
+        call_command("rebuild_book_counters", "--check", stdout=StringIO())
+        # Books nobody has a relation with are in the change log too.
+        self.assertEqual(
+            set(Book.objects.values_list("id", flat=True)),
+            set(BookChange.objects.values_list("book_id", flat=True)),
+        )
+
+    def test_seed_is_reproducible(self):
+        call_command("seed_store", "--books=20", "--users=5", stdout=StringIO())
+        first = list(UserBookRelation.objects.values_list("like", "rate"))
+
+        call_command(
+            "seed_store", "--books=20", "--users=5", "--clear", stdout=StringIO()
+        )
+
+        self.assertEqual(
+            first, list(UserBookRelation.objects.values_list("like", "rate"))
+        )
+
+    @override_settings(ALLOWED_HOSTS=["localhost"])
+    def test_benchmark(self):
+        call_command("seed_store", "--books=20", "--users=5", stdout=StringIO())
+        out = StringIO()
+
+        call_command("bench_store_api", "--requests=3", stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(20, report["books"])
+        for scenario in report["scenarios"].values():
+            self.assertEqual({"200": 3}, scenario["statuses"])
+            self.assertLessEqual(scenario["p50_ms"], scenario["p99_ms"])
+
+    def test_serialization_benchmark(self):
+        out, err = StringIO(), StringIO()
+
+        call_command(
+            "bench_serialization", "--rows=20", "--repeat=1", stdout=out, stderr=err
+        )
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(20, report["rows"])
+        self.assertGreater(report["after"]["rows_per_sec"], 0)
+        # Both paths serialized the same rows to the same bytes.
+        self.assertEqual("", err.getvalue())
+
+
+# The async ORM queries from another thread, which has to see committed data.
+class AsgiBenchmarkTestCase(TransactionTestCase):
+    # Requests may read from replicas when there are any.
+    databases = "__all__"
+
+    def test_asgi_benchmark(self):
+        Book.objects.create(name="Test book", price=25, author_name="Author")
+        out = StringIO()
+
+        call_command(
+            "bench_asgi",
+            "--requests=4",
+            "--workers=2",
+            "--concurrency=1,2",
+            "--inline",
+            stdout=out,
+        )
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(
+            [("wsgi", 1), ("wsgi", 2), ("asgi", 1), ("asgi", 2)],
+            [(run["mode"], run["clients"]) for run in report["runs"]],
+        )
+
+
+class ImportBooksTestCase(TestCase):
+    def test_import(self):
+        user = User.objects.create(username="publisher")
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write("name,price,author_name\nBook 1,10,Author\nBook 2,,Author\n")
+            file.flush()
+            out, err = StringIO(), StringIO()
+
+            call_command(
+                "import_books", file.name, "--owner=publisher", stdout=out, stderr=err
+            )
+
+        self.assertIn("Imported 1 of 2 rows, 1 rejected.", out.getvalue())
+        self.assertIn("Row 2:", err.getvalue())
+        self.assertEqual(user, Book.objects.get().owner)
+
+    def test_unknown_type(self):
+        with self.assertRaises(CommandError):
+            call_command("import_books", "books.xml")
+
+    def test_benchmark(self):
+        out = StringIO()
+
+        call_command(
+            "bench_import",
+            "--rows=20",
+            "--batch-sizes=5,50",
+            "--baseline-rows=5",
+            stdout=out,
+        )
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(
+            ["one_by_one", "batch_5", "batch_50"],
+            [run["name"] for run in report["runs"]],
+        )
+        self.assertFalse(Book.objects.exists())
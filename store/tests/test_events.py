@@ -0,0 +1,201 @@
+import asyncio
+from unittest import mock
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from store.events import BookEventHub, BookEventsApp, get_event_backend
+from store.logic import upsert_relation
+from store.models import Book
+
+
+def parse_frame(frame):
+    fields = dict(
+        line.split(": ", 1) for line in frame.decode("utf-8").strip().split("\n")
+    )
+    return orjson.loads(fields["data"])
+
+
+class FakeApplication:
+    def __init__(self):
+        self.scopes = []
+
+    async def __call__(self, scope, receive, send):
+        self.scopes.append(scope)
+
+
+class EventStream:
+    """
+    Drives ``BookEventsApp`` like an ASGI server, collects what it sends.
+    """
+
+    def __init__(self, app, query_string, method="GET"):
+        self.messages = asyncio.Queue()
+        self.received = asyncio.Queue()
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": "/book/events/",
+            "query_string": query_string,
+        }
+        self.task = asyncio.ensure_future(app(scope, self.received.get, self.send))
+
+    async def send(self, message):
+        await self.messages.put(message)
+
+    async def next(self):
+        return await asyncio.wait_for(self.messages.get(), timeout=5)
+
+    async def close(self):
+        await self.received.put({"type": "http.disconnect"})
+        await asyncio.wait_for(self.task, timeout=5)
+
+
+@override_settings(BOOKS_EVENTS_FLUSH_INTERVAL=0.01, BOOKS_EVENTS_HEARTBEAT=60)
+class BookEventsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="reader")
+        self.book_1 = Book.objects.create(name="Book 1", price=10, author_name="A")
+        self.book_2 = Book.objects.create(name="Book 2", price=10, author_name="A")
+        self.django_app = FakeApplication()
+        self.app = BookEventsApp(self.django_app)
+        # Would end the test transaction, the test client skips it as well.
+        patcher = mock.patch("store.events.close_old_connections")
+        self.close_old_connections = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        if self.app.hub is not None:
+            get_event_backend().detach(self.app.hub)
+
+    @sync_to_async
+    def write(self, book, **changes):
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_relation(self.user, book.id, changes)
+
+    async def test_stream(self):
+        stream = EventStream(self.app, f"ids={self.book_1.id}".encode())
+
+        start = await stream.next()
+        self.assertEqual(200, start["status"])
+        self.assertIn((b"content-type", b"text/event-stream"), start["headers"])
+        snapshot = parse_frame((await stream.next())["body"])
+        self.assertEqual(
+            {"id": self.book_1.id, "annotated_likes": 0, "rating": None, "rates": 0},
+            snapshot,
+        )
+
+        # Merged into one event, other books' changes are not sent.
+        await self.write(self.book_1, like=True)
+        await self.write(self.book_1, rate=4)
+        await self.write(self.book_2, like=True)
+
+        event = parse_frame((await stream.next())["body"])
+        self.assertEqual(
+            {
+                "id": self.book_1.id,
+                "annotated_likes": 1,
+                "rating": "4.00",
+                "rates": 1,
+                "changes": {"annotated_likes": 1, "rates": 1},
+            },
+            event,
+        )
+        self.assertTrue(stream.messages.empty())
+
+        await stream.close()
+        self.assertEqual({}, dict(self.app.hub.subscribers))
+
+    async def test_fan_out(self):
+        hub = BookEventHub(asyncio.get_running_loop(), flush_interval=60)
+        subscriptions = [
+            hub.subscribe({self.book_1.id, self.book_2.id}) for _ in range(1000)
+        ]
+        hub.notify({self.book_1.id: {"likes_count": 2, "rate_count": 0}})
+        hub.notify({self.book_1.id: {"likes_count": -1, "rate_count": 0}})
+
+        # The connection can only be touched from a thread.
+        context = CaptureQueriesContext(connection)
+        await sync_to_async(context.__enter__)()
+        await hub.flush()
+        await sync_to_async(context.__exit__)(None, None, None)
+
+        self.assertEqual(1, await sync_to_async(len)(context))
+        self.assertEqual(2, self.close_old_connections.call_count)
+        frames = {subscription.queue.get_nowait() for subscription in subscriptions}
+        self.assertEqual(1, len(frames))
+        self.assertEqual(
+            {"annotated_likes": 1, "rates": 0}, parse_frame(frames.pop())["changes"]
+        )
+
+    async def test_failed_flush(self):
+        hub = BookEventHub(asyncio.get_running_loop(), flush_interval=60)
+        subscription = hub.subscribe({self.book_1.id})
+        hub.notify({self.book_1.id: {"likes_count": 1, "rate_count": 0}})
+
+        with mock.patch("store.events.book_counters", side_effect=DatabaseError):
+            with self.assertLogs("store.events", "ERROR"):
+                await hub.flush()
+
+        self.assertEqual(2, self.close_old_connections.call_count)
+        self.assertTrue(subscription.queue.empty())
+        self.assertIsNotNone(hub.flush_handle)
+        hub.notify({self.book_1.id: {"likes_count": 1, "rate_count": 1}})
+        await hub.flush()
+        self.assertEqual(
+            {"annotated_likes": 2, "rates": 1},
+            parse_frame(subscription.queue.get_nowait())["changes"],
+        )
+
+    async def test_skips_bookmarks(self):
+        hub = BookEventHub(asyncio.get_running_loop(), flush_interval=60)
+        hub.subscribe({self.book_1.id})
+        bookmark = {"likes_count": 0, "bookmarks_count": 1, "rate_count": 0}
+
+        hub.notify({self.book_1.id: {**bookmark, "rate_sum": 0}})
+
+        self.assertEqual({}, hub.pending)
+        self.assertIsNone(hub.flush_handle)
+
+        # A rate going from 3 to 4 changes the rating only.
+        hub.notify({self.book_1.id: {**bookmark, "rate_sum": 1}})
+
+        self.assertIn(self.book_1.id, hub.pending)
+        self.assertIsNotNone(hub.flush_handle)
+        hub.flush_handle.cancel()
+
+    async def test_slow_subscriber(self):
+        hub = BookEventHub(asyncio.get_running_loop(), queue_size=1)
+        subscription = hub.subscribe({self.book_1.id})
+
+        hub.put(subscription, b"1")
+        hub.put(subscription, b"2")
+
+        self.assertIsNone(subscription.queue.get_nowait())
+        self.assertNotIn(self.book_1.id, hub.subscribers)
+
+    async def test_invalid(self):
+        for query_string in (
+            b"",
+            b"ids=x",
+            b"ids=" + b",".join(b"%d" % i for i in range(101)),
+        ):
+            with self.subTest(query_string=query_string):
+                stream = EventStream(self.app, query_string)
+                self.assertEqual(400, (await stream.next())["status"])
+                await stream.task
+
+        stream = EventStream(self.app, b"ids=1", method="POST")
+        self.assertEqual(405, (await stream.next())["status"])
+
+    async def test_other_requests(self):
+        scope = {"type": "http", "method": "GET", "path": "/book/", "query_string": b""}
+
+        await self.app(scope, None, None)
+
+        self.assertEqual([scope], self.django_app.scopes)
+        self.assertIsNone(self.app.hub)
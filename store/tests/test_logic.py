@@ -1,6 +1,15 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-from store.logic import operations
+from store.logic import (
+    COUNTER_FIELDS,
+    operations,
+    relation_counter_deltas,
+    upsert_relation,
+)
+from store.models import Book
+
+ZERO = dict.fromkeys(COUNTER_FIELDS, 0)
 
 
 class LogicTestCase(TestCase):
@@ -15,3 +24,68 @@ class LogicTestCase(TestCase):
     def test_multiply(self):
         result = operations(6, 13, "*")
         self.assertEqual(78, result)
+
+
+class RelationCounterDeltasTestCase(TestCase):
+    def test_like_and_rate(self):
+        deltas = relation_counter_deltas(None, (1, True, False, 4))
+        self.assertEqual(
+            {
+                1: {
+                    **ZERO,
+                    "likes_count": 1,
+                    "rate_sum": 4,
+                    "rate_count": 1,
+                    "rate_4_count": 1,
+                }
+            },
+            deltas,
+        )
+
+    def test_unlike_and_change_rate(self):
+        deltas = relation_counter_deltas((1, True, False, 4), (1, False, False, 2))
+        self.assertEqual(
+            {
+                1: {
+                    **ZERO,
+                    "likes_count": -1,
+                    "rate_sum": -2,
+                    "rate_2_count": 1,
+                    "rate_4_count": -1,
+                }
+            },
+            deltas,
+        )
+
+    def test_clear_rate(self):
+        deltas = relation_counter_deltas((1, False, False, 5), (1, False, False, None))
+        self.assertEqual(
+            {1: {**ZERO, "rate_sum": -5, "rate_count": -1, "rate_5_count": -1}}, deltas
+        )
+
+    def test_bookmark(self):
+        deltas = relation_counter_deltas((1, True, False, 3), (1, True, True, 3))
+        self.assertEqual({1: {**ZERO, "bookmarks_count": 1}}, deltas)
+
+    def test_nothing_changed(self):
+        self.assertEqual(
+            {}, relation_counter_deltas((1, True, True, 3), (1, True, True, 3))
+        )
+
+
+class BookSaveTestCase(TestCase):
+    def test_save_keeps_counters(self):
+        book = Book.objects.create(name="Book", price=10, author_name="Author")
+        user = User.objects.create(username="reader")
+        # Loaded before the relation write, saved after it.
+        stale = Book.objects.get(pk=book.pk)
+        upsert_relation(user, book.pk, {"like": True, "rate": 4})
+
+        stale.price = 20
+        stale.save()
+
+        book.refresh_from_db()
+        self.assertEqual(20, book.price)
+        self.assertEqual(1, book.likes_count)
+        self.assertEqual(1, book.rate_4_count)
+        self.assertEqual(4, book.rating)
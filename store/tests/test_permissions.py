@@ -0,0 +1,228 @@
+import tempfile
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from store.checks import check_shared_cache, check_shared_session_cache
+from store.models import Book
+from store.permissions import IsOwnerOrStaffOrReadOnly
+
+
+def auth_queries(context):
+    return [
+        query["sql"]
+        for query in context.captured_queries
+        if "auth_user" in query["sql"] or "django_session" in query["sql"]
+    ]
+
+
+# The opt-in user and session cache between requests.
+@override_settings(
+    BOOKS_AUTH_USER_CACHE_TIMEOUT=30,
+    SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+)
+class OwnerPermissionTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username="owner")
+        self.other = User.objects.create(username="other")
+        self.book = Book.objects.create(
+            name="Book", price=10, author_name="Author", owner=self.owner
+        )
+        self.url = reverse("book-detail", args=(self.book.id,))
+
+    def patch(self, **data):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(self.url, data=data, format="json")
+        return response, context
+
+    def test_write_queries(self):
+        self.client.force_login(self.owner)
+
+        response, context = self.patch(price="11.00")
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # The user once, then from the cache. The session is always cached.
+        self.assertEqual(1, len(auth_queries(context)))
+        self.assertNotIn("django_session", " ".join(auth_queries(context)))
+
+        response, context = self.patch(price="12.00")
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([], auth_queries(context))
+        # The book, its update and the change log entry. Name and author are
+        # unchanged, so the search index is left alone.
+        self.assertEqual(3, len(context))
+
+    def test_not_owner(self):
+        self.client.force_login(self.other)
+        self.patch(price="11.00")
+
+        response, context = self.patch(price="12.00")
+
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertEqual([], auth_queries(context))
+
+        self.other.is_staff = True
+        self.other.save()
+        response, _ = self.patch(price="12.00")
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+
+    def test_cached_user_follows_changes(self):
+        self.client.force_login(self.owner)
+        self.patch(price="11.00")
+
+        self.owner.is_active = False
+        self.owner.save()
+        response, _ = self.patch(price="12.00")
+
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+    @override_settings(BOOKS_DATABASE_REPLICAS=[], BOOKS_CACHE_TIMEOUT=0)
+    def test_shared_cache_check(self):
+        self.assertEqual(
+            ["store.E001"], [error.id for error in check_shared_cache(None)]
+        )
+
+        with override_settings(BOOKS_AUTH_USER_CACHE_TIMEOUT=0):
+            self.assertEqual([], check_shared_cache(None))
+        with tempfile.TemporaryDirectory() as location, override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": location,
+                }
+            }
+        ):
+            self.assertEqual([], check_shared_cache(None))
+
+    @override_settings(BOOKS_AUTH_USER_CACHE_TIMEOUT=0)
+    def test_shared_session_cache_check(self):
+        # Not silenced by turning the user cache off.
+        self.assertEqual(
+            ["store.E003"], [error.id for error in check_shared_session_cache(None)]
+        )
+
+        with override_settings(SESSION_ENGINE="django.contrib.sessions.backends.db"):
+            self.assertEqual([], check_shared_session_cache(None))
+        with tempfile.TemporaryDirectory() as location, override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": location,
+                }
+            }
+        ):
+            self.assertEqual([], check_shared_session_cache(None))
+
+    def test_password_change_logs_out(self):
+        self.client.force_login(self.owner)
+        self.patch(price="11.00")
+
+        self.owner.set_password("new password")
+        self.owner.save()
+        response, _ = self.patch(price="12.00")
+
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    def test_filter_queryset(self):
+        factory = APIRequestFactory()
+        permission = IsOwnerOrStaffOrReadOnly()
+        Book.objects.create(name="Other", price=10, author_name="A", owner=self.other)
+        staff = User.objects.create(username="staff", is_staff=True)
+
+        def permitted(method, user=None):
+            request = getattr(factory, method)("/")
+            request.user = user or User()
+            request.method = method.upper()
+            books = permission.filter_queryset(request, None, Book.objects.all())
+            return books.count()
+
+        self.assertEqual(2, permitted("get"))
+        self.assertEqual(1, permitted("delete", self.owner))
+        self.assertEqual(2, permitted("delete", staff))
+        self.assertEqual(0, permitted("delete"))
+
+
+class UncachedUserTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username="owner")
+        book = Book.objects.create(
+            name="Book", price=10, author_name="Author", owner=self.owner
+        )
+        self.url = reverse("book-detail", args=(book.id,))
+
+    def patch(self, **data):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(self.url, data=data, format="json")
+        return response, context
+
+    def test_deactivation_next_request(self):
+        self.client.force_login(self.owner)
+        response, context = self.patch(price="11.00")
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        # Session and user, read for every request by default.
+        self.assertEqual(2, len(auth_queries(context)))
+
+        # No signal, only an uncached user sees it at once.
+        User.objects.filter(pk=self.owner.pk).update(is_active=False)
+        response, _ = self.patch(price="12.00")
+
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+class BooksBulkDeleteTestCase(APITestCase):
+    def setUp(self):
+        self.owner = User.objects.create(username="owner")
+        other = User.objects.create(username="other")
+        self.own = [
+            Book.objects.create(
+                name=f"Own {i}", price=10, author_name="A", owner=self.owner
+            )
+            for i in range(3)
+        ]
+        self.foreign = Book.objects.create(
+            name="Foreign", price=10, author_name="A", owner=other
+        )
+        self.url = reverse("book-bulk-delete")
+
+    def test_bulk_delete(self):
+        self.client.force_login(self.owner)
+        ids = [book.id for book in self.own[:2]] + [self.foreign.id, 100500]
+
+        response = self.client.post(self.url, data={"ids": ids}, format="json")
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(
+            {
+                "deleted": [self.own[0].id, self.own[1].id],
+                "forbidden": [self.foreign.id],
+                "not_found": [100500],
+            },
+            response.data,
+        )
+        self.assertEqual(
+            {self.own[2].id, self.foreign.id},
+            set(Book.objects.values_list("id", flat=True)),
+        )
+
+    def test_anonymous(self):
+        response = self.client.post(
+            self.url, data={"ids": [self.own[0].id]}, format="json"
+        )
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertEqual(4, Book.objects.count())
+
+    def test_invalid(self):
+        self.client.force_login(self.owner)
+        for data in ({"ids": []}, {"ids": ["x"]}, {}):
+            with self.subTest(data=data):
+                response = self.client.post(self.url, data=data, format="json")
+                self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
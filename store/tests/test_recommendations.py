@@ -0,0 +1,145 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, SimilarBook, SimilarityBuild, UserBookRelation
+
+
+class SimilarBooksTestCase(APITestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f"user{i}") for i in range(6)]
+        self.books = [
+            Book.objects.create(name=f"Book {i}", price=10, author_name="Author")
+            for i in range(5)
+        ]
+        book_1, book_2, book_3, book_4, _ = self.books
+        for user in self.users[:3]:
+            self.relate(user, book_1, like=True)
+            self.relate(user, book_2, like=True)
+        for user in self.users[:2]:
+            self.relate(user, book_3, rate=5)
+        # Only one reader in common with the others.
+        self.relate(self.users[3], book_1, like=True)
+        self.relate(self.users[3], book_4, like=True)
+        # Rate 1 counts as no interest at all.
+        self.relate(self.users[4], book_4, rate=1)
+        # Written well before any build.
+        Book.objects.update(modified=timezone.now() - timedelta(hours=1))
+
+    def relate(self, user, book, **fields):
+        relation, _ = UserBookRelation.objects.get_or_create(user=user, book=book)
+        for field, value in fields.items():
+            setattr(relation, field, value)
+        relation.save()
+
+    def build(self, *args):
+        call_command("build_similar_books", *args, stdout=StringIO())
+        return SimilarityBuild.objects.latest()
+
+    def stored(self):
+        return {
+            book_id: [
+                (similar_id, round(score, 6))
+                for similar_id, score in SimilarBook.objects.filter(book_id=book_id)
+                .order_by("rank")
+                .values_list("similar_id", "score")
+            ]
+            for book_id in Book.objects.values_list("id", flat=True)
+        }
+
+    def test_build(self):
+        build = self.build()
+
+        self.assertFalse(build.incremental)
+        book_1, book_2, book_3, book_4, book_5 = (book.id for book in self.books)
+        self.assertEqual(
+            {
+                # 3 / sqrt(4 * 3) and 2 / sqrt(4 * 2).
+                book_1: [(book_2, 0.866025), (book_3, 0.707107)],
+                book_2: [(book_1, 0.866025), (book_3, 0.816497)],
+                book_3: [(book_2, 0.816497), (book_1, 0.707107)],
+                book_4: [],
+                book_5: [],
+            },
+            self.stored(),
+        )
+        stored = self.stored()
+
+        # Scored a book at a time.
+        self.build("--full", "--batch-size=1")
+        self.assertEqual(stored, self.stored())
+
+    def test_incremental(self):
+        self.build()
+        book_1, _, book_3, book_4, book_5 = self.books
+        # Nobody likes book 3 any more, book 4 gets a second shared reader.
+        for user in self.users[:2]:
+            self.relate(user, book_3, rate=None)
+        self.relate(self.users[0], book_4, like=True)
+
+        build = self.build()
+        incremental = self.stored()
+
+        self.assertTrue(build.incremental)
+        self.assertEqual(4, build.books)
+        self.assertEqual(
+            [(self.books[1].id, 0.866025), (book_4.id, 0.707107)],
+            incremental[book_1.id],
+        )
+        self.assertEqual([], incremental[book_3.id])
+        self.build("--full")
+        self.assertEqual(self.stored(), incremental)
+
+        # Untouched books are left alone.
+        Book.objects.update(modified=timezone.now() - timedelta(hours=1))
+        self.relate(self.users[5], book_5, like=True)
+        self.assertEqual(1, self.build().books)
+
+    def test_endpoint(self):
+        self.build()
+        book_1, book_2, book_3, book_4, _ = self.books
+        url = reverse("book-similar", args=(book_1.id,))
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"limit": 1})
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(book_1.id, response.data["book"])
+        [similar] = response.data["results"]
+        self.assertEqual(book_2.id, similar["id"])
+        self.assertEqual("Book 1", similar["name"])
+        self.assertAlmostEqual(0.866025, similar["similarity"], places=6)
+        self.assertNotIn("rating_histogram", similar)
+
+        response = self.client.get(url, {"fields": "id"})
+        self.assertEqual(
+            [book_2.id, book_3.id], [book["id"] for book in response.data["results"]]
+        )
+        self.assertEqual({"id", "similarity"}, set(response.data["results"][0]))
+
+        response = self.client.get(reverse("book-similar", args=(book_4.id,)))
+        self.assertEqual([], response.data["results"])
+
+    def test_build_invalidates_cache(self):
+        url = reverse("book-similar", args=(self.books[0].id,))
+        self.assertEqual([], self.client.get(url).data["results"])
+
+        self.build()
+
+        response = self.client.get(url)
+        self.assertEqual("MISS", response["X-Cache"])
+        self.assertEqual(2, len(response.data["results"]))
+
+    def test_invalid(self):
+        url = reverse("book-similar", args=(self.books[-1].id + 100,))
+        self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get(url).status_code)
+
+        url = reverse("book-similar", args=(self.books[0].id,))
+        response = self.client.get(url, {"limit": 1000})
+        self.assertEqual(status.HTTP_400_BAD_REQUEST, response.status_code)
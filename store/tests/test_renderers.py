@@ -0,0 +1,28 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from store.renderers import ORJSONRenderer
+
+
+class ORJSONRendererTestCase(SimpleTestCase):
+    def test_same_bytes_as_json_renderer(self):
+        data = {
+            "results": [
+                {"id": 1, "name": "Книга\u2028", "price": "25.00", "rating": None},
+                {"id": 2, "name": 'Quote "me"', "likes": 3, "flag": True},
+            ],
+            "decimal": Decimal("4.50"),
+            "modified": timezone.now(),
+            "next": None,
+        }
+        self.assertEqual(JSONRenderer().render(data), ORJSONRenderer().render(data))
+
+    def test_indent(self):
+        data = {"id": 1}
+        self.assertEqual(
+            JSONRenderer().render(data, "application/json; indent=4"),
+            ORJSONRenderer().render(data, "application/json; indent=4"),
+        )
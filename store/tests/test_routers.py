@@ -0,0 +1,201 @@
+import time
+from contextlib import ExitStack
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    APITestCase,
+    APITransactionTestCase,
+)
+
+from store.cache import BOOKS_CHANGED_KEY
+from store.checks import check_shared_cache
+from store.models import Book, UserBookRelation
+from store.routers import (
+    PRIMARY_PIN_COOKIE,
+    ReplicaRouter,
+    current_request,
+    may_be_stale,
+    pin_to_primary,
+    reads_from_primary,
+)
+
+REPLICAS = ["replica_1", "replica_2"]
+
+
+@override_settings(BOOKS_DATABASE_REPLICAS=REPLICAS)
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.factory = APIRequestFactory()
+
+    def db_for_read(self, model, request):
+        token = current_request.set(request)
+        try:
+            return self.router.db_for_read(model)
+        finally:
+            current_request.reset(token)
+
+    def request(self, method="get", cookies=None):
+        request = getattr(self.factory, method)("/")
+        request.user = AnonymousUser()
+        request.COOKIES.update(cookies or {})
+        return request
+
+    def test_reads(self):
+        self.assertIn(self.db_for_read(Book, self.request()), REPLICAS)
+        self.assertIn(self.db_for_read(UserBookRelation, self.request()), REPLICAS)
+        self.assertIsNone(self.db_for_read(User, self.request()))
+        self.assertEqual(DEFAULT_DB_ALIAS, self.db_for_read(Book, self.request("post")))
+        # No request: commands and shells.
+        self.assertEqual(DEFAULT_DB_ALIAS, self.db_for_read(Book, None))
+        self.assertEqual(DEFAULT_DB_ALIAS, self.router.db_for_write(Book))
+
+        with override_settings(BOOKS_DATABASE_REPLICAS=[]):
+            self.assertIsNone(self.db_for_read(Book, self.request()))
+
+    def test_sticky(self):
+        response = HttpResponse()
+        pin_to_primary(response)
+        pin = response.cookies[PRIMARY_PIN_COOKIE]
+
+        self.assertEqual(5, pin["max-age"])
+        self.assertEqual(
+            DEFAULT_DB_ALIAS,
+            self.db_for_read(Book, self.request(cookies={pin.key: pin.value})),
+        )
+        for value in (str(int(time.time()) - 1), "x"):
+            with self.subTest(value=value):
+                request = self.request(cookies={PRIMARY_PIN_COOKIE: value})
+                self.assertIn(self.db_for_read(Book, request), REPLICAS)
+
+    def test_may_be_stale(self):
+        request = self.request()
+        self.assertFalse(may_be_stale(request))
+        self.db_for_read(Book, request)
+
+        cache.set(BOOKS_CHANGED_KEY, time.time())
+        self.assertTrue(may_be_stale(request))
+        cache.set(BOOKS_CHANGED_KEY, time.time() - 60)
+        self.assertFalse(may_be_stale(request))
+
+    def test_shared_cache_check(self):
+        self.assertIn("store.E002", [error.id for error in check_shared_cache(None)])
+
+    def test_migrate(self):
+        self.assertFalse(self.router.allow_migrate("replica_1", "store"))
+        self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, "store"))
+
+
+@override_settings(BOOKS_DATABASE_REPLICAS=REPLICAS)
+class StickyWritesTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username="owner")
+        self.book = Book.objects.create(
+            name="Book", price=10, author_name="Author", owner=self.owner
+        )
+
+    def test_write_pins_client(self):
+        self.client.force_login(self.owner)
+
+        response = self.client.patch(
+            reverse("book-detail", args=(self.book.id,)),
+            data={"price": "11.00"},
+            format="json",
+        )
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        request = APIRequestFactory().get("/")
+        request.COOKIES = {
+            name: cookie.value for name, cookie in self.client.cookies.items()
+        }
+        self.assertTrue(reads_from_primary(request))
+
+        self.client.logout()
+        response = self.client.patch(
+            reverse("book-detail", args=(self.book.id,)),
+            data={"price": "12.00"},
+            format="json",
+        )
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+        self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
+
+
+@skipUnless(settings.BOOKS_DATABASE_REPLICAS, "needs BOOKS_DB_REPLICAS")
+class ReplicaReadsTestCase(APITransactionTestCase):
+    """
+    Runs with replicas configured, e.g. on SQLite:
+    BOOKS_DB_ENGINE=django.db.backends.sqlite3 BOOKS_DB_NAME=db.sqlite3
+    BOOKS_DB_REPLICAS=replica1.sqlite3,replica2.sqlite3 ./manage.py test
+    (test replicas mirror the test database).
+    """
+
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create(username="owner")
+        self.book = Book.objects.create(
+            name="Book", price=10, author_name="Author", owner=self.owner
+        )
+        # Written well before the tests, replicas have caught up.
+        cache.set(BOOKS_CHANGED_KEY, time.time() - 60)
+
+    def replica_queries(self, method, *args, **kwargs):
+        with ExitStack() as stack:
+            contexts = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in settings.BOOKS_DATABASE_REPLICAS
+            ]
+            response = getattr(self.client, method)(*args, **kwargs)
+        return response, sum(len(context) for context in contexts)
+
+    def test_reads(self):
+        url = reverse("book-detail", args=(self.book.id,))
+
+        response, queries = self.replica_queries("get", reverse("book-list"))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertContains(response, "Book")
+        self.assertGreater(queries, 0)
+
+        self.client.force_login(self.owner)
+        response, queries = self.replica_queries(
+            "patch", url, data={"price": "11.00"}, format="json"
+        )
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual(0, queries)
+
+        response, queries = self.replica_queries("get", url)
+        self.assertEqual("11.00", response.data["price"])
+        self.assertEqual(0, queries)
+
+    def test_no_validators_after_write(self):
+        url = reverse("book-detail", args=(self.book.id,))
+        etag = self.client.get(url)["ETag"]
+        writer = APIClient()
+        writer.force_login(self.owner)
+        writer.patch(url, data={"price": "11.00"}, format="json")
+
+        # Not pinned, a lagging replica's old body would get the new ETag.
+        for path in (url, reverse("async-book-detail", args=(self.book.id,))):
+            with self.subTest(path=path):
+                response, queries = self.replica_queries(
+                    "get", path, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(status.HTTP_200_OK, response.status_code)
+                self.assertGreater(queries, 0)
+                self.assertNotIn("ETag", response)
+                self.assertNotIn("Last-Modified", response)
@@ -0,0 +1,191 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book, BookSearchToken
+from store.search import TokenIndexSearchBackend, tokenize
+
+
+class TokenizeTestCase(SimpleTestCase):
+    def test_tokenize(self):
+        self.assertEqual(
+            ["война", "и", "мир", "l", "tolstoy"], tokenize("Война и мир, L. Tolstoy")
+        )
+
+    def test_long_token(self):
+        self.assertEqual(["a" * 64], tokenize("a" * 100))
+
+
+class TokenIndexTestCase(TestCase):
+    def get_tokens(self, book):
+        return dict(book.search_tokens.values_list("token", "weight"))
+
+    def test_index_on_save(self):
+        book = Book.objects.create(
+            name="Test book", price=10, author_name="Test Author"
+        )
+
+        self.assertEqual({"test": 3, "book": 2, "author": 1}, self.get_tokens(book))
+
+        book.name = "Other"
+        book.save()
+
+        self.assertEqual({"other": 2, "test": 1, "author": 1}, self.get_tokens(book))
+
+    def test_skip_unrelated_update(self):
+        book = Book.objects.create(name="Test book", price=10, author_name="Author")
+        BookSearchToken.objects.all().delete()
+
+        book.save(update_fields=["price"])
+
+        self.assertEqual({}, self.get_tokens(book))
+
+    def test_skip_unchanged_text(self):
+        book = Book.objects.create(name="Test book", price=10, author_name="Author")
+        BookSearchToken.objects.all().delete()
+        book = Book.objects.get(pk=book.pk)
+
+        book.price = 20
+        book.save()
+
+        self.assertEqual({}, self.get_tokens(book))
+
+        book.author_name = "Other"
+        book.save()
+
+        self.assertEqual({"test": 2, "book": 2, "other": 1}, self.get_tokens(book))
+
+    def test_delete(self):
+        book = Book.objects.create(name="Test book", price=10, author_name="Author")
+
+        book.delete()
+
+        self.assertFalse(BookSearchToken.objects.exists())
+
+    def test_rebuild_command(self):
+        books = Book.objects.bulk_create(
+            Book(name=f"Bulk {i}", price=10, author_name="Author") for i in range(3)
+        )
+        out = StringIO()
+
+        call_command("rebuild_search_index", "--batch-size=2", stdout=out)
+
+        self.assertIn("Indexed 3 books.", out.getvalue())
+        for book in books:
+            self.assertEqual(
+                {"bulk": 2, str(book.name[-1]): 2, "author": 1}, self.get_tokens(book)
+            )
+
+
+class BooksSearchTestCase(APITestCase):
+    def setUp(self):
+        self.book_1 = Book.objects.create(
+            name="Python cookbook", price=10, author_name="David Beazley"
+        )
+        self.book_2 = Book.objects.create(
+            name="Fluent Python", price=20, author_name="Luciano Ramalho"
+        )
+        self.book_3 = Book.objects.create(
+            name="Snakes", price=30, author_name="Pythonic Press"
+        )
+        self.book_4 = Book.objects.create(
+            name="Cookery", price=40, author_name="Somebody"
+        )
+
+    def search(self, **params):
+        response = self.client.get(reverse("book-list"), data=params)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        return [book["id"] for book in response.data["results"]]
+
+    def test_prefix(self):
+        self.assertEqual([self.book_4.id, self.book_1.id], self.search(search="COOK"))
+
+    def test_relevance(self):
+        # Whole words in the name first, then prefixes, then the author.
+        self.assertEqual(
+            [self.book_2.id, self.book_1.id, self.book_3.id],
+            self.search(search="python"),
+        )
+
+    def test_all_terms(self):
+        self.assertEqual([self.book_1.id], self.search(search="pyth cook"))
+
+    def test_no_match(self):
+        self.assertEqual([], self.search(search="rust"))
+        self.assertEqual([], self.search(search="!!!"))
+
+    def test_explicit_ordering(self):
+        self.assertEqual(
+            [self.book_3.id, self.book_2.id, self.book_1.id],
+            self.search(search="python", ordering="-price"),
+        )
+
+    def test_pages(self):
+        url = reverse("book-list")
+        response = self.client.get(url, data={"search": "python", "page_size": 1})
+        pages = [response.data["results"][0]["id"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            pages += [book["id"] for book in response.data["results"]]
+
+        self.assertEqual([self.book_2.id, self.book_1.id, self.book_3.id], pages)
+
+    def test_sparse_fields(self):
+        response = self.client.get(
+            reverse("book-list"), data={"search": "python", "fields": "name"}
+        )
+
+        self.assertEqual(
+            ["Fluent Python", "Python cookbook", "Snakes"],
+            [book["name"] for book in response.data["results"]],
+        )
+
+    def test_uses_index(self):
+        with CaptureQueriesContext(connection) as context:
+            self.search(search="python")
+
+        sql = " ".join(query["sql"] for query in context.captured_queries)
+        self.assertIn("store_booksearchtoken", sql)
+        self.assertNotIn("%python%", sql)
+
+    def test_patch_reindexes_text_only(self):
+        self.client.force_login(User.objects.create(username="staff", is_staff=True))
+        url = reverse("book-detail", args=(self.book_4.id,))
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(url, data={"price": "41.00"}, format="json")
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        sql = " ".join(query["sql"] for query in context.captured_queries)
+        self.assertNotIn("store_booksearchtoken", sql)
+        self.assertEqual([self.book_4.id], self.search(search="cookery"))
+
+        response = self.client.patch(url, data={"name": "Gardening"}, format="json")
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertEqual([], self.search(search="cookery"))
+        self.assertEqual([self.book_4.id], self.search(search="gardening"))
+
+    @override_settings(BOOKS_SEARCH_BACKEND="store.search.ContainsSearchBackend")
+    def test_contains_backend(self):
+        self.assertEqual(
+            [self.book_1.id, self.book_2.id, self.book_3.id],
+            self.search(search="ytho"),
+        )
+
+    def test_backend_rank(self):
+        books = TokenIndexSearchBackend().search(Book.objects.all(), ["python"], [])
+
+        self.assertEqual(
+            [(self.book_2.id, 4), (self.book_1.id, 4), (self.book_3.id, 1)],
+            list(
+                books.values_list("id", "search_rank").order_by("-search_rank", "-id")
+            ),
+        )
@@ -1,9 +1,12 @@
-from django.db.models import Count, Case, When, Avg
 from django.test import TestCase
 from django.contrib.auth.models import User
 from sqlparse import format
 from store.models import Book, UserBookRelation
-from store.serializers import BooksSerializer
+from store.serializers import (
+    BooksSerializer,
+    BooksWithUserRelationSerializer,
+    RowSerializer,
+)
 
 
 class BooSerializerTestCase(TestCase):
@@ -22,21 +25,7 @@ class BooSerializerTestCase(TestCase):
         UserBookRelation.objects.create(user=user_2, book=book_1, like=True, rate=5)
         UserBookRelation.objects.create(user=user_3, book=book_2, like=True, rate=4)
 
-        books = (
-            Book.objects.all()
-            .annotate(
-                annotated_likes=Count(
-                    Case(
-                        When(
-                            userbookrelation__like=True,
-                            then=1,
-                        )
-                    )
-                ),
-                rating=Avg("userbookrelation__rate"),
-            )
-            .order_by("id")
-        )
+        books = Book.objects.all().order_by("id")
         # print(format(str(books.query), reindent=True))
         data = BooksSerializer(books, many=True).data
         expected_data = [
@@ -48,6 +37,9 @@ class BooSerializerTestCase(TestCase):
                 "likes_count": 2,
                 "annotated_likes": 2,
                 "rating": "4.50",
+                "bookmarks_count": 0,
+                "weighted_rating": "3.2500",
+                "rating_histogram": {"1": 0, "2": 0, "3": 0, "4": 1, "5": 1},
             },
             {
                 "id": book_2.id,
@@ -57,6 +49,46 @@ class BooSerializerTestCase(TestCase):
                 "likes_count": 1,
                 "annotated_likes": 1,
                 "rating": "4.00",
+                "bookmarks_count": 0,
+                "weighted_rating": "3.0909",
+                "rating_histogram": {"1": 0, "2": 0, "3": 0, "4": 1, "5": 0},
             },
         ]
         self.assertEqual(expected_data, data)
+
+
+class RowSerializerTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="user1")
+        self.book_1 = Book.objects.create(
+            name="Test Book 1", price="25.5", author_name="Test Author"
+        )
+        self.book_2 = Book.objects.create(
+            name="Test Book 2", price=52, author_name="Автор"
+        )
+        UserBookRelation.objects.create(user=user, book=self.book_1, like=True, rate=4)
+        UserBookRelation.objects.create(
+            user=User.objects.create(username="user2"), book=self.book_1, rate=3
+        )
+
+    def test_same_as_model_serializer(self):
+        books = Book.objects.all().order_by("id")
+        row_serializer = RowSerializer.for_serializer(BooksSerializer())
+
+        rows = books.values(*row_serializer.columns)
+        data = [row_serializer.to_representation(row) for row in rows]
+
+        self.assertEqual(BooksSerializer(books, many=True).data, data)
+        self.assertEqual("3.50", data[0]["rating"])
+        self.assertIsNone(data[1]["rating"])
+
+    def test_fields(self):
+        row_serializer = RowSerializer.for_serializer(
+            BooksSerializer(fields=["id", "annotated_likes"])
+        )
+        self.assertEqual(["id", "likes_count"], row_serializer.columns)
+
+    def test_method_field_not_supported(self):
+        self.assertIsNone(
+            RowSerializer.for_serializer(BooksWithUserRelationSerializer())
+        )
@@ -0,0 +1,106 @@
+import re
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.models import Book
+from store.timing import RequestTimings, RouteStats, route_stats, timed
+
+
+@override_settings(BOOKS_TIMING_ENABLED=True)
+class TimingMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        route_stats.reset()
+        self.user = User.objects.create(username="test_username")
+        self.staff = User.objects.create(username="staff", is_staff=True)
+        Book.objects.create(name="Test book 1", price=25, author_name="Author 1")
+
+    def get_server_timing(self, response):
+        return dict(
+            re.findall(r"(\w+);dur=([\d.]+)", response.headers["Server-Timing"])
+        )
+
+    def test_server_timing(self):
+        response = self.client.get(reverse("book-list"))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        timing = self.get_server_timing(response)
+        self.assertEqual({"db", "view", "serialize", "render", "total"}, set(timing))
+        self.assertIn('desc="2 queries"', response.headers["Server-Timing"])
+        self.assertLessEqual(float(timing["view"]), float(timing["total"]))
+
+    def test_server_timing_without_render(self):
+        response = self.client.get(reverse("book-list"))
+
+        response = self.client.get(
+            reverse("book-list"), HTTP_IF_NONE_MATCH=response.headers["ETag"]
+        )
+
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        timing = self.get_server_timing(response)
+        self.assertEqual({"db", "view", "total"}, set(timing))
+
+    @override_settings(BOOKS_TIMING_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(reverse("book-list"))
+
+        self.assertNotIn("Server-Timing", response.headers)
+        self.assertEqual({}, route_stats.as_dict())
+
+    def test_stats(self):
+        self.client.get(reverse("book-list"))
+        self.client.get(reverse("book-list"))
+        self.client.force_authenticate(self.staff)
+
+        response = self.client.get(reverse("timings"))
+
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        stats = response.data["GET book-list"]
+        self.assertEqual(2, stats["count"])
+        self.assertEqual(2, sum(stats["histogram"].values()))
+        # Validators and page, then validators and a cache hit.
+        self.assertEqual(1.5, stats["queries_mean"])
+
+        response = self.client.delete(reverse("timings"))
+
+        self.assertEqual(status.HTTP_204_NO_CONTENT, response.status_code)
+        self.assertNotIn("GET book-list", route_stats.as_dict())
+
+    def test_stats_not_staff(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get(reverse("timings"))
+
+        self.assertEqual(status.HTTP_403_FORBIDDEN, response.status_code)
+
+
+class RouteStatsTestCase(SimpleTestCase):
+    def test_summarize(self):
+        stats = RouteStats(window=3)
+        for total_ms in (1, 7, 30, 3000):
+            timings = RequestTimings()
+            timings.add("view", total_ms / 2)
+            timings.queries = 2
+            stats.record("GET book-list", total_ms, timings)
+
+        summary = stats.as_dict()["GET book-list"]
+
+        self.assertEqual(3, summary["count"])
+        self.assertEqual(30, summary["p50_ms"])
+        self.assertEqual(3000, summary["p99_ms"])
+        self.assertEqual(2, summary["queries_mean"])
+        self.assertEqual(
+            {"view": round((7 + 30 + 3000) / 2 / 3, 3)}, summary["phases_ms_mean"]
+        )
+        self.assertEqual(1, summary["histogram"]["le_10ms"])
+        self.assertEqual(1, summary["histogram"]["le_50ms"])
+        self.assertEqual(1, summary["histogram"]["inf"])
+
+    def test_timed_outside_request(self):
+        with timed("serialize"):
+            pass
@@ -0,0 +1,135 @@
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from rest_framework.serializers import ListSerializer
+
+# Upper bounds (ms) of the histogram buckets, the last one is unbounded.
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+current_timings = ContextVar("store_request_timings", default=None)
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RequestTimings:
+    """
+    Phase durations and SQL totals of one request, in milliseconds.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.queries = 0
+        self.db_ms = 0.0
+
+    def add(self, phase, duration_ms):
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration_ms
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - started) * 1000
+            self.queries += 1
+
+    def server_timing(self, total_ms):
+        entries = [f'db;dur={self.db_ms:.2f};desc="{self.queries} queries"']
+        entries += [f"{phase};dur={ms:.2f}" for phase, ms in self.phases.items()]
+        entries.append(f"total;dur={total_ms:.2f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def timed(phase):
+    """
+    Add the duration of the block to ``phase`` of the current request.
+
+    Does nothing outside of an instrumented request.
+    """
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, (time.perf_counter() - started) * 1000)
+
+
+class TimedListSerializer(ListSerializer):
+    @property
+    def data(self):
+        with timed("serialize"):
+            return super().data
+
+
+class RouteStats:
+    """
+    Rolling window of the last ``window`` requests per route.
+    """
+
+    def __init__(self, window=1000):
+        self._lock = Lock()
+        self.window = window
+        self.routes = {}
+
+    def record(self, route, total_ms, timings):
+        sample = (total_ms, timings.db_ms, timings.queries, dict(timings.phases))
+        with self._lock:
+            samples = self.routes.get(route)
+            if samples is None:
+                samples = self.routes[route] = deque(maxlen=self.window)
+            samples.append(sample)
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+
+    def as_dict(self):
+        with self._lock:
+            routes = {route: list(samples) for route, samples in self.routes.items()}
+        return {
+            route: self.summarize(samples) for route, samples in sorted(routes.items())
+        }
+
+    @staticmethod
+    def summarize(samples):
+        totals = [sample[0] for sample in samples]
+        histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+        for total in totals:
+            histogram[bisect_left(HISTOGRAM_BUCKETS, total)] += 1
+        phases = {}
+        for sample in samples:
+            for phase, ms in sample[3].items():
+                phases[phase] = phases.get(phase, 0.0) + ms
+        count = len(samples)
+        return {
+            "count": count,
+            "p50_ms": round(percentile(totals, 50), 3),
+            "p95_ms": round(percentile(totals, 95), 3),
+            "p99_ms": round(percentile(totals, 99), 3),
+            "db_ms_mean": round(sum(sample[1] for sample in samples) / count, 3),
+            "queries_mean": round(sum(sample[2] for sample in samples) / count, 2),
+            "phases_ms_mean": {
+                phase: round(ms / count, 3) for phase, ms in phases.items()
+            },
+            "histogram": {
+                **{
+                    f"le_{bound}ms": histogram[index]
+                    for index, bound in enumerate(HISTOGRAM_BUCKETS)
+                },
+                "inf": histogram[-1],
+            },
+        }
+
+
+route_stats = RouteStats()
@@ -1,33 +1,354 @@
-from django.db.models import Count, When, Case, Avg
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, FilteredRelation, Q
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed, NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.mixins import UpdateModelMixin
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.authentication import BasicAuthentication, SessionAuthentication
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 
+from store.authentication import (
+    JWTAuthentication,
+    decode_token,
+    issue_tokens,
+    revoke_token,
+)
+from store.buffer import relation_buffer
+from store.cache import response_cache_stats
+from store.changes import get_head_token, get_horizon, read_changes
+from store.export import ExportContentNegotiation, csv_chunks, ndjson_chunks
+from store.importer import READERS, BookImporter, decode_lines
+from store.logic import upsert_relation, upsert_relations
+from store.mixins import (
+    CachedResponseMixin,
+    ConditionalGetMixin,
+    SparseFieldsMixin,
+    ValuesReadMixin,
+)
 from store.models import Book, UserBookRelation
-from store.permissions import IsOwnerOrStaffOrReadOnly
-from store.serializers import BooksSerializer, UserBookRelationSerializer
+from store.pagination import KeysetPagination
+from store.permissions import IsOwnerOrStaffOrReadOnly, filter_permitted
+from store.search import BookSearchFilter
+from store.serializers import (
+    BookIdsSerializer,
+    BooksSerializer,
+    BooksWithUserRelationSerializer,
+    RefreshTokenSerializer,
+    RowSerializer,
+    UserBookRelationBulkItemSerializer,
+    UserBookRelationSerializer,
+)
+from store.timing import route_stats, timed
 
 
-class BookViewSet(ModelViewSet):
-    queryset = (
-        Book.objects.all()
-        .annotate(
-            annotated_likes=Count(Case(When(userbookrelation__like=True, then=1))),
-            rating=Avg("userbookrelation__rate"),
-        )
-        .order_by("id")
-    )
+class BookViewSet(
+    ConditionalGetMixin,
+    CachedResponseMixin,
+    ValuesReadMixin,
+    SparseFieldsMixin,
+    ModelViewSet,
+):
+    queryset = Book.objects.all().order_by("id")
 
     serializer_class = BooksSerializer
+    pagination_class = KeysetPagination
 
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, BookSearchFilter, OrderingFilter]
     permission_classes = [IsOwnerOrStaffOrReadOnly]
     filterset_fields = ["price"]
     search_fields = ["name", "author_name"]
     ordering_fields = ["price", "author_name", "name"]
+    # Lists get them with ?fields=...,rating_histogram.
+    detail_only_fields = ("bookmarks_count", "weighted_rating", "rating_histogram")
+    # Leaderboard orderings, each backed by an index of the same order.
+    leaderboards = {
+        "liked": ("-likes_count", "id"),
+        "rated": ("-weighted_rating", "-rate_count", "id"),
+        "bookmarked": ("-bookmarks_count", "id"),
+    }
+    leaderboard_size = 10
+    changes_page_size = 100
+    export_types = {
+        "ndjson": ("application/x-ndjson", ndjson_chunks),
+        "csv": ("text/csv; charset=utf-8", csv_chunks),
+    }
+    export_chunk_size = 2000
+    import_content_types = {
+        "text/csv": "csv",
+        "application/x-ndjson": "ndjson",
+    }
+
+    @property
+    def ordering(self):
+        # Without ?ordering= search results come most relevant first.
+        return BookSearchFilter().get_default_ordering(self.request)
+
+    def with_user_relation(self):
+        names = self.get_requested_field_names()
+        if names is not None:
+            return "user_relation" in names
+        return self.request.query_params.get("with_user_relation") in ("1", "true")
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Checked first: AsyncBookView can't look at the user.
+        if not self.with_user_relation():
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        # One LEFT JOIN on the unique (user, book) index, no per-row queries.
+        return queryset.annotate(
+            user_relation=FilteredRelation(
+                "userbookrelation", condition=Q(userbookrelation__user=user)
+            ),
+            user_relation_id=F("user_relation__id"),
+            user_relation_like=F("user_relation__like"),
+            user_relation_in_bookmarks=F("user_relation__in_bookmarks"),
+            user_relation_rate=F("user_relation__rate"),
+        )
+
+    def get_serializer_class(self):
+        if self.with_user_relation():
+            return BooksWithUserRelationSerializer
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.with_user_relation() and self.request.user.is_authenticated:
+            user_id = self.request.user.pk
+            context["pending_relations"] = relation_buffer.get_pending(user_id)
+        return context
+
+    def get_cache_user_id(self, request):
+        if self.with_user_relation() and request.user.is_authenticated:
+            # Buffered toggles aren't in the database yet, see get_pending.
+            version = relation_buffer.get_user_version(request.user.pk)
+            return f"{request.user.pk}.{version}"
+        return None
+
+    def is_conditional(self, request):
+        # Relations don't carry timestamps, personal responses go unvalidated.
+        return not self.with_user_relation()
+
+    @action(detail=False, content_negotiation_class=ExportContentNegotiation)
+    def export(self, request):
+        """
+        Stream all matching books as ``?type=ndjson`` (default) or ``csv``.
+
+        Takes the list filters, search, ordering and ``?fields=``. Rows are
+        read ``export_chunk_size`` at a time through a server-side cursor, so
+        memory use doesn't grow with the catalog.
+        """
+        export_type = request.query_params.get("type", "ndjson")
+        if export_type not in self.export_types:
+            raise ValidationError(
+                {"type": [f"Expected one of: {', '.join(self.export_types)}."]}
+            )
+        row_serializer = RowSerializer.for_serializer(self.get_serializer())
+        if row_serializer is None:
+            raise ValidationError({"fields": ["Only plain fields can be exported."]})
+
+        content_type, chunks = self.export_types[export_type]
+        rows = self.get_rows(self.filter_queryset(self.get_queryset()), row_serializer)
+        response = StreamingHttpResponse(
+            chunks(
+                rows.iterator(chunk_size=self.export_chunk_size),
+                row_serializer,
+                self.export_chunk_size,
+            ),
+            content_type=content_type,
+        )
+        response["Content-Disposition"] = f'attachment; filename="books.{export_type}"'
+        return response
+
+    @action(
+        detail=False,
+        url_path=f"top/(?P<board>{'|'.join(leaderboards)})",
+        url_name="top",
+    )
+    def top(self, request, board):
+        """
+        The ``?limit=`` (default ``leaderboard_size``) most liked, best rated
+        or most bookmarked books.
+
+        Books are read in index order from counters kept up to date by
+        relation writes, so the cost depends on the limit only. Ratings are
+        ranked by ``weighted_rating``, a Bayesian average. List filters and
+        search don't apply, ``?fields=`` does.
+        """
+        return self.cached_response(self.top_response, request, board)
+
+    def top_response(self, request, board):
+        limit = self.get_limit(
+            self.leaderboard_size, settings.BOOKS_LEADERBOARD_MAX_SIZE
+        )
+        queryset = self.get_queryset().order_by(*self.leaderboards[board])[:limit]
+        return Response({"board": board, "results": self.serialize_books(queryset)})
+
+    @action(detail=True)
+    def similar(self, request, pk=None):
+        """
+        Books liked by the readers who liked this one, most similar first.
+
+        Neighbours are precomputed by ``build_similar_books``, a read is one
+        index range scan of ``?limit=`` (at most ``BOOKS_SIMILAR_BOOKS``)
+        rows. Each book carries its cosine ``similarity``.
+        """
+        return self.cached_response(self.similar_response, request, pk)
+
+    def similar_response(self, request, pk):
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise NotFound()
+        limit = self.get_limit(self.leaderboard_size, settings.BOOKS_SIMILAR_BOOKS)
+        queryset = (
+            self.get_queryset()
+            .filter(similar_to__book_id=pk)
+            .annotate(similarity=F("similar_to__score"))
+            .order_by("similar_to__rank")[:limit]
+        )
+        books = self.serialize_books(queryset, "similarity")
+        if not books and not Book.objects.filter(pk=pk).exists():
+            raise NotFound()
+        return Response({"book": pk, "results": books})
+
+    @action(detail=False)
+    def changes(self, request):
+        """
+        Books changed after ``?since=<token>``, for clients keeping a copy.
+
+        Start with ``since=0``. Every page has the changed books as they are
+        now, the ids of deleted books, the ``token`` for the next request and
+        whether ``more`` changes are waiting. A token older than the
+        compacted log gets 410 with ``resync``: download ``/book/`` again and
+        continue from the ``token`` of that answer.
+        """
+        since = request.query_params.get("since", "")
+        if not since.isdigit():
+            raise ValidationError({"since": ["Expected a token or 0."]})
+        limit = self.get_limit(
+            self.changes_page_size, settings.BOOKS_CHANGES_MAX_PAGE_SIZE
+        )
+        if int(since) < get_horizon():
+            return Response(
+                {
+                    "detail": "The token is too old, download the books again.",
+                    "resync": True,
+                    "token": str(get_head_token()),
+                },
+                status=status.HTTP_410_GONE,
+            )
+
+        token, changed, deleted, more = read_changes(int(since), limit)
+        books = self.serialize_books(
+            self.get_queryset().filter(pk__in=changed).order_by("id")
+        )
+        return Response(
+            {"token": str(token), "more": more, "results": books, "deleted": deleted}
+        )
+
+    def get_limit(self, default, maximum):
+        try:
+            limit = int(self.request.query_params.get("limit", default))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= maximum:
+            raise ValidationError(
+                {"limit": [f"Expected a number from 1 to {maximum}."]}
+            )
+        return limit
+
+    def serialize_books(self, queryset, *extra_columns):
+        """
+        Books of a sliced queryset, plus the given annotations as they are.
+        """
+        row_serializer = self.get_row_serializer()
+        if row_serializer is None:
+            books = list(queryset)
+            data = self.get_serializer(books, many=True).data
+            for book, item in zip(books, data):
+                item.update((column, getattr(book, column)) for column in extra_columns)
+            return data
+        with timed("serialize"):
+            return [
+                {
+                    **row_serializer.to_representation(row),
+                    **{c: row[c] for c in extra_columns},
+                }
+                for row in queryset.values(*row_serializer.columns, *extra_columns)
+            ]
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        url_name="import",
+        permission_classes=[IsAuthenticated],
+    )
+    def import_books(self, request):
+        """
+        Create books from a CSV (with a header line) or NDJSON request body.
+
+        The type comes from ``?type=`` or the Content-Type. The body is read
+        as it arrives, rows are validated like ``create`` and inserted in
+        ``BOOKS_IMPORT_BATCH_SIZE`` batches, owned by the requesting user.
+        Invalid rows are reported and skipped.
+        """
+        import_type = request.query_params.get("type") or self.import_content_types.get(
+            request.content_type.split(";")[0].strip()
+        )
+        if import_type not in READERS:
+            raise ValidationError({"type": [f"Expected one of: {', '.join(READERS)}."]})
+        importer = BookImporter(
+            owner=request.user, batch_size=settings.BOOKS_IMPORT_BATCH_SIZE
+        )
+        # The raw request, DRF parsers would read the whole body first.
+        rows = READERS[import_type](decode_lines(request._request))
+        return Response(importer.import_rows(rows).as_dict())
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="delete",
+        url_name="bulk-delete",
+        permission_classes=[IsAuthenticated, IsOwnerOrStaffOrReadOnly],
+    )
+    def bulk_delete(self, request):
+        """
+        Delete the books of ``{"ids": [...]}`` the user may delete.
+
+        Object permissions are applied as one filter instead of a check per
+        book. Ids of other owners' books and of missing books are reported.
+        """
+        serializer = BookIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data["ids"])
+        queryset = Book.objects.filter(pk__in=ids)
+        permitted = set(
+            filter_permitted(request, self, queryset).values_list("id", flat=True)
+        )
+        existing = permitted
+        if len(permitted) < len(ids):
+            existing = set(queryset.values_list("id", flat=True))
+        Book.objects.filter(pk__in=permitted).delete()
+        return Response(
+            {
+                "deleted": sorted(permitted),
+                "forbidden": sorted(existing - permitted),
+                "not_found": sorted(ids - existing),
+            }
+        )
 
     def perform_create(self, serializer):
         serializer.validated_data["owner"] = self.request.user
@@ -39,12 +360,185 @@ class UserBookRelationView(UpdateModelMixin, GenericViewSet):
     queryset = UserBookRelation.objects.all()
     serializer_class = UserBookRelationSerializer
     lookup_field = "book"
+    bulk_max_items = 1000
 
-    def get_object(self):
-        obj, _ = UserBookRelation.objects.get_or_create(
-            user=self.request.user, book_id=self.kwargs["book"]
+    def update(self, request, *args, **kwargs):
+        serializer = self.get_serializer(
+            data=request.data, partial=kwargs.pop("partial", False)
         )
-        return obj
+        serializer.is_valid(raise_exception=True)
+        changes = dict(serializer.validated_data)
+        changes.pop("book", None)
+        try:
+            book_id = int(self.kwargs["book"])
+        except ValueError:
+            raise NotFound()
+        if relation_buffer.accepts(changes):
+            # Unknown books are only dropped on flush, the book isn't checked.
+            pending = relation_buffer.add(request.user.pk, book_id, changes)
+            return Response(
+                {"book": book_id, **pending}, status=status.HTTP_202_ACCEPTED
+            )
+        changes = {**relation_buffer.take(request.user.pk, book_id), **changes}
+        relation = upsert_relation(request.user, book_id, changes)
+        if relation is None:
+            raise NotFound()
+        return Response(self.get_serializer(relation).data)
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Update relations with many books, e.g. ``[{"book": 1, "like": true}]``.
+
+        Every item gets its own result, invalid items don't stop the others.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError({"non_field_errors": ["Expected a list of items."]})
+        if len(request.data) > self.bulk_max_items:
+            raise ValidationError(
+                {"non_field_errors": [f"At most {self.bulk_max_items} items."]}
+            )
+
+        results = []
+        changes_by_book = {}
+        for item in request.data:
+            serializer = UserBookRelationBulkItemSerializer(data=item)
+            if not serializer.is_valid():
+                results.append(
+                    {"status": status.HTTP_400_BAD_REQUEST, "errors": serializer.errors}
+                )
+                continue
+            changes = dict(serializer.validated_data)
+            book_id = changes.pop("book")
+            if book_id not in changes_by_book:
+                changes_by_book[book_id] = relation_buffer.take(
+                    request.user.pk, book_id
+                )
+            # Later items for the same book win, like consecutive PATCHes.
+            changes_by_book[book_id].update(changes)
+            results.append(book_id)
+
+        relations = upsert_relations(request.user, changes_by_book)
+        for index, result in enumerate(results):
+            if isinstance(result, dict):
+                continue
+            if result not in relations:
+                results[index] = {
+                    "status": status.HTTP_404_NOT_FOUND,
+                    "errors": {"book": [f"Book {result} does not exist."]},
+                }
+                continue
+            results[index] = {
+                "status": status.HTTP_200_OK,
+                "data": UserBookRelationSerializer(relations[result]).data,
+            }
+        return Response({"results": results})
+
+
+class TokenObtainView(APIView):
+    """
+    Access and refresh tokens for the logged-in user, see
+    ``store.authentication``. Tokens can't be traded for more tokens here.
+    """
+
+    authentication_classes = [SessionAuthentication, BasicAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        return Response(issue_tokens(request.user))
+
+
+class TokenRefreshView(APIView):
+    """
+    A new token pair for ``{"refresh": ...}``, the old refresh token is
+    revoked. The user is read again, so deactivated users are cut off here.
+    Of concurrent refreshes with the same token only one succeeds.
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        payload = decode_token(serializer.validated_data["refresh"], "refresh")
+        user = User.objects.filter(pk=payload["sub"], is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed("User not found.")
+        with transaction.atomic():
+            if not revoke_token(payload):
+                raise AuthenticationFailed("Token has been revoked.")
+        return Response(issue_tokens(user))
+
+
+class TokenRevokeView(APIView):
+    """
+    Revoke ``{"refresh": ...}`` and the access token the request carries.
+    """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        payload = decode_token(serializer.validated_data["refresh"], "refresh")
+        with transaction.atomic():
+            revoke_token(payload)
+            if request.auth is not None:
+                revoke_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TimingStatsView(APIView):
+    """
+    Per-route latency stats collected by ``TimingMiddleware``.
+
+    ``DELETE`` starts a new window.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(route_stats.as_dict())
+
+    def delete(self, request):
+        route_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ResponseCacheStatsView(APIView):
+    """
+    Hits and misses of the book response cache in this process.
+
+    ``DELETE`` resets the counters.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(response_cache_stats.as_dict())
+
+    def delete(self, request):
+        response_cache_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class RelationBufferStatsView(APIView):
+    """
+    Depth, coalescing and flush latency of the relation write buffer.
+
+    ``DELETE`` resets the counters.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(relation_buffer.as_dict())
+
+    def delete(self, request):
+        relation_buffer.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 def auth(request):